@@ -33,22 +33,128 @@ class Config:
     RABBITMQ_EXCHANGE = os.environ.get('RABBITMQ_EXCHANGE', 'risk.assessment.exchange')
     RABBITMQ_QUEUE = os.environ.get('RABBITMQ_QUEUE', 'risk.assessment.queue')
     RABBITMQ_ROUTING_KEY = os.environ.get('RABBITMQ_ROUTING_KEY', 'risk.assessment')
+    
+    # 消费者流水线：pika I/O线程只负责收消息和确认，解码后的批次经有界队列交给推理工作线程
+    CONSUMER_INFERENCE_WORKERS = int(os.environ.get('CONSUMER_INFERENCE_WORKERS', 2))  # 推理工作线程数，0表示在I/O线程中直接处理
+    CONSUMER_WORK_QUEUE_SIZE = int(os.environ.get('CONSUMER_WORK_QUEUE_SIZE', 8))  # 等待推理的批次数上限（不小于预取数/批大小），满时批次留在I/O线程中下次定时器再提交
+    RABBITMQ_PREFETCH_COUNT = int(os.environ.get('RABBITMQ_PREFETCH_COUNT', 50))  # 每个消费者连接的预取数量
+    
+    # 多进程消费者：加载模型后fork出多个消费者进程，各自持有AMQP连接，模型内存页写时复制共享
+    CONSUMER_PROCESSES = os.environ.get('CONSUMER_PROCESSES', '1')  # 消费者进程数，1为在Web进程内消费，auto为CPU核数
+    CONSUMER_STATUS_INTERVAL = float(os.environ.get('CONSUMER_STATUS_INTERVAL', 5))  # 子进程上报状态的间隔（秒）
+    CONSUMER_RESTART_DELAY = float(os.environ.get('CONSUMER_RESTART_DELAY', 1))  # 子进程退出后首次重启的等待时间（秒），连续崩溃时翻倍
 
     # Redis配置
     REDIS_HOST = os.environ.get('REDIS_HOST', 'host.docker.internal')
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6380))
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
     REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', None)
+    REDIS_PROTOCOL = int(os.environ.get('REDIS_PROTOCOL', 2))  # 2 (RESP2) or 3 (RESP3, 需要redis-py 5.0+)
+    # Redis连接池配置（进程内所有Redis客户端共享）
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))  # 连接池耗尽时等待空闲连接的时间（秒）
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 5))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))  # 秒
+    
+    # 向量检索配置
+    VECTOR_SEARCH_BACKEND = os.environ.get('VECTOR_SEARCH_BACKEND', 'redis').lower()  # redis, memory or two_stage
+    VECTOR_INDEX_NAME = os.environ.get('VECTOR_INDEX_NAME', 'entity_vectors')
+    VECTOR_KEY_PREFIX = os.environ.get('VECTOR_KEY_PREFIX', 'entity:')
+    VECTOR_MEMORY_EXACT_THRESHOLD = int(os.environ.get('VECTOR_MEMORY_EXACT_THRESHOLD', 50000))  # 超过该实体数使用IVF分区检索
+    VECTOR_MEMORY_NPROBE = int(os.environ.get('VECTOR_MEMORY_NPROBE', 8))
+    # Redis中实体向量的存储类型，需与索引的TYPE一致（FLOAT16约为FLOAT32内存的一半）
+    VECTOR_STORAGE_DTYPE = os.environ.get('VECTOR_STORAGE_DTYPE', 'FLOAT32').upper()  # FLOAT32 or FLOAT16
+    VECTOR_MEMORY_QUANTIZATION = os.environ.get('VECTOR_MEMORY_QUANTIZATION', 'none').lower()  # none, float16 or int8
+    VECTOR_MEMORY_RELOAD_SECONDS = float(os.environ.get('VECTOR_MEMORY_RELOAD_SECONDS', 600))  # memory/two_stage后端从Redis重新加载的间隔（秒），0表示只使用启动时的快照
+    # 向量索引分片：逗号分隔的host:port，为空时使用REDIS_HOST上的单个索引；实体按entity_id一致性哈希分布
+    VECTOR_INDEX_SHARDS = [shard.strip() for shard in os.environ.get('VECTOR_INDEX_SHARDS', '').split(',') if shard.strip()]
+    VECTOR_SHARD_VNODES = int(os.environ.get('VECTOR_SHARD_VNODES', 160))  # 一致性哈希每个分片的虚拟节点数
+    # RediSearch后端的本地标签表：KNN只返回距离，标签在进程内查表
+    LABEL_STORE_ENABLED = os.environ.get('LABEL_STORE_ENABLED', 'false').lower() == 'true'
+    LABEL_STORE_KEYSPACE_EVENTS = os.environ.get('LABEL_STORE_KEYSPACE_EVENTS', 'true').lower() == 'true'  # 订阅实体键的键空间通知（需notify-keyspace-events包含Kgh）
+    LABEL_UPDATE_CHANNEL = os.environ.get('LABEL_UPDATE_CHANNEL', 'entity_label_updates')  # 标签更新频道，为空时不订阅
+    LABEL_STORE_REFRESH_SECONDS = int(os.environ.get('LABEL_STORE_REFRESH_SECONDS', 3600))  # 全量重新加载间隔（秒）
+    # 评分后的实体向量异步回写到索引（write-behind）
+    VECTOR_WRITE_BACK_ENABLED = os.environ.get('VECTOR_WRITE_BACK_ENABLED', 'false').lower() == 'true'
+    VECTOR_WRITE_BACK_QUEUE_SIZE = int(os.environ.get('VECTOR_WRITE_BACK_QUEUE_SIZE', 10000))  # 回写队列容量，满时丢弃
+    VECTOR_WRITE_BACK_FLUSH_INTERVAL = float(os.environ.get('VECTOR_WRITE_BACK_FLUSH_INTERVAL', 1.0))  # 最长聚合时间（秒）
+    VECTOR_WRITE_BACK_MAX_BATCH = int(os.environ.get('VECTOR_WRITE_BACK_MAX_BATCH', 500))  # 每批最多写入的实体数
+    # 两阶段检索（VECTOR_SEARCH_BACKEND=two_stage）：PCA低维粗筛 + 128维余弦精排
+    VECTOR_PCA_DIM = int(os.environ.get('VECTOR_PCA_DIM', 32))  # 投影维度，对应编码器目录下的encoder_35_to_128_pca{dim}.npz
+    VECTOR_PCA_PATH = os.environ.get('VECTOR_PCA_PATH') or None  # 指定投影文件路径时忽略VECTOR_PCA_DIM
+    VECTOR_PCA_CANDIDATES = int(os.environ.get('VECTOR_PCA_CANDIDATES', 100))  # 第一阶段候选数k'
+    VECTOR_PCA_RERANK_SOURCE = os.environ.get('VECTOR_PCA_RERANK_SOURCE', 'memory').lower()  # memory or redis
+    
+    # 编码器推理配置
+    ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'fused').lower()  # fused (纯NumPy，标准化折叠进第一层) or torch
+    ENCODER_FUSED_ATOL = float(os.environ.get('ENCODER_FUSED_ATOL', 1e-4))  # 融合编码器与torch输出允许的最大绝对误差
+    
+    # KNN查询规划配置（按延迟预算和队列负载选择k和EF_RUNTIME）
+    KNN_PLANNER_ENABLED = os.environ.get('KNN_PLANNER_ENABLED', 'false').lower() == 'true'
+    KNN_LATENCY_BUDGET_MS = float(os.environ.get('KNN_LATENCY_BUDGET_MS', 50))  # 单次请求（整个批次）的检索延迟预算
+    # EF_RUNTIME档位，只对HNSW索引生效（后端启动时通过FT.INFO检测索引算法）
+    KNN_EF_LEVELS = [int(ef) for ef in os.environ.get('KNN_EF_LEVELS', '10,20,40,80,160').split(',') if ef.strip()]
+    KNN_MIN_K = int(os.environ.get('KNN_MIN_K', 10))  # 满负载时的k，小于10会改变评分语义
+    KNN_MAX_K = int(os.environ.get('KNN_MAX_K', 10))
+    KNN_BUSY_QUEUE_DEPTH = int(os.environ.get('KNN_BUSY_QUEUE_DEPTH', 64))  # 待处理消息数达到该值视为满负载
+    # 按消息中的businessType/tenant预过滤KNN候选集，需先用index_builder写入过滤属性并重建索引
+    KNN_PREFILTER_ENABLED = os.environ.get('KNN_PREFILTER_ENABLED', 'false').lower() == 'true'
+    
+    # 向量检索超时与熔断配置
+    SEARCH_DEADLINE_MS = float(os.environ.get('SEARCH_DEADLINE_MS', 0))  # 每个批次相似度查询的截止时间，0表示不限制（超时的批次返回DEGRADED，按批次大小评估后再开启）
+    SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', 4))  # 执行带截止时间查询的线程数
+    SEARCH_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('SEARCH_BREAKER_FAILURE_THRESHOLD', 5))  # 连续超时/失败次数达到该值后熔断
+    SEARCH_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('SEARCH_BREAKER_COOLDOWN_SECONDS', 30))
+    SEARCH_PARTIAL_SHARD_FAILURE_RATIO = float(os.environ.get('SEARCH_PARTIAL_SHARD_FAILURE_RATIO', 0.5))  # 缺失分片比例超过该值时计为一次熔断失败
+    SEARCH_FALLBACK = os.environ.get('SEARCH_FALLBACK', 'degraded').lower()  # local_index, last_score or degraded
+    SEARCH_FALLBACK_REFRESH_SECONDS = float(os.environ.get('SEARCH_FALLBACK_REFRESH_SECONDS', 600))  # local_index降级索引的刷新间隔，0表示只加载一次
+    SEARCH_LAST_SCORE_SIZE = int(os.environ.get('SEARCH_LAST_SCORE_SIZE', 100000))  # last_score降级保留的实体数
+    
+    # 风险检测结果配置
+    RESULT_PROFILE = os.environ.get('RESULT_PROFILE', 'full').lower()  # minimal, standard or full
+    RESULT_VECTOR_ENCODING = os.environ.get('RESULT_VECTOR_ENCODING', 'list').lower()  # list, base64_f16 or base64_f32
+    RESULT_MINIMAL_TOP_N = int(os.environ.get('RESULT_MINIMAL_TOP_N', 3))
+    
+    # 嵌入与近邻缓存配置（以35维输入向量哈希、模型版本、k/EF_RUNTIME和索引版本号为键，回写或标签变化后失效）
+    EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'false').lower() == 'true'  # 命中时近邻结果最多滞后TTL秒，需显式开启
+    EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 10000))
+    EMBEDDING_CACHE_TTL = int(os.environ.get('EMBEDDING_CACHE_TTL', 300))  # 进程内缓存过期时间（秒）
+    EMBEDDING_CACHE_REDIS_ENABLED = os.environ.get('EMBEDDING_CACHE_REDIS_ENABLED', 'false').lower() == 'true'  # 跨进程共享的Redis缓存
+    EMBEDDING_CACHE_GENERATION_REFRESH = float(os.environ.get('EMBEDDING_CACHE_GENERATION_REFRESH', 1.0))  # 读取Redis共享索引版本号（emb_cache:generation）的间隔（秒）
+    EMBEDDING_CACHE_REDIS_TTL = int(os.environ.get('EMBEDDING_CACHE_REDIS_TTL', 3600))  # Redis缓存过期时间（秒）
+    # 近重复向量的近邻结果缓存（LSH随机超平面签名）
+    NEAR_DUP_CACHE_ENABLED = os.environ.get('NEAR_DUP_CACHE_ENABLED', 'false').lower() == 'true'
+    NEAR_DUP_CACHE_BITS = int(os.environ.get('NEAR_DUP_CACHE_BITS', 16))  # 签名位数（随机超平面个数）
+    NEAR_DUP_CACHE_TOLERANCE = float(os.environ.get('NEAR_DUP_CACHE_TOLERANCE', 0.02))  # 复用结果的最大余弦距离
+    NEAR_DUP_CACHE_SIZE = int(os.environ.get('NEAR_DUP_CACHE_SIZE', 10000))  # 最多保留的桶数
+    NEAR_DUP_CACHE_BUCKET_SIZE = int(os.environ.get('NEAR_DUP_CACHE_BUCKET_SIZE', 4))  # 每个桶最多保留的向量数
+    NEAR_DUP_CACHE_TTL = int(os.environ.get('NEAR_DUP_CACHE_TTL', 300))  # 过期时间（秒）
+    NEAR_DUP_CACHE_VERIFY_RATE = float(os.environ.get('NEAR_DUP_CACHE_VERIFY_RATE', 0.01))  # 命中后仍查询以校验误差的抽样比例
     
     # 回调配置
     CALLBACK_URL = 'http://localhost:8081/async-risk-assessment/result'
     
     # 重试配置
-    CALLBACK_MAX_RETRIES = 3
-    CALLBACK_RETRY_DELAY = 2  # 秒
+    CALLBACK_MAX_RETRIES = int(os.environ.get('CALLBACK_MAX_RETRIES', 3))
+    CALLBACK_RETRY_DELAY = float(os.environ.get('CALLBACK_RETRY_DELAY', 2))  # 秒，首次重试的等待时间，之后指数退避
+    
+    # 回调投递：固定工作线程 + keep-alive会话 + 有界队列
+    CALLBACK_WORKERS = int(os.environ.get('CALLBACK_WORKERS', 8))  # 工作线程数，即到回调服务的最大连接数
+    CALLBACK_QUEUE_SIZE = int(os.environ.get('CALLBACK_QUEUE_SIZE', 10000))  # 待投递队列容量
+    CALLBACK_OVERFLOW_POLICY = os.environ.get('CALLBACK_OVERFLOW_POLICY', 'block').lower()  # block, drop_newest or drop_oldest
+    CALLBACK_BLOCK_TIMEOUT = float(os.environ.get('CALLBACK_BLOCK_TIMEOUT', 1.0))  # block策略下最长等待时间（秒）
+    CALLBACK_TIMEOUT = float(os.environ.get('CALLBACK_TIMEOUT', 30))  # 单次HTTP请求超时（秒）
+    
+    # 批量回调：按条数和等待时间聚合结果，以数组POST到批量接口
+    CALLBACK_BATCH_ENABLED = os.environ.get('CALLBACK_BATCH_ENABLED', 'false').lower() == 'true'
+    CALLBACK_BATCH_URL = os.environ.get('CALLBACK_BATCH_URL', 'http://localhost:8081/async-risk-assessment/results')
+    CALLBACK_BATCH_SIZE = int(os.environ.get('CALLBACK_BATCH_SIZE', 100))  # 每批最多结果数
+    CALLBACK_BATCH_LINGER_MS = float(os.environ.get('CALLBACK_BATCH_LINGER_MS', 50))  # 等待凑批的最长时间（毫秒）
     
-    # 即使回调失败也确认消息（避免消息堆积）
-    ACK_ON_CALLBACK_FAILURE = True
+    # 即使回调失败也确认消息（避免消息堆积）：为true时结果进入投递队列即确认；
+    # 为false时投递完成后才确认，投递失败的消息重新入队，已重新投递过的消息拒绝（进入死信队列）
+    ACK_ON_CALLBACK_FAILURE = os.environ.get('ACK_ON_CALLBACK_FAILURE', 'false').lower() == 'true'
     
     # API网关配置
     API_GATEWAY_SCHEME = os.environ.get('API_GATEWAY_SCHEME', 'http') # http or https
@@ -0,0 +1,153 @@
+import time
+import logging
+import threading
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed: 正常放行，连续失败达到failure_threshold次后熔断（trip）进入open
+    - open: 直接拒绝调用（调用方走降级逻辑），cooldown_seconds后进入half_open
+    - half_open: 只放行half_open_max_calls个探测调用，探测成功恢复closed，失败重新open
+
+    线程安全，FraudDetectionCore在消费者线程和FastAPI线程池中共享同一实例。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown_seconds: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        Args:
+            name: 熔断器名称（用于日志和状态）
+            failure_threshold: 触发熔断的连续失败次数
+            cooldown_seconds: 熔断后的冷却时间（秒）
+            half_open_max_calls: 半开状态下允许同时进行的探测调用数
+        """
+        self.name = name
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.half_open_max_calls = max(int(half_open_max_calls), 1)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._half_open_calls = 0
+        self._last_failure = None
+        self._stats = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'rejected': 0,
+            'trips': 0
+        }
+        # 失败原因 -> 次数（如timeout、error）
+        self._failure_reasons = {}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        判断是否放行本次调用，放行后必须调用record_success或record_failure
+
+        Returns:
+            False表示熔断中，调用方应直接走降级逻辑
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.OPEN:
+                self._stats['rejected'] += 1
+                return False
+            if self._state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._stats['rejected'] += 1
+                    return False
+                self._half_open_calls += 1
+            self._stats['calls'] += 1
+            return True
+
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._lock:
+            self._stats['successes'] += 1
+            self._consecutive_failures = 0
+            if self._state == self.HALF_OPEN:
+                self._half_open_calls = max(self._half_open_calls - 1, 0)
+                self._state = self.CLOSED
+                self._opened_at = None
+                logger.info(f"熔断器[{self.name}]探测成功，恢复正常")
+
+    def record_failure(self, reason: str = 'error'):
+        """
+        记录一次失败调用
+
+        Args:
+            reason: 失败原因，按原因分别计数
+        """
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failure_reasons[reason] = self._failure_reasons.get(reason, 0) + 1
+            self._consecutive_failures += 1
+            self._last_failure = {'reason': reason, 'time': time.time()}
+
+            if self._state == self.HALF_OPEN:
+                self._half_open_calls = max(self._half_open_calls - 1, 0)
+                self._trip(f"半开探测失败({reason})")
+            elif self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._trip(f"连续失败{self._consecutive_failures}次({reason})")
+
+    def reset(self):
+        """手动恢复为closed状态"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._half_open_calls = 0
+
+    def get_stats(self) -> Dict:
+        """获取熔断器状态和计数"""
+        with self._lock:
+            self._refresh_state()
+            stats = dict(self._stats)
+            stats.update({
+                'name': self.name,
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_reasons': dict(self._failure_reasons),
+                'last_failure': dict(self._last_failure) if self._last_failure else None,
+                'open_remaining_seconds': round(self._open_remaining(), 3) if self._state == self.OPEN else 0.0,
+                'failure_threshold': self.failure_threshold,
+                'cooldown_seconds': self.cooldown_seconds
+            })
+        return stats
+
+    def _trip(self, reason: str):
+        """进入open状态（调用方持有锁）"""
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._stats['trips'] += 1
+        logger.warning(f"熔断器[{self.name}]熔断: {reason}，{self.cooldown_seconds}秒内直接降级")
+
+    def _refresh_state(self):
+        """冷却时间结束后从open进入half_open（调用方持有锁）"""
+        if self._state == self.OPEN and self._open_remaining() <= 0:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"熔断器[{self.name}]冷却结束，进入半开状态")
+
+    def _open_remaining(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(self.cooldown_seconds - (time.monotonic() - self._opened_at), 0.0)
@@ -0,0 +1,282 @@
+import numpy as np
+import hashlib
+import logging
+import threading
+import base64
+import json
+import time
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 缓存条目: (128维向量, 相似实体列表)
+CacheEntry = Tuple[np.ndarray, List[Dict]]
+
+# Redis缓存键前缀，共享索引版本号保存在 {前缀}generation
+DEFAULT_KEY_PREFIX = 'emb_cache:'
+
+
+def generation_key(key_prefix: str = DEFAULT_KEY_PREFIX) -> str:
+    """共享索引版本号的Redis键，离线重建索引等外部写入方INCR该键使各进程的近邻缓存失效"""
+    return key_prefix + 'generation'
+
+
+class EmbeddingCache:
+    """
+    两级嵌入与近邻缓存
+
+    以35维输入向量和模型版本的稳定哈希为键，缓存128维编码向量和相似实体列表：
+    - 一级：进程内LRU，限制条目数并带TTL
+    - 二级：Redis共享缓存（可选），键中包含模型版本，不同进程/实例之间共享
+
+    编码器重新加载（模型版本变化）时一级缓存整体清空，二级缓存因键前缀变化自然失效。
+    索引写入新实体或标签变化时调用bump_generation()，键中的版本号随之变化，之前的近邻结果不再命中；
+    指定generation_client（默认与二级缓存相同）时版本号保存在Redis中由各进程和离线构建工具共享，
+    其他写入方的变更最多延迟generation_refresh秒生效；只用进程内缓存时也应指定，否则外部写入不会使缓存失效。
+    """
+
+    def __init__(self, redis_client=None, max_size: int = 10000, ttl: float = 300,
+                 redis_ttl: int = 3600, key_prefix: str = DEFAULT_KEY_PREFIX, generation_refresh: float = 1.0,
+                 generation_client=None):
+        """
+        Args:
+            redis_client: 不解码响应的Redis客户端，为None时只使用进程内缓存
+            max_size: 进程内缓存最大条目数
+            ttl: 进程内缓存过期时间（秒）
+            redis_ttl: Redis缓存过期时间（秒）
+            key_prefix: Redis缓存键前缀
+            generation_refresh: 从Redis读取共享版本号的间隔（秒）
+            generation_client: 保存共享版本号的Redis客户端，为None时使用redis_client，两者都为None时版本号只在本进程有效
+        """
+        self.redis_client = redis_client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.key_prefix = key_prefix
+        self.generation_refresh = float(generation_refresh)
+        self.generation_client = generation_client if generation_client is not None else redis_client
+
+        self._lock = threading.Lock()
+        self._local = OrderedDict()  # key -> (expire_at, entry)
+        self._model_version = None
+        self._generation = 0
+        self._generation_checked_at = None
+
+        self._stats = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'generation_bumps': 0,
+            'redis_errors': 0
+        }
+
+    @staticmethod
+    def make_key(vector_35d: np.ndarray, model_version: str, scope: Optional[str] = None,
+                 generation: int = 0) -> str:
+        """
+        计算缓存键：模型版本 + 索引版本号 + float32小端字节（和作用域）的SHA1
+
+        Args:
+            vector_35d: 35维输入向量
+            model_version: 编码器模型版本
+            scope: 近邻结果的作用域（KNN预过滤条件和k、EF_RUNTIME等查询参数）
+            generation: 查询缓存前由current_generation()取得的索引版本号
+
+        Returns:
+            缓存键
+        """
+        data = np.ascontiguousarray(np.asarray(vector_35d, dtype='<f4'))
+        hasher = hashlib.sha1(data.tobytes())
+        if scope:
+            hasher.update(b'\x00' + scope.encode('utf-8'))
+        return f"{model_version}:{generation}:{hasher.hexdigest()}"
+
+    def current_generation(self) -> int:
+        """
+        当前的索引版本号
+
+        有generation_client时按generation_refresh间隔从Redis读取共享版本号，读取失败时沿用本地值。
+        """
+        if self.generation_client is None:
+            return self._generation
+
+        now = time.monotonic()
+        checked_at = self._generation_checked_at
+        if checked_at is None or now - checked_at >= self.generation_refresh:
+            self._generation_checked_at = now
+            try:
+                value = self.generation_client.get(generation_key(self.key_prefix))
+                self._advance_generation(int(value or 0))
+            except Exception as e:
+                with self._lock:
+                    self._stats['redis_errors'] += 1
+                logger.warning(f"读取嵌入缓存版本号失败: {e}")
+        return self._generation
+
+    def bump_generation(self):
+        """索引写入新实体或标签变化后调用，之前缓存的近邻结果不再命中"""
+        shared = 0
+        if self.generation_client is not None:
+            try:
+                shared = int(self.generation_client.incr(generation_key(self.key_prefix)))
+            except Exception as e:
+                with self._lock:
+                    self._stats['redis_errors'] += 1
+                logger.warning(f"更新嵌入缓存版本号失败: {e}")
+        self._advance_generation(max(self._generation + 1, shared))
+
+    def _advance_generation(self, generation: int):
+        """版本号只增不减；旧版本的本地条目已不会被查到，直接清空释放内存"""
+        with self._lock:
+            if generation <= self._generation:
+                return
+            self._generation = generation
+            self._local.clear()
+            self._stats['generation_bumps'] += 1
+
+    def get(self, key: str, model_version: str) -> Optional[CacheEntry]:
+        """查询单个缓存条目，未命中返回None"""
+        return self.get_many([key], model_version)[0]
+
+    def get_many(self, keys: List[str], model_version: str) -> List[Optional[CacheEntry]]:
+        """
+        批量查询缓存，先查进程内缓存，未命中的键通过一次MGET查询Redis
+
+        Args:
+            keys: 缓存键列表
+            model_version: 当前编码器模型版本
+
+        Returns:
+            与输入顺序一致的缓存条目列表，未命中位置为None
+        """
+        self._check_version(model_version)
+
+        results = [None] * len(keys)
+        missing = []
+        now = time.monotonic()
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                item = self._local.get(key)
+                if item is not None and item[0] > now:
+                    self._local.move_to_end(key)
+                    results[i] = item[1]
+                    self._stats['local_hits'] += 1
+                else:
+                    if item is not None:
+                        del self._local[key]
+                    missing.append(i)
+
+        if missing and self.redis_client is not None:
+            try:
+                values = self.redis_client.mget([self.key_prefix + keys[i] for i in missing])
+                still_missing = []
+                for i, value in zip(missing, values):
+                    entry = self._deserialize(value) if value is not None else None
+                    if entry is None:
+                        still_missing.append(i)
+                        continue
+                    results[i] = entry
+                    self._put_local(keys[i], entry)
+                    with self._lock:
+                        self._stats['redis_hits'] += 1
+                missing = still_missing
+            except Exception as e:
+                with self._lock:
+                    self._stats['redis_errors'] += 1
+                logger.warning(f"查询Redis嵌入缓存失败: {e}")
+
+        with self._lock:
+            self._stats['misses'] += len(missing)
+
+        return results
+
+    def put(self, key: str, vector_128d: np.ndarray, similar_entities: List[Dict]):
+        """写入单个缓存条目"""
+        self.put_many([(key, vector_128d, similar_entities)])
+
+    def put_many(self, items: List[Tuple[str, np.ndarray, List[Dict]]]):
+        """
+        批量写入缓存，Redis写入通过一次管道完成
+
+        Args:
+            items: (缓存键, 128维向量, 相似实体列表) 列表
+        """
+        if not items:
+            return
+
+        for key, vector_128d, similar_entities in items:
+            self._put_local(key, (np.asarray(vector_128d, dtype=np.float32), similar_entities))
+
+        if self.redis_client is None:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, vector_128d, similar_entities in items:
+                pipe.set(self.key_prefix + key, self._serialize(vector_128d, similar_entities), ex=self.redis_ttl)
+            pipe.execute()
+        except Exception as e:
+            with self._lock:
+                self._stats['redis_errors'] += 1
+            logger.warning(f"写入Redis嵌入缓存失败: {e}")
+
+    def invalidate(self):
+        """清空进程内缓存"""
+        with self._lock:
+            self._local.clear()
+            self._stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_size'] = len(self._local)
+        lookups = stats['local_hits'] + stats['redis_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['local_hits'] + stats['redis_hits']) / lookups if lookups else 0.0
+        stats['model_version'] = self._model_version
+        stats['generation'] = self._generation
+        stats['redis_enabled'] = self.redis_client is not None
+        return stats
+
+    def _check_version(self, model_version: str):
+        """模型版本变化时清空进程内缓存"""
+        if model_version == self._model_version:
+            return
+        with self._lock:
+            if model_version != self._model_version:
+                if self._model_version is not None:
+                    logger.info(f"编码器模型版本变化({self._model_version} -> {model_version})，清空嵌入缓存")
+                    self._stats['invalidations'] += 1
+                self._local.clear()
+                self._model_version = model_version
+
+    def _put_local(self, key: str, entry: CacheEntry):
+        """写入进程内LRU，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, entry)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _serialize(self, vector_128d: np.ndarray, similar_entities: List[Dict]) -> str:
+        """序列化为JSON，向量以base64编码的float32存储"""
+        return json.dumps({
+            'v': base64.b64encode(np.asarray(vector_128d, dtype='<f4').tobytes()).decode('ascii'),
+            'n': similar_entities
+        })
+
+    def _deserialize(self, value) -> Optional[CacheEntry]:
+        """反序列化Redis缓存值，格式错误时视为未命中"""
+        try:
+            data = json.loads(value)
+            vector_128d = np.frombuffer(base64.b64decode(data['v']), dtype='<f4').astype(np.float32)
+            return vector_128d, data['n']
+        except Exception as e:
+            logger.warning(f"解析Redis嵌入缓存失败: {e}")
+            return None
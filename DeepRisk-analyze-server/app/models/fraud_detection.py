@@ -1,26 +1,54 @@
 import numpy as np
-import torch
-import redis
 import logging
 import os
-from typing import List, Dict, Tuple, Union
-from app.models.model_loader import get_encoder
+import asyncio
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Tuple, Union, Optional
+from app.config import Config
+from app.redis_pool import get_redis_client, get_async_redis_client
+from app.models.model_loader import encode_vectors, get_model_version
+from app.models.vector_search import VectorSearchBackend, RediSearchBackend, SearchFilter, create_search_backend
+from app.models.embedding_cache import EmbeddingCache
+from app.models.vector_encoding import encode_vector, decode_vector
+from app.models.near_duplicate_cache import NearDuplicateCache
+from app.models.vector_index_writer import VectorIndexWriter
+from app.models.label_store import LabelStore
+from app.models.query_planner import KnnQueryPlanner
+from app.models.circuit_breaker import CircuitBreaker
+from app.models.sharded_search import ShardedSearchBackend, create_sharded_backend
+from app.models.two_stage_search import create_two_stage_backend
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# 结果配置：minimal < standard < full
+RESULT_PROFILES = ('minimal', 'standard', 'full')
+
+# 相似度查询超时或熔断时的降级方式
+SEARCH_FALLBACKS = ('local_index', 'last_score', 'degraded')
+
 class FraudDetectionCore:
     """风险检测核心模块"""
     
-    def __init__(self, redis_host=None, redis_port=None):
+    def __init__(self, redis_host=None, redis_port=None, search_backend: VectorSearchBackend = None):
+        """
+        Args:
+            redis_host: Redis主机
+            redis_port: Redis端口
+            search_backend: 向量检索后端，为None时按Config.VECTOR_SEARCH_BACKEND创建
+        """
         redis_host = redis_host or os.environ.get('REDIS_HOST') or 'localhost'
         redis_port = redis_port or int(os.environ.get('REDIS_PORT') or 6379)
         
-        self.redis_client = redis.Redis(
+        # 使用进程级共享连接池的二进制视图
+        self.redis_client = get_redis_client(
+            decode_responses=False,
             host=redis_host,
             port=redis_port,
-            db=0,
-            decode_responses=False
+            db=0
         )
         
         try:
@@ -29,116 +57,813 @@ class FraudDetectionCore:
         except Exception as e:
             logger.error(f"Redis连接失败: {e}")
             self.redis_client = None
+        
+        backend_type = Config.VECTOR_SEARCH_BACKEND
+        # memory/two_stage后端是Redis哈希数据的内存镜像，传入的后端由调用方负责加载
+        mirrors_redis = search_backend is None and backend_type in ('memory', 'two_stage')
+        
+        # RediSearch后端的本地标签表，就绪后KNN查询只返回距离
+        self.label_store = None
+        if search_backend is None and backend_type == 'redis' and Config.LABEL_STORE_ENABLED:
+            self.label_store = self._create_label_store()
+        
+        if search_backend is None and backend_type == 'two_stage':
+            try:
+                # PCA投影粗筛 + 完整向量精排，投影版本必须与当前编码器一致
+                search_backend = create_two_stage_backend(
+                    redis_client=self.redis_client,
+                    key_prefix=Config.VECTOR_KEY_PREFIX,
+                    vector_type=Config.VECTOR_STORAGE_DTYPE,
+                    dim=Config.VECTOR_PCA_DIM,
+                    candidate_k=Config.VECTOR_PCA_CANDIDATES,
+                    rerank_source=Config.VECTOR_PCA_RERANK_SOURCE,
+                    projection_file=Config.VECTOR_PCA_PATH,
+                    model_version=get_model_version(),
+                    exact_threshold=Config.VECTOR_MEMORY_EXACT_THRESHOLD,
+                    nprobe=Config.VECTOR_MEMORY_NPROBE,
+                    quantization=Config.VECTOR_MEMORY_QUANTIZATION
+                )
+            except Exception as e:
+                logger.error(f"两阶段检索后端初始化失败，改用内存索引: {e}")
+                backend_type = 'memory'
+        
+        if search_backend is None and Config.VECTOR_INDEX_SHARDS:
+            try:
+                # 多个索引分片，查询并发发送到全部分片后归并Top-k
+                search_backend = create_sharded_backend(
+                    backend_type,
+                    Config.VECTOR_INDEX_SHARDS,
+                    index_name=Config.VECTOR_INDEX_NAME,
+                    key_prefix=Config.VECTOR_KEY_PREFIX,
+                    vector_type=Config.VECTOR_STORAGE_DTYPE,
+                    vnodes=Config.VECTOR_SHARD_VNODES,
+                    label_store=self.label_store,
+                    exact_threshold=Config.VECTOR_MEMORY_EXACT_THRESHOLD,
+                    nprobe=Config.VECTOR_MEMORY_NPROBE,
+                    quantization=Config.VECTOR_MEMORY_QUANTIZATION
+                )
+            except Exception as e:
+                logger.error(f"分片向量检索后端初始化失败: {e}")
+        elif search_backend is None:
+            try:
+                search_backend = create_search_backend(
+                    backend_type,
+                    redis_client=self.redis_client,
+                    index_name=Config.VECTOR_INDEX_NAME,
+                    key_prefix=Config.VECTOR_KEY_PREFIX,
+                    async_client_factory=lambda: get_async_redis_client(host=redis_host, port=redis_port, db=0),
+                    vector_type=Config.VECTOR_STORAGE_DTYPE,
+                    label_store=self.label_store,
+                    exact_threshold=Config.VECTOR_MEMORY_EXACT_THRESHOLD,
+                    nprobe=Config.VECTOR_MEMORY_NPROBE,
+                    quantization=Config.VECTOR_MEMORY_QUANTIZATION
+                )
+            except Exception as e:
+                logger.error(f"向量检索后端初始化失败: {e}")
+        self.search_backend = search_backend
+        
+        # 嵌入与近邻缓存，跳过重复输入的编码和检索
+        self.embedding_cache = None
+        if Config.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                redis_client=self.redis_client if Config.EMBEDDING_CACHE_REDIS_ENABLED else None,
+                max_size=Config.EMBEDDING_CACHE_SIZE,
+                ttl=Config.EMBEDDING_CACHE_TTL,
+                redis_ttl=Config.EMBEDDING_CACHE_REDIS_TTL,
+                generation_refresh=Config.EMBEDDING_CACHE_GENERATION_REFRESH,
+                # 只用进程内缓存时也读取共享版本号，离线重建索引（index_builder）后近邻结果同样失效
+                generation_client=self.redis_client
+            )
+        
+        # 近重复向量的近邻结果缓存（LSH），编码向量与近期查询过的向量足够接近时跳过相似度查询
+        self.near_duplicate_cache = None
+        if Config.NEAR_DUP_CACHE_ENABLED:
+            self.near_duplicate_cache = NearDuplicateCache(
+                num_bits=Config.NEAR_DUP_CACHE_BITS,
+                tolerance=Config.NEAR_DUP_CACHE_TOLERANCE,
+                max_buckets=Config.NEAR_DUP_CACHE_SIZE,
+                bucket_size=Config.NEAR_DUP_CACHE_BUCKET_SIZE,
+                ttl=Config.NEAR_DUP_CACHE_TTL,
+                verify_rate=Config.NEAR_DUP_CACHE_VERIFY_RATE
+            )
+        
+        # KNN查询规划器，按延迟预算和负载选择k和EF_RUNTIME
+        self.query_planner = None
+        if Config.KNN_PLANNER_ENABLED:
+            self.query_planner = KnnQueryPlanner(
+                default_budget_ms=Config.KNN_LATENCY_BUDGET_MS,
+                # 只有RediSearch HNSW索引支持EF_RUNTIME，其他后端只规划k
+                ef_levels=Config.KNN_EF_LEVELS if getattr(self.search_backend, 'supports_ef_runtime', False) else (),
+                min_k=Config.KNN_MIN_K,
+                max_k=Config.KNN_MAX_K,
+                busy_queue_depth=Config.KNN_BUSY_QUEUE_DEPTH
+            )
+        
+        # 相似度查询的截止时间和熔断器：Redis变慢时批次最多等待截止时间，
+        # 连续超时后在冷却期内直接降级，不再等待Redis
+        self.search_fallback = Config.SEARCH_FALLBACK
+        if self.search_fallback not in SEARCH_FALLBACKS:
+            logger.warning(f"未知的相似度查询降级方式: {self.search_fallback}，使用degraded")
+            self.search_fallback = 'degraded'
+        self.search_deadline_ms = Config.SEARCH_DEADLINE_MS
+        self.partial_shard_failure_ratio = Config.SEARCH_PARTIAL_SHARD_FAILURE_RATIO
+        self.search_breaker = CircuitBreaker(
+            'vector_search',
+            failure_threshold=Config.SEARCH_BREAKER_FAILURE_THRESHOLD,
+            cooldown_seconds=Config.SEARCH_BREAKER_COOLDOWN_SECONDS
+        )
+        self._search_executor = None
+        if self.search_deadline_ms > 0:
+            self._search_executor = ThreadPoolExecutor(max_workers=Config.SEARCH_WORKERS,
+                                                       thread_name_prefix='vector-search')
+        self._fallback_lock = threading.Lock()
+        self._fallback_stats = {fallback: 0 for fallback in SEARCH_FALLBACKS}
+        # last_score降级：实体ID -> (风险得分, 风险等级, 评分时间)，按LRU淘汰
+        self._last_scores = OrderedDict()
+        # local_index降级：Redis哈希数据的内存镜像，在后台线程中加载和定期刷新
+        self.fallback_index = None
+        if self.search_fallback == 'local_index' and isinstance(self.search_backend,
+                                                                 (RediSearchBackend, ShardedSearchBackend)):
+            threading.Thread(target=self._refresh_fallback_index, name='fallback-index', daemon=True).start()
+        
+        # 内存镜像定期从Redis重新加载，回写和离线重建写入的实体之后才能被检索到
+        if mirrors_redis and Config.VECTOR_MEMORY_RELOAD_SECONDS > 0:
+            threading.Thread(target=self._reload_memory_index, name='memory-index-reload', daemon=True).start()
+        
+        # 评分后的实体向量异步回写到索引，新实体之后可以被检索到
+        self.index_writer = None
+        if Config.VECTOR_WRITE_BACK_ENABLED and mirrors_redis and Config.VECTOR_MEMORY_RELOAD_SECONDS <= 0:
+            logger.warning("内存向量索引只使用启动时的快照（VECTOR_MEMORY_RELOAD_SECONDS=0），回写的实体不会被检索到，不启用向量回写")
+        elif Config.VECTOR_WRITE_BACK_ENABLED:
+            try:
+                self.index_writer = self._create_index_writer()
+            except Exception as e:
+                logger.error(f"向量回写初始化失败: {e}")
     
-    def process_vector(self, vector_35d: Union[List[float], np.ndarray], entity_id: str) -> Dict:
+    def _create_label_store(self) -> Optional[LabelStore]:
+        """创建并在后台加载本地标签表，分片时从各分片节点加载"""
+        try:
+            if Config.VECTOR_INDEX_SHARDS:
+                from app.models.sharded_search import parse_shard_address
+                
+                redis_clients = []
+                for spec in Config.VECTOR_INDEX_SHARDS:
+                    host, port = parse_shard_address(spec)
+                    redis_clients.append(get_redis_client(decode_responses=False, host=host, port=port, db=0))
+            elif self.redis_client is not None:
+                redis_clients = [self.redis_client]
+            else:
+                return None
+            
+            label_store = LabelStore(
+                redis_clients,
+                key_prefix=Config.VECTOR_KEY_PREFIX,
+                channel=Config.LABEL_UPDATE_CHANNEL or None,
+                keyspace_events=Config.LABEL_STORE_KEYSPACE_EVENTS,
+                refresh_seconds=Config.LABEL_STORE_REFRESH_SECONDS,
+                on_change=self._on_index_changed
+            )
+            label_store.start()
+            return label_store
+        except Exception as e:
+            logger.error(f"本地标签表初始化失败: {e}")
+            return None
+    
+    def _create_index_writer(self) -> Optional[VectorIndexWriter]:
+        """按是否分片创建向量回写器，Redis不可用时不回写"""
+        writer_kwargs = dict(
+            key_prefix=Config.VECTOR_KEY_PREFIX,
+            vector_type=Config.VECTOR_STORAGE_DTYPE,
+            max_queue_size=Config.VECTOR_WRITE_BACK_QUEUE_SIZE,
+            flush_interval=Config.VECTOR_WRITE_BACK_FLUSH_INTERVAL,
+            max_batch=Config.VECTOR_WRITE_BACK_MAX_BATCH,
+            on_flush=self._on_index_changed
+        )
+        if isinstance(self.search_backend, ShardedSearchBackend):
+            from app.redis_pool import get_redis_client
+            from app.models.sharded_search import parse_shard_address
+            
+            ring = self.search_backend.ring
+            redis_clients = []
+            for name in ring.shard_names:
+                host, port = parse_shard_address(name)
+                redis_clients.append(get_redis_client(decode_responses=False, host=host, port=port, db=0))
+            return VectorIndexWriter(redis_clients=redis_clients, ring=ring, **writer_kwargs)
+        if self.redis_client is None:
+            logger.warning("Redis不可用，不回写实体向量")
+            return None
+        return VectorIndexWriter(redis_client=self.redis_client, **writer_kwargs)
+    
+    def _reload_memory_index(self):
+        """按VECTOR_MEMORY_RELOAD_SECONDS从Redis重新加载内存镜像，新快照构建完成后整体替换"""
+        while True:
+            time.sleep(Config.VECTOR_MEMORY_RELOAD_SECONDS)
+            try:
+                count = self.search_backend.reload() if self.search_backend is not None else None
+                if count:
+                    logger.info(f"内存向量索引重新加载了{count}个实体")
+                    self._on_index_changed()
+            except Exception as e:
+                logger.error(f"重新加载内存向量索引失败: {e}")
+    
+    def _on_index_changed(self, *args):
+        """回写了新实体或标签发生变化：缓存的近邻结果不再可信"""
+        # 标签表在后台线程中加载，可能早于缓存创建完成就回调
+        embedding_cache = getattr(self, 'embedding_cache', None)
+        if embedding_cache is not None:
+            embedding_cache.bump_generation()
+        near_duplicate_cache = getattr(self, 'near_duplicate_cache', None)
+        if near_duplicate_cache is not None:
+            near_duplicate_cache.invalidate()
+    
+    def _write_back(self, entity_id: str, vector_128d: np.ndarray, result: Dict,
+                    search_filter: Optional[SearchFilter] = None):
+        """
+        将评分成功的实体放入回写队列（不阻塞评分路径）
+        
+        Args:
+            entity_id: 实体ID
+            vector_128d: 128维编码向量
+            result: 评分结果
+            search_filter: 本次查询的过滤条件，单一取值的业务类型/租户和单日活动日期作为实体属性写入
+        """
+        if self.index_writer is None:
+            return
+        
+        attributes = {'risk_score': round(float(result["risk_score"]), 4)}
+        if search_filter is not None:
+            for field, values in search_filter.tags.items():
+                if len(values) == 1:
+                    attributes[field] = values[0]
+            if search_filter.date_from is not None and search_filter.date_from == search_filter.date_to:
+                attributes['activity_date'] = search_filter.date_from
+        self.index_writer.submit(entity_id, vector_128d, attributes)
+    
+    def update_load(self, queue_depth: int):
+        """
+        上报当前负载（待处理消息数），负载越高KNN查询越保守
+        
+        Args:
+            queue_depth: 待处理的消息/请求数
+        """
+        if self.query_planner is not None:
+            self.query_planner.update_load(queue_depth)
+    
+    def process_vector(self, vector_35d: Union[List[float], np.ndarray], entity_id: str,
+                       profile: str = None, budget_ms: Optional[float] = None,
+                       search_filter: Optional[SearchFilter] = None) -> Dict:
         """
         处理35维向量，生成风险得分
         
         Args:
             vector_35d: 35维输入向量
             entity_id: 实体ID（用户、商户、员工等）
+            profile: 结果配置(minimal/standard/full)，为None时使用Config.RESULT_PROFILE
+            budget_ms: 相似度查询的延迟预算（毫秒），为None时使用Config.KNN_LATENCY_BUDGET_MS
+            search_filter: KNN预过滤条件（业务类型、租户、活动日期），为None时在全部实体中查找
             
         Returns:
             包含风险得分和相关信息的字典
         """
         try:
-            # 确保输入是numpy数组
-            if not isinstance(vector_35d, np.ndarray):
-                vector_35d = np.array(vector_35d, dtype=np.float32)
+            vector_35d = self._check_input_vector(vector_35d)
             
-            # 检查向量维度
-            if vector_35d.shape[0] != 35:
-                raise ValueError(f"输入向量必须是35维，当前维度: {vector_35d.shape[0]}")
+            # 与批量接口共用缓存查询、编码、相似度查询和评分逻辑
+            searched = self._encode_and_search_batch([vector_35d], budget_ms, search_filter, [entity_id])
+            return self._build_batch_results([vector_35d], [entity_id], searched, profile, search_filter)[0]
             
-            # 使用神经网络将35维向量编码为128维向量
-            vector_128d = self._encode_vector(vector_35d)
-            if vector_128d is None:
-                raise ValueError("向量编码失败")
+        except Exception as e:
+            logger.error(f"处理向量时出错: {e}")
+            return self._build_error_result(entity_id, e)
+    
+    def process_vectors_batch(self, vectors_35d: List[np.ndarray], entity_ids: List[str],
+                              profile: str = None, budget_ms: Optional[float] = None,
+                              search_filters=None) -> List[Dict]:
+        """
+        批量处理35维向量，计算风险得分
+        
+        Args:
+            vectors_35d: 35维输入向量列表
+            entity_ids: 实体ID列表
+            profile: 结果配置(minimal/standard/full)，为None时使用Config.RESULT_PROFILE
+            budget_ms: 整个批次相似度查询的延迟预算（毫秒），为None时使用Config.KNN_LATENCY_BUDGET_MS
+            search_filters: 整个批次共用的SearchFilter，或与输入向量一一对应的SearchFilter列表
+            
+        Returns:
+            包含风险得分和相关信息的字典列表
+        """
+        try:
+            self._check_input_batch(vectors_35d, entity_ids)
+            
+            # 批量编码向量并执行Top-k相似度查询，缓存命中的向量跳过这两步
+            searched = self._encode_and_search_batch(vectors_35d, budget_ms, search_filters, entity_ids)
+            return self._build_batch_results(vectors_35d, entity_ids, searched, profile, search_filters)
             
-            # 在Redis中执行Top-10相似度查询
-            similar_entities = self._find_similar_entities(vector_128d, k=10)
+        except Exception as e:
+            logger.error(f"批量处理向量时出错: {e}")
+            # 返回错误结果
+            return [self._build_error_result(entity_id, e) for entity_id in entity_ids]
+    
+    async def aprocess_vector(self, vector_35d: Union[List[float], np.ndarray], entity_id: str,
+                              profile: str = None, budget_ms: Optional[float] = None,
+                              search_filter: Optional[SearchFilter] = None) -> Dict:
+        """
+        process_vector的异步版本，供FastAPI异步路由直接调用
+        
+        编码在线程池中执行，相似度查询使用redis.asyncio，等待Redis期间不阻塞事件循环。
+        
+        Args:
+            vector_35d: 35维输入向量
+            entity_id: 实体ID
+            profile: 结果配置(minimal/standard/full)，为None时使用Config.RESULT_PROFILE
+            budget_ms: 相似度查询的延迟预算（毫秒），为None时使用Config.KNN_LATENCY_BUDGET_MS
+            search_filter: KNN预过滤条件，为None时在全部实体中查找
             
-            # 根据查询结果计算风险得分
-            risk_score = self._calculate_risk_score(similar_entities)
+        Returns:
+            包含风险得分和相关信息的字典
+        """
+        try:
+            vector_35d = self._check_input_vector(vector_35d)
             
-            return {
-                "entity_id": entity_id,
-                "vector_35d": vector_35d.tolist(),
-                "vector_128d": vector_128d.tolist(),
-                "similar_entities": similar_entities,
-                "risk_score": risk_score,
-                "risk_level": self._get_risk_level(risk_score)
-            }
+            searched = await self._aencode_and_search_batch([vector_35d], budget_ms, search_filter, [entity_id])
+            return self._build_batch_results([vector_35d], [entity_id], searched, profile, search_filter)[0]
             
         except Exception as e:
             logger.error(f"处理向量时出错: {e}")
-            return {
-                "entity_id": entity_id,
-                "error": str(e),
-                "risk_score": 0.0,
-                "risk_level": "未知"
-            }
+            return self._build_error_result(entity_id, e)
     
-    def process_vectors_batch(self, vectors_35d: List[np.ndarray], entity_ids: List[str]) -> List[Dict]:
+    async def aprocess_vectors_batch(self, vectors_35d: List[np.ndarray], entity_ids: List[str],
+                                     profile: str = None, budget_ms: Optional[float] = None,
+                                     search_filters=None) -> List[Dict]:
         """
-        批量处理35维向量，计算风险得分
+        process_vectors_batch的异步版本
         
         Args:
             vectors_35d: 35维输入向量列表
             entity_ids: 实体ID列表
+            profile: 结果配置(minimal/standard/full)，为None时使用Config.RESULT_PROFILE
+            budget_ms: 整个批次相似度查询的延迟预算（毫秒），为None时使用Config.KNN_LATENCY_BUDGET_MS
+            search_filters: 整个批次共用的SearchFilter，或与输入向量一一对应的SearchFilter列表
             
         Returns:
             包含风险得分和相关信息的字典列表
         """
         try:
-            if not vectors_35d or not entity_ids or len(vectors_35d) != len(entity_ids):
-                raise ValueError("输入向量和实体ID列表不能为空，且长度必须相等")
-            
-            # 批量编码向量
-            vectors_128d = self._batch_encode_vectors(vectors_35d)
-            if vectors_128d is None:
-                raise ValueError("向量批量编码失败")
-            
-            results = []
-            # 对每个编码后的向量进行处理
-            for i, vector_128d in enumerate(vectors_128d):
-                if vector_128d is not None:
-                    # 在Redis中执行Top-10相似度查询
-                    similar_entities = self._find_similar_entities(vector_128d, k=10)
-                    
-                    # 根据查询结果计算风险得分
-                    risk_score = self._calculate_risk_score(similar_entities)
-                    
-                    results.append({
-                        "entity_id": entity_ids[i],
-                        "vector_35d": vectors_35d[i].tolist(),
-                        "vector_128d": vector_128d.tolist(),
-                        "similar_entities": similar_entities,
-                        "risk_score": risk_score,
-                        "risk_level": self._get_risk_level(risk_score)
-                    })
-                else:
-                    results.append({
-                        "entity_id": entity_ids[i],
-                        "error": "向量编码失败",
-                        "risk_score": 0.0,
-                        "risk_level": "未知"
-                    })
+            self._check_input_batch(vectors_35d, entity_ids)
             
-            return results
+            searched = await self._aencode_and_search_batch(vectors_35d, budget_ms, search_filters, entity_ids)
+            return self._build_batch_results(vectors_35d, entity_ids, searched, profile, search_filters)
             
         except Exception as e:
             logger.error(f"批量处理向量时出错: {e}")
-            # 返回错误结果
-            results = []
-            for entity_id in entity_ids:
-                results.append({
-                    "entity_id": entity_id,
-                    "error": str(e),
-                    "risk_score": 0.0,
-                    "risk_level": "未知"
-                })
-            return results
+            return [self._build_error_result(entity_id, e) for entity_id in entity_ids]
+    
+    def _check_input_vector(self, vector_35d: Union[List[float], np.ndarray]) -> np.ndarray:
+        """将单条输入转换为numpy数组并检查维度"""
+        # 确保输入是numpy数组
+        if not isinstance(vector_35d, np.ndarray):
+            vector_35d = np.array(vector_35d, dtype=np.float32)
+        
+        # 检查向量维度
+        if vector_35d.shape[0] != 35:
+            raise ValueError(f"输入向量必须是35维，当前维度: {vector_35d.shape[0]}")
+        return vector_35d
+    
+    def _check_input_batch(self, vectors_35d: List[np.ndarray], entity_ids: List[str]):
+        """检查批量输入的向量和实体ID列表"""
+        if not vectors_35d or not entity_ids or len(vectors_35d) != len(entity_ids):
+            raise ValueError("输入向量和实体ID列表不能为空，且长度必须相等")
+    
+    def _build_error_result(self, entity_id: str, error) -> Dict:
+        """处理失败时返回的结果"""
+        return {
+            "entity_id": entity_id,
+            "error": str(error),
+            "risk_score": 0.0,
+            "risk_level": "未知"
+        }
+    
+    def _build_batch_results(self, vectors_35d: List[np.ndarray], entity_ids: List[str], searched: Tuple,
+                             profile: str = None, search_filters=None) -> List[Dict]:
+        """
+        根据查询结果计算风险得分、组装结果并回写实体向量（同步和异步接口共用）
+        
+        Args:
+            vectors_35d: 35维输入向量列表
+            entity_ids: 实体ID列表
+            searched: _encode_and_search_batch返回的(vectors_128d, batch_similar_entities, batch_search_params)
+            profile: 结果配置
+            search_filters: 单个SearchFilter或与输入向量一一对应的SearchFilter列表
+            
+        Returns:
+            与输入顺序一致的结果字典列表
+        """
+        vectors_128d, batch_similar_entities, batch_search_params = searched
+        # 对整个批次一次性向量化计算风险得分
+        risk_scores = self._calculate_risk_scores_batch(batch_similar_entities)
+        search_filters = self._expand_search_filters(search_filters, len(vectors_35d))
+        
+        results = []
+        for i, vector_128d in enumerate(vectors_128d):
+            if vector_128d is None:
+                results.append(self._build_error_result(entity_ids[i], "向量编码失败"))
+            elif self._is_degraded(batch_search_params[i]):
+                results.append(self._build_degraded_result(entity_ids[i], batch_search_params[i]))
+            else:
+                result = self._build_result(
+                    entity_ids[i], vectors_35d[i], vector_128d, batch_similar_entities[i], float(risk_scores[i]),
+                    profile, batch_search_params[i]
+                )
+                self._remember_score(entity_ids[i], result)
+                self._write_back(entity_ids[i], vector_128d, result, search_filters[i])
+                results.append(result)
+        return results
+    
+    def _encode_and_search_batch(self, vectors_35d: List[np.ndarray], budget_ms: Optional[float] = None,
+                                 search_filters=None, entity_ids: Optional[List[str]] = None
+                                 ) -> Tuple[List, List[List[Dict]], List]:
+        """
+        批量编码并查询相似实体，优先使用嵌入与近邻缓存
+        
+        查询前后的步骤由_prepare_search_batch和_complete_search_batch完成，
+        与_aencode_and_search_batch只在相似度查询的调用方式上不同。
+        
+        Args:
+            vectors_35d: 35维输入向量列表
+            budget_ms: 整个批次相似度查询的延迟预算（毫秒）
+            search_filters: 单个SearchFilter或与输入向量一一对应的SearchFilter列表
+            entity_ids: 与输入向量一一对应的被评分实体ID，从各自的近邻中去掉
+            
+        Returns:
+            (vectors_128d, batch_similar_entities, batch_search_params)，编码失败的位置向量为None，
+            缓存命中（未执行查询）的位置查询参数为None
+        """
+        search_filters = self._expand_search_filters(search_filters, len(vectors_35d))
+        # 在查缓存之前确定k，缓存命中和新查询的结果按同一个k截断
+        plan = self._plan_search(budget_ms, len(vectors_35d))
+        batch = self._prepare_search_batch(
+            self._lookup_and_encode_batch(vectors_35d, search_filters, plan), search_filters, plan
+        )
+        
+        searched = None
+        if batch['request'] is not None:
+            # 批量执行相似度查询（RediSearch后端通过一次Redis管道发送）
+            searched = self._find_similar_entities_batch(**batch['request'])
+        
+        if self._complete_search_batch(batch, searched):
+            self._store_search_batch(batch)
+        return self._search_batch_results(batch, entity_ids)
+    
+    async def _aencode_and_search_batch(self, vectors_35d: List[np.ndarray], budget_ms: Optional[float] = None,
+                                        search_filters=None, entity_ids: Optional[List[str]] = None
+                                        ) -> Tuple[List, List[List[Dict]], List]:
+        """_encode_and_search_batch的异步版本，缓存查询和编码在线程池中执行"""
+        loop = asyncio.get_running_loop()
+        search_filters = self._expand_search_filters(search_filters, len(vectors_35d))
+        plan = self._plan_search(budget_ms, len(vectors_35d))
+        batch = self._prepare_search_batch(
+            await loop.run_in_executor(None, self._lookup_and_encode_batch, vectors_35d, search_filters, plan),
+            search_filters, plan
+        )
+        
+        searched = None
+        if batch['request'] is not None:
+            searched = await self._afind_similar_entities_batch(**batch['request'])
+        
+        if self._complete_search_batch(batch, searched):
+            await loop.run_in_executor(None, self._store_search_batch, batch)
+        return self._search_batch_results(batch, entity_ids)
+    
+    def _prepare_search_batch(self, lookup: Tuple, search_filters: List, plan: Dict) -> Dict:
+        """
+        在近重复缓存中查找缓存未命中的向量，确定需要执行相似度查询的向量
+        
+        Args:
+            lookup: _lookup_and_encode_batch的返回值
+            search_filters: 与输入向量一一对应的过滤条件列表
+            plan: _plan_search选择的查询参数
+            
+        Returns:
+            批次状态字典，request为相似度查询的参数（已写入_started_at），不需要查询时为None
+        """
+        cache_keys, vectors_128d, batch_similar_entities, search_indices = lookup
+        batch_search_params = [None] * len(vectors_128d)
+        search_indices, near_duplicates = self._lookup_near_duplicates(
+            vectors_128d, search_filters, search_indices, batch_similar_entities, batch_search_params, plan
+        )
+        
+        request = None
+        if search_indices:
+            plan['_started_at'] = time.perf_counter()
+            request = {
+                'vectors_128d': [vectors_128d[i] for i in search_indices],
+                'k': plan['k'] + 1,
+                'ef_runtime': self._self_excluding_ef(plan),
+                'search_filters': [search_filters[i] for i in search_indices],
+                'search_params': plan
+            }
+        
+        return {
+            'plan': plan,
+            'request': request,
+            'cache_keys': cache_keys,
+            'vectors_128d': vectors_128d,
+            'similar_entities': batch_similar_entities,
+            'search_params': batch_search_params,
+            'search_indices': search_indices,
+            'near_duplicates': near_duplicates
+        }
+    
+    def _complete_search_batch(self, batch: Dict, searched: Optional[List[List[Dict]]]) -> bool:
+        """
+        填入相似度查询结果，记录查询耗时并处理近重复缓存
+        
+        Args:
+            batch: _prepare_search_batch返回的批次状态
+            searched: 相似度查询结果，没有执行查询时为None
+            
+        Returns:
+            本次查询的结果是否可以写入嵌入与近邻缓存
+        """
+        search_params = None
+        if batch['request'] is not None:
+            search_params = batch['plan']
+            self._record_search_latency(search_params, len(batch['search_indices']))
+            for i, similar_entities in zip(batch['search_indices'], searched):
+                batch['similar_entities'][i] = similar_entities
+                batch['search_params'][i] = search_params
+        
+        self._resolve_near_duplicates(batch['near_duplicates'], batch['vectors_128d'], batch['similar_entities'],
+                                      batch['search_params'], batch['search_indices'], search_params)
+        return self._is_cacheable(search_params)
+    
+    def _store_search_batch(self, batch: Dict):
+        """只缓存本次实际查询的结果，近重复缓存给出的近似结果不写入精确键的嵌入缓存"""
+        self._store_in_cache(batch['cache_keys'], batch['vectors_128d'], batch['similar_entities'],
+                             batch['search_indices'])
+    
+    def _search_batch_results(self, batch: Dict, entity_ids: Optional[List[str]]
+                              ) -> Tuple[List, List[List[Dict]], List]:
+        """去掉近邻中的被评分实体本身，返回(vectors_128d, batch_similar_entities, batch_search_params)"""
+        batch_similar_entities = self._exclude_self(batch['similar_entities'], entity_ids, batch['plan']['k'])
+        return batch['vectors_128d'], batch_similar_entities, batch['search_params']
+    
+    def _lookup_and_encode_batch(self, vectors_35d: List[np.ndarray], search_filters: List = None,
+                                 search_params: Optional[Dict] = None) -> Tuple:
+        """
+        查询缓存并批量编码未命中的向量
+        
+        Args:
+            vectors_35d: 35维输入向量列表
+            search_filters: 与输入向量一一对应的过滤条件列表，不同过滤条件的近邻结果分开缓存
+            search_params: 本批次的查询参数，不同k和EF_RUNTIME的近邻结果分开缓存
+            
+        Returns:
+            (cache_keys, vectors_128d, batch_similar_entities, search_indices)
+            cache_keys: 缓存键列表，未启用缓存时为None
+            search_indices: 需要执行相似度查询的下标（缓存未命中且编码成功）
+        """
+        count = len(vectors_35d)
+        vectors_128d = [None] * count
+        batch_similar_entities = [[] for _ in range(count)]
+        miss_indices = list(range(count))
+        
+        cache_keys = None
+        if self.embedding_cache is not None:
+            model_version = get_model_version()
+            generation = self.embedding_cache.current_generation()
+            search_filters = search_filters or [None] * count
+            cache_keys = [
+                EmbeddingCache.make_key(vector_35d, model_version, self._cache_scope(search_filter, search_params),
+                                        generation)
+                for vector_35d, search_filter in zip(vectors_35d, search_filters)
+            ]
+            cached_entries = self.embedding_cache.get_many(cache_keys, model_version)
+            miss_indices = []
+            for i, entry in enumerate(cached_entries):
+                if entry is None:
+                    miss_indices.append(i)
+                else:
+                    vectors_128d[i], batch_similar_entities[i] = entry
+        
+        if not miss_indices:
+            return cache_keys, vectors_128d, batch_similar_entities, []
+        
+        # 批量编码向量
+        encoded = self._batch_encode_vectors([vectors_35d[i] for i in miss_indices])
+        if encoded is None:
+            raise ValueError("向量批量编码失败")
+        
+        search_indices = []
+        for i, vector_128d in zip(miss_indices, encoded):
+            vectors_128d[i] = vector_128d
+            if vector_128d is not None:
+                search_indices.append(i)
+        
+        return cache_keys, vectors_128d, batch_similar_entities, search_indices
+    
+    def _store_in_cache(self, cache_keys, vectors_128d, batch_similar_entities, indices):
+        """将新查询到的结果写入嵌入与近邻缓存"""
+        if cache_keys is None:
+            return
+        
+        # 空结果可能是检索失败导致，不写入缓存
+        cache_items = [
+            (cache_keys[i], vectors_128d[i], batch_similar_entities[i])
+            for i in indices
+            if batch_similar_entities[i]
+        ]
+        if cache_items:
+            self.embedding_cache.put_many(cache_items)
+    
+    def _lookup_near_duplicates(self, vectors_128d: List, search_filters: List, indices: List[int],
+                                batch_similar_entities: List, batch_search_params: List,
+                                search_params: Optional[Dict] = None) -> Tuple[List[int], Optional[Dict]]:
+        """
+        在近重复缓存中查找编码成功的向量，命中的位置直接填入缓存的近邻列表
+        
+        Args:
+            vectors_128d: 128维编码向量列表
+            search_filters: 与输入向量一一对应的过滤条件列表
+            indices: 需要执行相似度查询的下标
+            batch_similar_entities: 近邻列表（原地填充命中位置）
+            batch_search_params: 查询参数列表（原地填充命中位置）
+            search_params: 本批次的查询参数，不同k和EF_RUNTIME的近邻结果分开缓存
+            
+        Returns:
+            (仍需查询的下标, 近重复状态)，未启用缓存时状态为None
+        """
+        if self.near_duplicate_cache is None or not indices:
+            return indices, None
+        
+        scopes = [self._cache_scope(search_filters[i], search_params) for i in indices]
+        try:
+            hits, aliases, verify = self.near_duplicate_cache.lookup_many(
+                [vectors_128d[i] for i in indices], scopes, get_model_version()
+            )
+        except Exception as e:
+            self.near_duplicate_cache.record_error(e)
+            return indices, None
+        
+        state = {'scopes': dict(zip(indices, scopes)), 'aliases': {}, 'verify': {}}
+        remaining = []
+        for position, i in enumerate(indices):
+            if hits[position] is not None and position not in verify:
+                batch_similar_entities[i], distance = hits[position]
+                batch_search_params[i] = {"cache_hit": True, "near_duplicate": True, "distance": round(distance, 6)}
+            elif position in aliases:
+                # 同批次的近重复向量复用代表向量的查询结果
+                state['aliases'][i] = indices[aliases[position]]
+            else:
+                if position in verify:
+                    state['verify'][i] = hits[position][0]
+                remaining.append(i)
+        return remaining, state
+    
+    def _resolve_near_duplicates(self, state: Optional[Dict], vectors_128d: List, batch_similar_entities: List,
+                                 batch_search_params: List, searched_indices: List[int],
+                                 search_params: Optional[Dict]):
+        """查询完成后填充同批次近重复的结果、记录抽样校验，并将新结果写入近重复缓存"""
+        if state is None:
+            return
+        
+        for i, representative in state['aliases'].items():
+            batch_similar_entities[i] = batch_similar_entities[representative]
+            batch_search_params[i] = batch_search_params[representative]
+        
+        # 降级索引和缺失分片的结果不参与校验，也不写入缓存
+        if not self._is_cacheable(search_params):
+            return
+        
+        for i, cached in state['verify'].items():
+            self.near_duplicate_cache.record_verification(cached, batch_similar_entities[i])
+        
+        new_indices = [i for i in searched_indices if i not in state['verify']]
+        try:
+            self.near_duplicate_cache.put_many(
+                [vectors_128d[i] for i in new_indices],
+                [state['scopes'][i] for i in new_indices],
+                [batch_similar_entities[i] for i in new_indices]
+            )
+        except Exception as e:
+            self.near_duplicate_cache.record_error(e)
+    
+    def _is_cacheable(self, search_params: Optional[Dict]) -> bool:
+        """本次查询的结果是否可以写入缓存（执行了查询，且没有降级或缺失分片）"""
+        return search_params is not None and 'fallback' not in search_params and 'partial_shards' not in search_params
+    
+    def _expand_search_filters(self, search_filters, count: int) -> List[Optional[SearchFilter]]:
+        """将单个过滤条件展开为与输入向量一一对应的列表"""
+        if search_filters is None or isinstance(search_filters, SearchFilter):
+            return [search_filters] * count
+        if len(search_filters) != count:
+            raise ValueError("过滤条件数量与输入向量数量不一致")
+        return list(search_filters)
+    
+    def _cache_scope(self, search_filter: Optional[SearchFilter], search_params: Optional[Dict] = None) -> Optional[str]:
+        """过滤条件和查询参数（k、EF_RUNTIME）对应的缓存作用域"""
+        scopes = []
+        if search_params is not None:
+            scopes.append(f"k={search_params['k']},ef={search_params['ef_runtime']}")
+        if search_filter is not None and search_filter.cache_scope():
+            scopes.append(search_filter.cache_scope())
+        return '|'.join(scopes) or None
+    
+    def _plan_search(self, budget_ms: Optional[float], num_queries: int) -> Dict:
+        """
+        选择本次相似度查询的参数，执行查询前需写入_started_at供_record_search_latency使用
+        
+        Args:
+            budget_ms: 延迟预算（毫秒）
+            num_queries: 查询条数
+            
+        Returns:
+            查询参数字典: {'k', 'ef_runtime', 'budget_ms', 'load'}，未启用规划器时固定k=10
+        """
+        if self.query_planner is None:
+            search_params = {'k': 10, 'ef_runtime': None, 'budget_ms': budget_ms, 'load': None}
+        else:
+            search_params = self.query_planner.plan(budget_ms, num_queries)
+        return search_params
+    
+    def _self_excluding_ef(self, search_params: Dict) -> Optional[int]:
+        """多取一个近邻时的EF_RUNTIME（HNSW要求不小于k）"""
+        ef_runtime = search_params['ef_runtime']
+        return None if ef_runtime is None else max(ef_runtime, search_params['k'] + 1)
+    
+    def _exclude_self(self, batch_similar_entities: List[List[Dict]], entity_ids: Optional[List[str]],
+                      k: int) -> List[List[Dict]]:
+        """
+        去掉近邻中的被评分实体本身，并截断为k个
+        
+        回写开启时被评分实体以自身ID写入索引，再次评分时会查到自己（相似度约为1.0且没有标签），
+        因此查询多取一个近邻。缓存的近邻列表与实体无关（同一向量可能来自不同实体），只在返回前过滤。
+        
+        Args:
+            batch_similar_entities: 近邻列表的列表（不修改，可能与缓存共享）
+            entity_ids: 与之一一对应的实体ID，为None时只截断
+            k: 每个实体保留的近邻数
+            
+        Returns:
+            过滤后的近邻列表的列表
+        """
+        if entity_ids is None:
+            return [similar_entities[:k] for similar_entities in batch_similar_entities]
+        return [
+            [entity for entity in similar_entities if str(entity.get('entity_id')) != str(entity_id)][:k]
+            for similar_entities, entity_id in zip(batch_similar_entities, entity_ids)
+        ]
+    
+    def _record_search_latency(self, search_params: Dict, num_queries: int):
+        """记录查询耗时，反馈给规划器并写入查询参数"""
+        elapsed_ms = (time.perf_counter() - search_params.pop('_started_at')) * 1000
+        search_params['elapsed_ms'] = round(elapsed_ms, 3)
+        # 降级时的耗时不反映索引的查询代价，不反馈给规划器；耗时记在实际发送的EF_RUNTIME档位下
+        if self.query_planner is not None and 'fallback' not in search_params:
+            self.query_planner.record_latency(search_params, elapsed_ms, num_queries,
+                                              ef_runtime=self._self_excluding_ef(search_params))
+    
+    def _build_result(self, entity_id: str, vector_35d: np.ndarray, vector_128d: np.ndarray,
+                      similar_entities: List[Dict], risk_score: float, profile: str = None,
+                      search_params: Optional[Dict] = None) -> Dict:
+        """
+        按结果配置组装返回结果
+        
+        - minimal: 风险得分、风险等级和前RESULT_MINIMAL_TOP_N个相似实体
+        - standard: 在minimal基础上返回全部相似实体
+        - full: 在standard基础上返回35维和128维向量（默认，与原有格式一致）
+        
+        Args:
+            entity_id: 实体ID
+            vector_35d: 35维输入向量
+            vector_128d: 128维编码向量
+            similar_entities: 相似实体列表
+            risk_score: 风险得分
+            profile: 结果配置，为None时使用Config.RESULT_PROFILE
+            search_params: 本次相似度查询使用的参数，缓存命中时为None
+            
+        Returns:
+            结果字典
+        """
+        profile = (profile or Config.RESULT_PROFILE).lower()
+        if profile not in RESULT_PROFILES:
+            raise ValueError(f"未知的结果配置: {profile}")
+        
+        result = {"entity_id": entity_id}
+        
+        if profile == 'full':
+            result["vector_35d"] = encode_vector(vector_35d, Config.RESULT_VECTOR_ENCODING)
+            result["vector_128d"] = encode_vector(vector_128d, Config.RESULT_VECTOR_ENCODING)
+        
+        if profile == 'minimal':
+            result["similar_entities"] = similar_entities[:Config.RESULT_MINIMAL_TOP_N]
+        else:
+            result["similar_entities"] = similar_entities
+        
+        result["risk_score"] = risk_score
+        result["risk_level"] = self._get_risk_level(risk_score)
+        result["search_params"] = search_params if search_params is not None else {"cache_hit": True}
+        return result
     
     def _encode_vector(self, vector_35d: np.ndarray) -> Union[np.ndarray, None]:
         """
@@ -151,13 +876,6 @@ class FraudDetectionCore:
             128维编码后的向量，如果失败则返回None
         """
         try:
-            # 获取编码器和标准化器
-            encoder, scaler = get_encoder()
-            
-            if encoder is None or scaler is None:
-                logger.error("编码器或标准化器未加载")
-                return None
-            
             # 确保输入是numpy数组
             if not isinstance(vector_35d, np.ndarray):
                 vector_35d = np.array(vector_35d, dtype=np.float32)
@@ -167,18 +885,12 @@ class FraudDetectionCore:
                 logger.error(f"输入向量维度不正确: {vector_35d.shape[0]}，期望35维")
                 return None
             
-            # 标准化向量
-            vector_scaled = scaler.transform(vector_35d.reshape(1, -1))
-            
-            # 转换为PyTorch张量
-            vector_tensor = torch.FloatTensor(vector_scaled)
-            
-            # 编码向量
-            with torch.no_grad():
-                vector_128d = encoder(vector_tensor)
+            # 编码向量（融合编码器或torch编码器）
+            vector_128d = encode_vectors(vector_35d.reshape(1, -1))
+            if vector_128d is None:
+                return None
             
-            # 转换回numpy数组
-            return vector_128d.numpy().flatten()
+            return vector_128d.flatten()
                 
         except Exception as e:
             logger.error(f"向量编码失败: {e}")
@@ -195,29 +907,13 @@ class FraudDetectionCore:
             128维编码后的向量列表，如果失败则返回None
         """
         try:
-            from app.models.model_loader import get_encoder
-            import torch
-            
-            encoder, scaler = get_encoder()
-            if encoder is None or scaler is None:
-                logger.error("编码器未加载")
-                return None
-            
             # 确保输入是numpy数组
             vectors_array = np.array(vectors_35d, dtype=np.float32)
             
-            # 批量标准化
-            vectors_scaled = scaler.transform(vectors_array)
-            
-            # 转换为PyTorch张量
-            vectors_tensor = torch.FloatTensor(vectors_scaled)
-            
-            # 批量编码
-            with torch.no_grad():
-                vectors_128d = encoder(vectors_tensor)
-            
-            # 转换回numpy数组
-            results = vectors_128d.numpy()
+            # 批量编码（融合编码器或torch编码器）
+            results = encode_vectors(vectors_array)
+            if results is None:
+                return None
             
             # 转换为列表
             return [results[i].flatten().astype(np.float32) for i in range(results.shape[0])]
@@ -226,77 +922,235 @@ class FraudDetectionCore:
             logger.error(f"批量向量编码失败: {e}")
             return None
     
-    def _find_similar_entities(self, vector_128d: np.ndarray, k: int = 10) -> List[Dict]:
+    def _find_similar_entities(self, vector_128d: np.ndarray, k: int = 10,
+                               ef_runtime: Optional[int] = None,
+                               search_filter: Optional[SearchFilter] = None,
+                               search_params: Optional[Dict] = None) -> List[Dict]:
         """
         查找与指定向量相似的实体
         
         Args:
             vector_128d: 128维向量
             k: 返回最相似的k个实体
+            ef_runtime: HNSW查询时的候选列表大小，为None时使用索引默认值
+            search_filter: KNN预过滤条件
+            search_params: 本次查询参数，发生降级时写入fallback和degraded_reason
             
         Returns:
             相似实体列表，包含实体ID、相似度得分和标签
         """
-        if self.redis_client is None:
-            logger.warning("Redis客户端未初始化")
-            return []
+        return self._find_similar_entities_batch([vector_128d], k=k, ef_runtime=ef_runtime,
+                                                 search_filters=[search_filter], search_params=search_params)[0]
+    
+    def _find_similar_entities_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                                     ef_runtime: Optional[int] = None, search_filters=None,
+                                     search_params: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        批量查找相似实体
+        
+        单条查询失败只会使该条结果为空列表，不影响同一批次中的其他查询。
+        整个批次超过截止时间、后端抛出异常或熔断器处于熔断状态时按SEARCH_FALLBACK降级。
+        
+        Args:
+            vectors_128d: 128维向量列表，元素可以为None（编码失败的向量）
+            k: 每个向量返回最相似的k个实体
+            ef_runtime: HNSW查询时的候选列表大小，为None时使用索引默认值
+            search_filters: 单个SearchFilter或与输入向量一一对应的SearchFilter列表
+            search_params: 本次查询参数，发生降级时写入fallback和degraded_reason
+            
+        Returns:
+            与输入顺序一致的相似实体列表的列表
+        """
+        if self.search_backend is None or not self.search_backend.is_available():
+            logger.warning("向量检索后端不可用")
+            return [[] for _ in vectors_128d]
+        
+        if not self.search_breaker.allow_request():
+            return self._fallback_search(vectors_128d, k, search_filters, search_params, 'circuit_open')
         
         try:
-            # 确保向量是FLOAT32类型
-            if not isinstance(vector_128d, np.ndarray):
-                vector_128d = np.array(vector_128d, dtype=np.float32)
-            vector_128d = vector_128d.astype(np.float32)
-            
-            # 执行向量搜索
-            result = self.redis_client.execute_command(
-                'FT.SEARCH', 'entity_vectors',
-                '*=>[KNN %d @vector $vec AS similarity_score]' % k,
-                'PARAMS', '2', 'vec', vector_128d.tobytes(),
-                'SORTBY', 'similarity_score', 'ASC',
-                'DIALECT', '2',
-                'LIMIT', '0', str(k)
-            )
+            if self._search_executor is None:
+                results = self.search_backend.search_batch(vectors_128d, k=k, ef_runtime=ef_runtime,
+                                                           filters=search_filters)
+            else:
+                # 在查询线程中执行，调用方最多等待截止时间；超时的查询在后台线程中自然结束
+                future = self._search_executor.submit(self.search_backend.search_batch, vectors_128d, k,
+                                                      ef_runtime, search_filters)
+                try:
+                    results = future.result(timeout=self._search_deadline(search_params))
+                except FutureTimeoutError:
+                    future.cancel()
+                    raise
+        except FutureTimeoutError:
+            logger.warning(f"批量查找相似实体超时（{len(vectors_128d)}条）")
+            self.search_breaker.record_failure('timeout')
+            return self._fallback_search(vectors_128d, k, search_filters, search_params, 'timeout')
+        except Exception as e:
+            logger.error(f"批量查找相似实体失败: {e}")
+            self.search_breaker.record_failure('error')
+            return self._fallback_search(vectors_128d, k, search_filters, search_params, 'error')
+        
+        self._record_search_outcome(results, search_params)
+        return results
+    
+    def _record_search_outcome(self, results: List[List[Dict]], search_params: Optional[Dict]):
+        """
+        记录后端返回结果后的熔断器状态
+        
+        分片后端部分分片失败时在search_params中标记partial_shards（结果不写入缓存），
+        缺失分片比例超过SEARCH_PARTIAL_SHARD_FAILURE_RATIO时计为一次失败。
+        """
+        missing_shards = getattr(results, 'missing_shards', None)
+        if not missing_shards:
+            self.search_breaker.record_success()
+            return
+        
+        if search_params is not None:
+            search_params['partial_shards'] = {'missing': list(missing_shards), 'total': results.total_shards}
+        if len(missing_shards) / results.total_shards > self.partial_shard_failure_ratio:
+            self.search_breaker.record_failure('partial_shards')
+        else:
+            self.search_breaker.record_success()
+    
+    def _search_deadline(self, search_params: Optional[Dict]) -> Optional[float]:
+        """本批次的截止时间（秒），不短于请求自身的延迟预算"""
+        if self.search_deadline_ms <= 0:
+            return None
+        budget_ms = (search_params or {}).get('budget_ms') or 0
+        return max(self.search_deadline_ms, budget_ms) / 1000.0
+    
+    def _fallback_search(self, vectors_128d: List[np.ndarray], k: int, search_filters,
+                         search_params: Optional[Dict], reason: str) -> List[List[Dict]]:
+        """
+        相似度查询降级
+        
+        local_index在内存镜像索引中查询；镜像不可用、last_score和degraded返回空结果，
+        并在search_params中标记，由调用方返回上次评分或DEGRADED结果。
+        
+        Args:
+            vectors_128d: 128维向量列表
+            k: 每个向量返回最相似的k个实体
+            search_filters: 过滤条件
+            search_params: 本次查询参数
+            reason: 降级原因（timeout / error / circuit_open）
             
-            # 解析结果
-            similar_entities = []
-            for i in range(1, len(result), 2):
-                fields = result[i+1]
-                entity_info = {}
-                
-                for j in range(0, len(fields), 2):
-                    field_name = fields[j].decode('utf-8') if isinstance(fields[j], bytes) else fields[j]
-                    field_value = fields[j+1]
-                    
-                    # 解码字段值如果是字节类型
-                    if isinstance(field_value, bytes):
-                        try:
-                            field_value = field_value.decode('utf-8')
-                        except UnicodeDecodeError:
-                            continue
-                    
-                    entity_info[field_name] = field_value
-                
-                # 提取必要字段
-                entity_id = entity_info.get('entity_id') or entity_info.get('id')
-                similarity_score = entity_info.get('similarity_score')
-                label = entity_info.get('label')
-                
-                if entity_id and similarity_score is not None:
-                    try:
-                        similar_entities.append({
-                            'entity_id': str(entity_id),
-                            'similarity_score': float(similarity_score),
-                            'label': int(label) if label is not None else None
-                        })
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"转换实体信息字段时出错: {e}")
-                        continue
-            
-            return similar_entities
+        Returns:
+            与输入顺序一致的相似实体列表的列表
+        """
+        fallback = self.search_fallback
+        results = None
+        if fallback == 'local_index':
+            fallback_index = self.fallback_index
+            try:
+                if fallback_index is not None and fallback_index.is_available():
+                    results = fallback_index.search_batch(vectors_128d, k=k, filters=search_filters)
+            except Exception as e:
+                logger.warning(f"降级索引查询失败: {e}")
+            if results is None:
+                fallback = 'degraded'
+        
+        with self._fallback_lock:
+            self._fallback_stats[fallback] += 1
+        if search_params is not None:
+            search_params['fallback'] = fallback
+            search_params['degraded_reason'] = reason
+        
+        return results if results is not None else [[] for _ in vectors_128d]
+    
+    def _is_degraded(self, search_params: Optional[Dict]) -> bool:
+        """查询是否降级为无相似实体结果（需要返回上次评分或DEGRADED结果）"""
+        return search_params is not None and search_params.get('fallback') in ('last_score', 'degraded')
+    
+    def _build_degraded_result(self, entity_id: str, search_params: Dict) -> Dict:
+        """
+        构造降级结果
+        
+        last_score降级且该实体有历史评分时返回上次评分，否则返回DEGRADED状态：风险得分为None、风险等级未知，
+        避免调用方把没有评分的结果当作0分（低风险）处理。
+        
+        Args:
+            entity_id: 实体ID
+            search_params: 本次查询参数
             
-        except Exception as e:
-            logger.error(f"查找相似实体失败: {e}")
-            return []
+        Returns:
+            结果字典，status为DEGRADED
+        """
+        result = {"entity_id": entity_id, "status": "DEGRADED", "similar_entities": []}
+        
+        last = None
+        if search_params.get('fallback') == 'last_score':
+            with self._fallback_lock:
+                last = self._last_scores.get(entity_id)
+        
+        if last is not None:
+            result["risk_score"], result["risk_level"], result["scored_at"] = last
+        else:
+            result["risk_score"] = None
+            result["risk_level"] = "未知"
+            search_params = dict(search_params, fallback='degraded')
+        result["search_params"] = search_params
+        return result
+    
+    def _remember_score(self, entity_id: str, result: Dict):
+        """记录实体最近一次的正常评分，供last_score降级使用"""
+        if self.search_fallback != 'last_score' or Config.SEARCH_LAST_SCORE_SIZE <= 0:
+            return
+        with self._fallback_lock:
+            self._last_scores[entity_id] = (result["risk_score"], result["risk_level"], time.time())
+            self._last_scores.move_to_end(entity_id)
+            while len(self._last_scores) > Config.SEARCH_LAST_SCORE_SIZE:
+                self._last_scores.popitem(last=False)
+    
+    def _refresh_fallback_index(self):
+        """后台加载local_index降级使用的内存镜像索引，按SEARCH_FALLBACK_REFRESH_SECONDS定期刷新"""
+        while True:
+            # 熔断期间Redis本身有问题，跳过本轮刷新，保留现有镜像
+            if self.search_breaker.state == CircuitBreaker.CLOSED:
+                try:
+                    memory_kwargs = dict(
+                        exact_threshold=Config.VECTOR_MEMORY_EXACT_THRESHOLD,
+                        nprobe=Config.VECTOR_MEMORY_NPROBE,
+                        quantization=Config.VECTOR_MEMORY_QUANTIZATION
+                    )
+                    if isinstance(self.search_backend, ShardedSearchBackend):
+                        # 每个分片节点分别镜像，保持相同的分片方式
+                        fallback_index = self.search_backend.mirror_in_memory(**memory_kwargs)
+                    else:
+                        fallback_index = create_search_backend(
+                            'memory',
+                            redis_client=self.redis_client,
+                            key_prefix=Config.VECTOR_KEY_PREFIX,
+                            vector_type=Config.VECTOR_STORAGE_DTYPE,
+                            **memory_kwargs
+                        )
+                    if fallback_index.is_available():
+                        self.fallback_index = fallback_index
+                        logger.info(f"降级索引加载完成: {fallback_index.get_stats()}")
+                except Exception as e:
+                    logger.error(f"加载降级索引失败: {e}")
+            
+            if Config.SEARCH_FALLBACK_REFRESH_SECONDS <= 0 and self.fallback_index is not None:
+                return
+            time.sleep(Config.SEARCH_FALLBACK_REFRESH_SECONDS if Config.SEARCH_FALLBACK_REFRESH_SECONDS > 0 else 30)
+    
+    def get_search_stats(self) -> Dict:
+        """获取相似度查询的熔断、降级和查询规划状态"""
+        with self._fallback_lock:
+            fallbacks = dict(self._fallback_stats)
+            last_scores = len(self._last_scores)
+        return {
+            "backend": self.search_backend.get_stats() if self.search_backend is not None else None,
+            "breaker": self.search_breaker.get_stats(),
+            "deadline_ms": self.search_deadline_ms,
+            "fallback": self.search_fallback,
+            "fallbacks": fallbacks,
+            "fallback_index": self.fallback_index.get_stats() if self.fallback_index is not None else None,
+            "last_scores": last_scores,
+            "near_duplicate_cache": self.near_duplicate_cache.get_stats() if self.near_duplicate_cache is not None else None,
+            "write_back": self.index_writer.get_stats() if self.index_writer is not None else None,
+            "label_store": self.label_store.get_stats() if self.label_store is not None else None,
+            "planner": self.query_planner.get_stats() if self.query_planner is not None else None
+        }
     
     def _calculate_risk_score(self, similar_entities: List[Dict]) -> float:
         """
@@ -504,6 +1358,167 @@ class FraudDetectionCore:
         
         return adjusted_risk
     
+    async def _afind_similar_entities_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                                            ef_runtime: Optional[int] = None,
+                                            search_filters=None,
+                                            search_params: Optional[Dict] = None) -> List[List[Dict]]:
+        """_find_similar_entities_batch的异步版本，截止时间通过asyncio.wait_for控制"""
+        if self.search_backend is None or not self.search_backend.is_available():
+            logger.warning("向量检索后端不可用")
+            return [[] for _ in vectors_128d]
+        
+        if not self.search_breaker.allow_request():
+            return self._fallback_search(vectors_128d, k, search_filters, search_params, 'circuit_open')
+        
+        try:
+            results = await asyncio.wait_for(
+                self.search_backend.asearch_batch(vectors_128d, k=k, ef_runtime=ef_runtime, filters=search_filters),
+                timeout=self._search_deadline(search_params)
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"批量查找相似实体超时（{len(vectors_128d)}条）")
+            self.search_breaker.record_failure('timeout')
+            return self._fallback_search(vectors_128d, k, search_filters, search_params, 'timeout')
+        except Exception as e:
+            logger.error(f"批量查找相似实体失败: {e}")
+            self.search_breaker.record_failure('error')
+            return self._fallback_search(vectors_128d, k, search_filters, search_params, 'error')
+        
+        self._record_search_outcome(results, search_params)
+        return results
+    
+    def _build_neighbor_matrices(self, batch_similar_entities: List[List[Dict]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        将批量相似实体列表转换为稠密矩阵
+        
+        Args:
+            batch_similar_entities: 每个实体的相似实体列表
+            
+        Returns:
+            (similarities, labels)
+            similarities: (N, k) float64矩阵，缺失位置为NaN，有效值左对齐
+            labels: (N, k) int64矩阵，无标签或缺失位置为-1
+        """
+        n = len(batch_similar_entities)
+        k = max((len(entities) for entities in batch_similar_entities), default=0)
+        similarities = np.full((n, max(k, 1)), np.nan, dtype=np.float64)
+        labels = np.full((n, max(k, 1)), -1, dtype=np.int64)
+        
+        for i, entities in enumerate(batch_similar_entities):
+            for j, entity in enumerate(entities):
+                similarities[i, j] = entity['similarity_score']
+                if entity['label'] is not None:
+                    labels[i, j] = entity['label']
+        
+        return similarities, labels
+    
+    def _calculate_risk_scores_batch(self, batch_similar_entities: List[List[Dict]]) -> np.ndarray:
+        """
+        向量化批量计算风险得分
+        
+        与_calculate_risk_score逐条计算的结果一致，所有规则在(N, k)矩阵上用掩码一次完成。
+        
+        Args:
+            batch_similar_entities: 每个实体的相似实体列表
+            
+        Returns:
+            (N,) 风险得分数组 (0-100)
+        """
+        if not batch_similar_entities:
+            return np.empty(0, dtype=np.float64)
+        
+        similarities, labels = self._build_neighbor_matrices(batch_similar_entities)
+        return self._score_neighbor_matrices(similarities, labels)
+    
+    def _score_neighbor_matrices(self, similarities: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """
+        在稠密相似度/标签矩阵上计算风险得分
+        
+        Args:
+            similarities: (N, k) 相似度矩阵，缺失位置为NaN，有效值左对齐
+            labels: (N, k) 标签矩阵，无标签或缺失位置为-1
+            
+        Returns:
+            (N,) 风险得分数组 (0-100)
+        """
+        valid = ~np.isnan(similarities)
+        has_label = valid & (labels >= 0)
+        sim_count = valid.sum(axis=1)
+        label_count = has_label.sum(axis=1)
+        has_sims = sim_count > 0
+        has_labels = label_count > 0
+        safe_sim_count = np.maximum(sim_count, 1)
+        safe_label_count = np.maximum(label_count, 1)
+        
+        sims = np.where(valid, similarities, 0.0)
+        avg_sim = sims.sum(axis=1) / safe_sim_count
+        max_sim = np.where(valid, similarities, -np.inf).max(axis=1)
+        min_sim = np.where(valid, similarities, np.inf).min(axis=1)
+        std_sim = np.sqrt((np.where(valid, similarities - avg_sim[:, None], 0.0) ** 2).sum(axis=1) / safe_sim_count)
+        
+        malicious = has_label & (labels == 1)
+        safe = has_label & (labels == 0)
+        
+        # 1. 标签风险：前3个"有标签"的邻居决定集中度加成
+        malicious_count = malicious.sum(axis=1)
+        label_rank = np.cumsum(has_label, axis=1)
+        top3_malicious = (malicious & (label_rank <= 3)).sum(axis=1)
+        concentration_bonus = np.where(
+            malicious_count > 0,
+            top3_malicious / np.minimum(3, safe_label_count) * 20,
+            0.0
+        )
+        label_risk = np.where(
+            has_labels,
+            np.minimum(100.0, malicious_count / safe_label_count * 100 + concentration_bonus),
+            50.0
+        )
+        
+        # 2. 相似度风险
+        avg_risk = np.select(
+            [avg_sim < 0.1, avg_sim < 0.3, avg_sim > 0.8],
+            [80.0, 60.0 + (0.3 - avg_sim) * 100, 10.0],
+            default=40.0 - (avg_sim - 0.3) * 60
+        )
+        max_risk = np.select(
+            [max_sim < 0.2, max_sim > 0.9],
+            [70.0, 5.0],
+            default=35.0 - (max_sim - 0.2) * 42.8
+        )
+        similarity_risk = np.clip(avg_risk * 0.7 + max_risk * 0.3, 0.0, 100.0)
+        
+        # 3. 分布风险
+        dispersion_risk = np.select(
+            [std_sim > 0.3, std_sim < 0.05],
+            [60.0, 20.0],
+            default=20.0 + (std_sim - 0.05) * 160
+        )
+        # 标签与相似度一致性：仅当每个邻居都有标签时计算
+        high_sim = valid & (similarities > 0.5)
+        high_sim_count = high_sim.sum(axis=1)
+        consistency_applies = has_labels & (label_count == sim_count) & (high_sim_count > 0)
+        consistency_ratio = (high_sim & safe).sum(axis=1) / np.maximum(high_sim_count, 1)
+        consistency_risk = np.where(consistency_applies, 60.0 * (1 - consistency_ratio), 30.0)
+        distribution_risk = dispersion_risk * 0.6 + consistency_risk * 0.4
+        
+        # 4. 综合风险计算（加权平均）
+        final_risk = label_risk * 0.4 + similarity_risk * 0.35 + distribution_risk * 0.25
+        
+        # 5. 特殊情况调整
+        final_risk = final_risk + np.where(min_sim < 0.01, 15.0, 0.0) - np.where(max_sim > 0.95, 10.0, 0.0)
+        
+        all_safe_low_sim = has_labels & (safe.sum(axis=1) == label_count) & (avg_sim < 0.2)
+        if all_safe_low_sim.any():
+            final_risk = np.where(all_safe_low_sim, np.maximum(final_risk, 65.0), final_risk)
+            logger.info(f"检测到异常模式：{int(all_safe_low_sim.sum())}个实体全部正常标签但低相似度，风险分数已调整")
+        
+        final_risk = final_risk + np.where(sim_count < 5, 10.0, 0.0)
+        
+        # 没有相似实体本身就是高风险信号
+        final_risk = np.where(has_sims, final_risk, 85.0)
+        
+        return np.clip(final_risk, 0.0, 100.0)
+    
     def _get_risk_level(self, risk_score: float) -> str:
         """
         根据风险得分确定风险等级
@@ -0,0 +1,192 @@
+import os
+import logging
+import threading
+import numpy as np
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FusedEncoder:
+    """
+    纯NumPy的35→128编码器推理路径
+
+    加载时把StandardScaler的均值和标准差折叠进第一层Linear：
+        ((x - mean) / scale) @ W1.T + b1 = x @ (W1 / scale).T + (b1 - (W1 / scale) @ mean)
+    推理时每层只做一次matmul（写入线程私有的预分配缓冲区）、原地加偏置和原地ReLU，
+    不需要scaler.transform、张量构造和torch.no_grad，运行时也不需要导入torch。
+    """
+
+    def __init__(self, weights: List[np.ndarray], biases: List[np.ndarray], relus: List[bool],
+                 source_version: Optional[str] = None):
+        """
+        Args:
+            weights: 各层权重，形状(输入维度, 输出维度)，第一层已折叠标准化参数
+            biases: 各层偏置
+            relus: 各层之后是否接ReLU
+            source_version: 生成该编码器的模型文件版本
+        """
+        if not (len(weights) == len(biases) == len(relus)) or not weights:
+            raise ValueError("编码器层参数数量不一致")
+        for i in range(1, len(weights)):
+            if weights[i].shape[0] != weights[i - 1].shape[1]:
+                raise ValueError(f"第{i + 1}层输入维度与上一层输出维度不一致")
+
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.relus = [bool(r) for r in relus]
+        self.source_version = source_version
+        self.input_dim = self.weights[0].shape[0]
+        self.output_dim = self.weights[-1].shape[1]
+
+        # 中间层输出缓冲区按线程分配，容量不足时按2倍扩容
+        self._local = threading.local()
+
+    @classmethod
+    def from_torch(cls, encoder, scaler, source_version: Optional[str] = None) -> 'FusedEncoder':
+        """
+        从torch编码器和StandardScaler生成融合编码器
+
+        编码器需为Linear/ReLU交替组成的前馈网络（如model_loader中的Encoder）。
+
+        Args:
+            encoder: torch编码器模型
+            scaler: sklearn StandardScaler
+            source_version: 模型文件版本
+
+        Returns:
+            FusedEncoder实例
+        """
+        weights, biases, relus = [], [], []
+        for module in encoder.modules():
+            if list(module.children()):
+                # 容器模块（Sequential、Encoder本身），其子模块会被依次遍历
+                continue
+            kind = type(module).__name__
+            if kind == 'Linear':
+                weights.append(module.weight.detach().cpu().numpy().astype(np.float64))
+                bias = module.bias.detach().cpu().numpy() if module.bias is not None else np.zeros(module.out_features)
+                biases.append(bias.astype(np.float64))
+                relus.append(False)
+            elif kind == 'ReLU':
+                if not relus or relus[-1]:
+                    raise ValueError("ReLU必须紧跟在Linear之后")
+                relus[-1] = True
+            elif kind not in ('Dropout', 'Identity'):
+                # 推理模式下Dropout/Identity不改变输入，其余层无法折叠
+                raise ValueError(f"不支持的编码器层: {kind}")
+        if not weights:
+            raise ValueError("编码器中没有Linear层")
+
+        # 折叠标准化：以float64计算后再转换为float32，减少舍入误差
+        n_features = weights[0].shape[1]
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+
+        first = weights[0] / scale[None, :]
+        biases[0] = biases[0] - first @ mean
+        weights[0] = first
+
+        return cls([w.T for w in weights], biases, relus, source_version)
+
+    def encode(self, vectors_35d: np.ndarray) -> np.ndarray:
+        """
+        批量编码
+
+        Args:
+            vectors_35d: (N, 35) 或 (35,) 输入向量
+
+        Returns:
+            (N, 128) float32矩阵（一维输入时返回(128,)向量）
+        """
+        x = np.asarray(vectors_35d, dtype=np.float32)
+        single = x.ndim == 1
+        if single:
+            x = x[None, :]
+        if x.shape[1] != self.input_dim:
+            raise ValueError(f"输入向量必须是{self.input_dim}维，当前维度: {x.shape[1]}")
+
+        n = x.shape[0]
+        buffers = self._buffers(n)
+        last = len(self.weights) - 1
+        for i, (weight, bias, relu) in enumerate(zip(self.weights, self.biases, self.relus)):
+            # 最后一层写入新数组，返回值不会被后续调用覆盖
+            out = np.empty((n, weight.shape[1]), dtype=np.float32) if i == last else buffers[i][:n]
+            np.matmul(x, weight, out=out)
+            out += bias
+            if relu:
+                np.maximum(out, 0.0, out=out)
+            x = out
+
+        return x[0] if single else x
+
+    def _buffers(self, n: int) -> List[np.ndarray]:
+        """获取当前线程的中间层缓冲区"""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[0].shape[0] < n:
+            capacity = max(n, 2 * buffers[0].shape[0] if buffers is not None else 64)
+            buffers = [np.empty((capacity, w.shape[1]), dtype=np.float32) for w in self.weights[:-1]]
+            self._local.buffers = buffers
+        return buffers
+
+    def verify(self, encoder, scaler, samples: int = 512, atol: float = 1e-4, seed: int = 0) -> float:
+        """
+        与torch路径（scaler.transform + encoder）比较数值结果
+
+        Args:
+            encoder: torch编码器模型
+            scaler: sklearn StandardScaler
+            samples: 随机样本数
+            atol: 允许的最大绝对误差
+            seed: 随机种子
+
+        Returns:
+            最大绝对误差
+
+        Raises:
+            ValueError: 误差超过atol
+        """
+        import torch
+
+        rng = np.random.default_rng(seed)
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        mean = np.zeros(self.input_dim) if mean is None else mean
+        scale = np.ones(self.input_dim) if scale is None else scale
+        # 在原始特征空间按训练数据的均值和标准差采样
+        inputs = (mean + scale * rng.normal(size=(samples, self.input_dim))).astype(np.float32)
+
+        with torch.no_grad():
+            expected = encoder(torch.FloatTensor(scaler.transform(inputs))).numpy()
+        actual = self.encode(inputs)
+
+        max_error = float(np.max(np.abs(actual - expected)))
+        if max_error > atol:
+            raise ValueError(f"融合编码器与torch编码器结果不一致，最大绝对误差 {max_error:.3e} > {atol:.1e}")
+        return max_error
+
+    def save(self, path: str):
+        """保存为npz文件"""
+        arrays = {}
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            arrays[f'weight_{i}'] = weight
+            arrays[f'bias_{i}'] = bias
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, relus=np.array(self.relus), source_version=np.array(self.source_version or ''), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FusedEncoder':
+        """从npz文件加载"""
+        with np.load(path, allow_pickle=False) as data:
+            relus = data['relus'].tolist()
+            weights = [data[f'weight_{i}'] for i in range(len(relus))]
+            biases = [data[f'bias_{i}'] for i in range(len(relus))]
+            source_version = str(data['source_version']) or None
+        return cls(weights, biases, relus, source_version)
+
+    def __repr__(self):
+        dims = [self.input_dim] + [w.shape[1] for w in self.weights]
+        return f"FusedEncoder({'→'.join(str(d) for d in dims)}, version={self.source_version})"
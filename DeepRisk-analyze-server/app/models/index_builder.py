@@ -0,0 +1,417 @@
+"""
+entity_vectors向量索引批量构建工具
+
+创建RediSearch索引结构，从CSV或MySQL流式读取实体35维特征，经model_loader编码器
+批量编码为128维向量后，以分块管道HSET写入Redis，并输出进度和吞吐量。
+
+用法:
+    python -m app.models.index_builder --source csv --csv-path data/entities.csv
+    python -m app.models.index_builder --source mysql --query "SELECT * FROM entity_feature_vectors"
+    python -m app.models.index_builder --source csv --csv-path data/entities.csv --algorithm FLAT --drop-existing
+    python -m app.models.index_builder --source csv --csv-path data/entities.csv --shards redis-a:6379,redis-b:6379
+
+数据源中存在business_type、tenant、activity_date列时一并写入，作为KNN预过滤属性。
+指定--shards（默认Config.VECTOR_INDEX_SHARDS）时在每个分片上创建索引，实体按entity_id一致性哈希写入所属分片。
+每次写入后INCR主Redis上的嵌入缓存版本号（emb_cache:generation），服务进程缓存的近邻结果随之失效。
+"""
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import Config
+from app.models.vector_search import TAG_ATTRIBUTES, NUMERIC_ATTRIBUTES, VECTOR_DTYPES, normalize_date, vector_dtype
+from app.models.embedding_cache import generation_key
+
+logger = logging.getLogger(__name__)
+
+# 每个数据块: (实体ID列表, 标签列表, (N, 35) 特征矩阵, {过滤属性字段: 取值列表})
+EntityChunk = Tuple[List[str], List[Optional[int]], np.ndarray, Dict[str, List]]
+
+# 数据源中的过滤属性列，列名与索引字段名相同
+ATTRIBUTE_COLUMNS = TAG_ATTRIBUTES + NUMERIC_ATTRIBUTES
+
+
+def create_index(redis_client, index_name: str = 'entity_vectors', key_prefix: str = 'entity:',
+                 algorithm: str = 'HNSW', dim: int = 128, metric: str = 'COSINE', m: int = 16,
+                 ef_construction: int = 200, ef_runtime: int = 10, vector_type: str = 'FLOAT32',
+                 drop_existing: bool = False):
+    """
+    创建entity_vectors索引
+
+    Args:
+        redis_client: Redis客户端
+        index_name: 索引名
+        key_prefix: 实体哈希键前缀
+        algorithm: HNSW 或 FLAT
+        dim: 向量维度
+        metric: COSINE / L2 / IP
+        m: HNSW每层最大出边数
+        ef_construction: HNSW构建时的候选列表大小
+        ef_runtime: HNSW查询时默认的候选列表大小
+        vector_type: 向量存储类型，FLOAT32或FLOAT16
+        drop_existing: 索引已存在时是否删除重建（不删除已有哈希数据）
+    """
+    algorithm = algorithm.upper()
+    if algorithm not in ('HNSW', 'FLAT'):
+        raise ValueError(f"不支持的索引算法: {algorithm}")
+    vector_type = vector_type.upper()
+    vector_dtype(vector_type)
+
+    if drop_existing:
+        try:
+            redis_client.execute_command('FT.DROPINDEX', index_name)
+            print(f"[索引] 已删除旧索引: {index_name}")
+        except Exception as e:
+            logger.info(f"删除旧索引跳过: {e}")
+
+    vector_params = ['TYPE', vector_type, 'DIM', str(dim), 'DISTANCE_METRIC', metric.upper()]
+    if algorithm == 'HNSW':
+        vector_params += ['M', str(m), 'EF_CONSTRUCTION', str(ef_construction), 'EF_RUNTIME', str(ef_runtime)]
+
+    redis_client.execute_command(
+        'FT.CREATE', index_name,
+        'ON', 'HASH',
+        'PREFIX', '1', key_prefix,
+        'SCHEMA',
+        'entity_id', 'TAG',
+        'label', 'NUMERIC',
+        'business_type', 'TAG',
+        'tenant', 'TAG',
+        'activity_date', 'NUMERIC',
+        'vector', 'VECTOR', algorithm, str(len(vector_params)), *vector_params
+    )
+    print(f"[索引] 索引创建成功: {index_name} ({algorithm}, {metric}, {vector_type}, DIM={dim})")
+
+
+def write_entity_vectors(redis_client, entity_ids: List[str], vectors_128d: np.ndarray,
+                         labels: Optional[List[Optional[int]]] = None, key_prefix: str = 'entity:',
+                         pipeline_size: int = 1000, vector_dtype=np.float32,
+                         attributes: Optional[Dict[str, List]] = None,
+                         cache_generation_key: Optional[str] = generation_key()) -> int:
+    """
+    以分块管道HSET写入实体向量，写入后INCR嵌入缓存版本号
+
+    Args:
+        redis_client: 不解码响应的Redis客户端
+        entity_ids: 实体ID列表
+        vectors_128d: (N, 128) 向量矩阵
+        labels: 标签列表，None表示无标签（不写入label字段）
+        key_prefix: 实体哈希键前缀
+        pipeline_size: 每次管道提交的HSET数量
+        vector_dtype: 向量存储类型，需与索引的TYPE一致
+        attributes: 过滤属性 {字段名: 取值列表}，空值不写入；activity_date写为YYYYMMDD整数
+        cache_generation_key: 嵌入缓存共享版本号的键，为None时不更新
+
+    Returns:
+        写入的实体数量
+    """
+    vectors = np.ascontiguousarray(np.asarray(vectors_128d, dtype=vector_dtype))
+    written = 0
+
+    for start in range(0, len(entity_ids), pipeline_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for i in range(start, min(start + pipeline_size, len(entity_ids))):
+            mapping = {'entity_id': entity_ids[i], 'vector': vectors[i].tobytes()}
+            if labels is not None and labels[i] is not None:
+                mapping['label'] = int(labels[i])
+            for field, values in (attributes or {}).items():
+                value = values[i]
+                if field in NUMERIC_ATTRIBUTES:
+                    value = normalize_date(value)
+                if value is not None and value != '':
+                    mapping[field] = value
+            pipe.hset(f"{key_prefix}{entity_ids[i]}", mapping=mapping)
+        written += len(pipe.execute())
+
+    if written and cache_generation_key:
+        redis_client.incr(cache_generation_key)
+    return written
+
+
+def write_sharded_entity_vectors(redis_clients: List, ring, entity_ids: List[str], vectors_128d: np.ndarray,
+                                 labels: Optional[List[Optional[int]]] = None, key_prefix: str = 'entity:',
+                                 pipeline_size: int = 1000, vector_dtype=np.float32,
+                                 attributes: Optional[Dict[str, List]] = None,
+                                 cache_generation_key: Optional[str] = generation_key(),
+                                 generation_client=None) -> int:
+    """
+    按一致性哈希将实体写入所属分片，全部分片写完后INCR一次嵌入缓存版本号
+
+    Args:
+        redis_clients: 各分片的Redis客户端，与ring的分片顺序一致
+        ring: ConsistentHashRing
+        generation_client: 保存嵌入缓存版本号的Redis客户端（服务使用的主Redis），为None时不更新
+        其余参数: 见write_entity_vectors
+
+    Returns:
+        写入的实体数量
+    """
+    written = 0
+    for redis_client, indices in zip(redis_clients, ring.partition(entity_ids)):
+        if not indices:
+            continue
+        written += write_entity_vectors(
+            redis_client,
+            [entity_ids[i] for i in indices],
+            np.asarray(vectors_128d)[indices],
+            [labels[i] for i in indices] if labels is not None else None,
+            key_prefix, pipeline_size, vector_dtype,
+            {field: [values[i] for i in indices] for field, values in (attributes or {}).items()},
+            cache_generation_key=None
+        )
+    if written and cache_generation_key and generation_client is not None:
+        generation_client.incr(cache_generation_key)
+    return written
+
+
+def _split_row_columns(columns: List[str], id_column: str, label_column: Optional[str],
+                       feature_columns: Optional[List[str]]) -> List[str]:
+    """确定特征列：未指定时使用除ID列和标签列之外的全部列"""
+    if feature_columns:
+        return feature_columns
+    excluded = {id_column.lower()} | set(ATTRIBUTE_COLUMNS)
+    if label_column:
+        excluded.add(label_column.lower())
+    return [column for column in columns if column.lower() not in excluded]
+
+
+def _parse_labels(values) -> List[Optional[int]]:
+    """解析标签列，空值视为无标签"""
+    labels = []
+    for value in values:
+        try:
+            labels.append(None if value is None or value != value else int(value))
+        except (ValueError, TypeError):
+            labels.append(None)
+    return labels
+
+
+def iter_csv(path: str, id_column: str = 'entity_id', label_column: Optional[str] = 'label',
+             feature_columns: Optional[List[str]] = None, chunk_size: int = 10000) -> Iterator[EntityChunk]:
+    """
+    从CSV流式读取实体特征
+
+    Args:
+        path: CSV文件路径
+        id_column: 实体ID列
+        label_column: 标签列，为None或列不存在时无标签
+        feature_columns: 特征列，默认除ID列和标签列之外的全部列
+        chunk_size: 每块读取的行数
+    """
+    import pandas as pd
+
+    for frame in pd.read_csv(path, chunksize=chunk_size):
+        columns = _split_row_columns(list(frame.columns), id_column, label_column, feature_columns)
+        features = np.nan_to_num(frame[columns].to_numpy(dtype=np.float32), nan=0.0)
+        labels = _parse_labels(frame[label_column].tolist()) if label_column in frame.columns else [None] * len(frame)
+        attributes = {
+            column: [None if value != value else value for value in frame[column].tolist()]
+            for column in ATTRIBUTE_COLUMNS if column in frame.columns
+        }
+        yield frame[id_column].astype(str).tolist(), labels, features, attributes
+
+
+def iter_mysql(query: str, id_column: str = 'entity_id', label_column: Optional[str] = 'label',
+               feature_columns: Optional[List[str]] = None, chunk_size: int = 10000) -> Iterator[EntityChunk]:
+    """
+    从MySQL流式读取实体特征
+
+    使用非缓冲游标逐块fetchmany，不会把整张表读入内存。
+
+    Args:
+        query: 查询语句，结果需包含ID列、特征列和可选的标签列
+        其余参数同iter_csv
+    """
+    import mysql.connector
+
+    conn = mysql.connector.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB,
+        port=Config.MYSQL_PORT
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        columns = [desc[0] for desc in cursor.description]
+        lower_columns = [column.lower() for column in columns]
+        feature_names = _split_row_columns(columns, id_column, label_column, feature_columns)
+        id_index = lower_columns.index(id_column.lower())
+        label_index = lower_columns.index(label_column.lower()) if label_column and label_column.lower() in lower_columns else None
+        feature_indices = [lower_columns.index(name.lower()) for name in feature_names]
+        attribute_indices = {
+            column: lower_columns.index(column) for column in ATTRIBUTE_COLUMNS if column in lower_columns
+        }
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            entity_ids = [str(row[id_index]) for row in rows]
+            labels = _parse_labels([row[label_index] for row in rows]) if label_index is not None else [None] * len(rows)
+            features = np.array(
+                [[float(row[i] or 0) for i in feature_indices] for row in rows],
+                dtype=np.float32
+            )
+            attributes = {column: [row[index] for row in rows] for column, index in attribute_indices.items()}
+            yield entity_ids, labels, features, attributes
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def build_index(chunks: Iterator[EntityChunk], redis_client, key_prefix: str = 'entity:',
+                pipeline_size: int = 1000, vector_dtype=np.float32, report_every: int = 100000,
+                ring=None, cache_generation_key: Optional[str] = generation_key(), generation_client=None) -> int:
+    """
+    编码并写入全部实体
+
+    编码当前块的同时在后台线程写入上一块，CPU编码与Redis写入重叠执行。
+
+    Args:
+        chunks: 实体数据块迭代器
+        redis_client: 不解码响应的Redis客户端；指定ring时为各分片的Redis客户端列表
+        key_prefix: 实体哈希键前缀
+        pipeline_size: 每次管道提交的HSET数量
+        vector_dtype: 向量存储类型
+        report_every: 每写入多少实体输出一次进度
+        ring: 分片的ConsistentHashRing，为None时不分片
+        cache_generation_key: 嵌入缓存共享版本号的键，每块写入后INCR，为None时不更新
+        generation_client: 分片写入时保存版本号的主Redis客户端
+
+    Returns:
+        写入的实体总数
+    """
+    from app.models.model_loader import encode_vectors
+
+    total = 0
+    next_report = report_every
+    start_time = time.time()
+    pending = None
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for entity_ids, labels, features, attributes in chunks:
+            if features.shape[1] != 35:
+                raise ValueError(f"特征维度必须是35，当前维度: {features.shape[1]}")
+
+            vectors_128d = encode_vectors(features)
+            if vectors_128d is None:
+                raise RuntimeError("编码器未加载，无法构建索引")
+
+            # 等待上一块写完再提交，最多只有一块在途，内存占用有界
+            if pending is not None:
+                total += pending.result()
+            if ring is None:
+                pending = writer.submit(write_entity_vectors, redis_client, entity_ids, vectors_128d, labels,
+                                        key_prefix, pipeline_size, vector_dtype, attributes, cache_generation_key)
+            else:
+                pending = writer.submit(write_sharded_entity_vectors, redis_client, ring, entity_ids, vectors_128d,
+                                        labels, key_prefix, pipeline_size, vector_dtype, attributes,
+                                        cache_generation_key, generation_client)
+
+            if total >= next_report:
+                elapsed = time.time() - start_time
+                print(f"[索引] 已写入 {total} 个实体, 耗时 {elapsed:.1f}s, 吞吐 {total / max(elapsed, 1e-6):.0f} 条/秒")
+                next_report = (total // report_every + 1) * report_every
+
+        if pending is not None:
+            total += pending.result()
+
+    elapsed = time.time() - start_time
+    print(f"[索引] 写入完成: {total} 个实体, 耗时 {elapsed:.1f}s, 吞吐 {total / max(elapsed, 1e-6):.0f} 条/秒")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量构建entity_vectors向量索引")
+    parser.add_argument('--source', choices=['csv', 'mysql'], required=True, help="实体数据来源")
+    parser.add_argument('--csv-path', help="CSV文件路径（source=csv）")
+    parser.add_argument('--query', help="查询语句（source=mysql）")
+    parser.add_argument('--id-column', default='entity_id', help="实体ID列")
+    parser.add_argument('--label-column', default='label', help="标签列，不存在时无标签")
+    parser.add_argument('--feature-columns', help="逗号分隔的特征列，默认除ID列和标签列之外的全部列")
+    parser.add_argument('--index-name', default=Config.VECTOR_INDEX_NAME, help="索引名")
+    parser.add_argument('--key-prefix', default=Config.VECTOR_KEY_PREFIX, help="实体哈希键前缀")
+    parser.add_argument('--algorithm', choices=['HNSW', 'FLAT'], default='HNSW', help="索引算法")
+    parser.add_argument('--metric', choices=['COSINE', 'L2', 'IP'], default='COSINE', help="距离度量")
+    parser.add_argument('--vector-type', choices=list(VECTOR_DTYPES), default=Config.VECTOR_STORAGE_DTYPE,
+                        help="向量存储类型，需与服务端VECTOR_STORAGE_DTYPE一致")
+    parser.add_argument('--m', type=int, default=16, help="HNSW参数M")
+    parser.add_argument('--ef-construction', type=int, default=200, help="HNSW参数EF_CONSTRUCTION")
+    parser.add_argument('--ef-runtime', type=int, default=10, help="HNSW参数EF_RUNTIME")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="每次读取和编码的实体数")
+    parser.add_argument('--pipeline-size', type=int, default=1000, help="每次管道提交的HSET数量")
+    parser.add_argument('--drop-existing', action='store_true', help="删除并重建已有索引")
+    parser.add_argument('--skip-create', action='store_true', help="不创建索引，只写入数据")
+    parser.add_argument('--redis-host', default=Config.REDIS_HOST, help="Redis主机")
+    parser.add_argument('--redis-port', type=int, default=Config.REDIS_PORT, help="Redis端口")
+    parser.add_argument('--shards', default=','.join(Config.VECTOR_INDEX_SHARDS),
+                        help="逗号分隔的分片地址host:port，指定时忽略--redis-host/--redis-port")
+    parser.add_argument('--vnodes', type=int, default=Config.VECTOR_SHARD_VNODES, help="一致性哈希每个分片的虚拟节点数")
+    parser.add_argument('--cache-generation-key', default=generation_key(),
+                        help="写入后INCR的嵌入缓存版本号键（分片时写在--redis-host上），空字符串表示不更新")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    feature_columns = args.feature_columns.split(',') if args.feature_columns else None
+    if args.source == 'csv':
+        if not args.csv_path:
+            parser.error("source=csv时必须指定--csv-path")
+        chunks = iter_csv(args.csv_path, args.id_column, args.label_column, feature_columns, args.chunk_size)
+    else:
+        if not args.query:
+            parser.error("source=mysql时必须指定--query")
+        chunks = iter_mysql(args.query, args.id_column, args.label_column, feature_columns, args.chunk_size)
+
+    from app.models.model_loader import load_models
+    from app.redis_pool import get_redis_client
+
+    load_models()
+
+    ring = None
+    shard_specs = [spec.strip() for spec in args.shards.split(',') if spec.strip()]
+    if shard_specs:
+        from app.models.sharded_search import ConsistentHashRing, parse_shard_address
+
+        ring = ConsistentHashRing(shard_specs, args.vnodes)
+        redis_clients = []
+        for spec in shard_specs:
+            host, port = parse_shard_address(spec)
+            redis_clients.append(get_redis_client(decode_responses=False, host=host, port=port, db=0))
+        print(f"[索引] 分片写入: {', '.join(shard_specs)}")
+    else:
+        redis_clients = [get_redis_client(decode_responses=False, host=args.redis_host, port=args.redis_port, db=0)]
+
+    if not args.skip_create:
+        for redis_client in redis_clients:
+            create_index(
+                redis_client,
+                index_name=args.index_name,
+                key_prefix=args.key_prefix,
+                algorithm=args.algorithm,
+                metric=args.metric,
+                m=args.m,
+                ef_construction=args.ef_construction,
+                ef_runtime=args.ef_runtime,
+                vector_type=args.vector_type,
+                drop_existing=args.drop_existing
+            )
+
+    generation_client = None
+    if ring is not None and args.cache_generation_key:
+        generation_client = get_redis_client(decode_responses=False, host=args.redis_host, port=args.redis_port, db=0)
+
+    build_index(chunks, redis_clients if ring is not None else redis_clients[0], key_prefix=args.key_prefix,
+                pipeline_size=args.pipeline_size, vector_dtype=vector_dtype(args.vector_type), ring=ring,
+                cache_generation_key=args.cache_generation_key or None, generation_client=generation_client)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
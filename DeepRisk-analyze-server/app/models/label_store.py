@@ -0,0 +1,280 @@
+import json
+import time
+import logging
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 标签数组中表示“无标签”的取值
+UNKNOWN_LABEL = -1
+
+
+def _to_str(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+class LabelStore:
+    """
+    进程内的实体标签表
+
+    实体ID经驻留表（entity_id -> 下标）映射到一个紧凑的int8数组，标签为-1表示无标签。
+    启动时在后台线程中SCAN实体哈希批量加载，之后通过两种方式保持更新：
+    - 键空间通知：订阅实体键的hset/del/expired等事件，批量HGET变化实体的label字段
+      （需要Redis开启notify-keyspace-events，如'Kgh'）
+    - 更新频道：标签变更方直接发布{"entity_id": ..., "label": ...}（或其列表），无需回查Redis
+    订阅断开期间可能丢失更新，重新订阅后整体重新加载一次，并按refresh_seconds定期全量刷新。
+
+    加载完成后RediSearchBackend的KNN查询只返回similarity_score，实体ID取自文档键，标签在本地查表。
+    """
+
+    def __init__(self, redis_clients: List, key_prefix: str = 'entity:', channel: Optional[str] = None,
+                 keyspace_events: bool = True, refresh_seconds: float = 3600, scan_count: int = 1000,
+                 initial_capacity: int = 1024, on_change: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            redis_clients: 不解码响应的Redis客户端列表（分片时为各分片节点）
+            key_prefix: 实体哈希键前缀
+            channel: 标签更新频道，为None时不订阅
+            keyspace_events: 是否订阅实体键的键空间通知
+            refresh_seconds: 全量重新加载的间隔（秒），小于等于0时只在启动和重新订阅时加载
+            scan_count: 每次SCAN的数量，同时作为HMGET管道的批大小
+            initial_capacity: 标签数组的初始容量
+            on_change: 有标签取值变化时调用（如使缓存的近邻结果失效），每次批量写入最多一次
+        """
+        self.redis_clients = [client for client in redis_clients if client is not None]
+        self.key_prefix = key_prefix
+        self.channel = channel
+        self.keyspace_events = keyspace_events
+        self.refresh_seconds = float(refresh_seconds)
+        self.scan_count = scan_count
+        self.on_change = on_change
+
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._labels = np.full(max(int(initial_capacity), 1), UNKNOWN_LABEL, dtype=np.int8)
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._stats = {
+            'loads': 0,
+            'updates': 0,
+            'changes': 0,
+            'deletes': 0,
+            'misses': 0,
+            'errors': 0,
+            'last_load_seconds': 0.0
+        }
+
+    def is_ready(self) -> bool:
+        """首次全量加载是否完成"""
+        return self._ready.is_set()
+
+    def start(self):
+        """启动后台线程：先订阅更新，再全量加载，避免加载期间的变更丢失"""
+        for client in self.redis_clients:
+            if self.channel or self.keyspace_events:
+                threading.Thread(target=self._listen, args=(client,), name='label-store-listener',
+                                 daemon=True).start()
+        threading.Thread(target=self._refresh_loop, name='label-store-loader', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def get(self, entity_id: str) -> Optional[int]:
+        """
+        查询实体标签
+
+        Returns:
+            标签，实体不存在或无标签时为None
+        """
+        index = self._ids.get(entity_id)
+        if index is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        label = int(self._labels[index])
+        return None if label == UNKNOWN_LABEL else label
+
+    def set(self, entity_id: str, label: Optional[int]):
+        """设置单个实体的标签"""
+        self.set_many([entity_id], [label])
+
+    def set_many(self, entity_ids: List[str], labels: List[Optional[int]]):
+        """
+        批量设置标签，None表示无标签
+
+        与已有取值相同的标签不算变更（全量刷新和hset事件大多如此），至少一个标签变化时才调用一次on_change。
+        """
+        changed = 0
+        with self._lock:
+            for entity_id, label in zip(entity_ids, labels):
+                value = UNKNOWN_LABEL if label is None else label
+                index = self._ids.get(entity_id)
+                if index is None:
+                    index = len(self._ids)
+                    if index >= len(self._labels):
+                        # 容量按倍数扩展
+                        grown = np.full(len(self._labels) * 2, UNKNOWN_LABEL, dtype=np.int8)
+                        grown[:len(self._labels)] = self._labels
+                        self._labels = grown
+                    self._ids[entity_id] = index
+                if self._labels[index] != value:
+                    self._labels[index] = value
+                    changed += 1
+            self._stats['updates'] += len(entity_ids)
+            self._stats['changes'] += changed
+
+        if self.on_change is not None and changed:
+            try:
+                self.on_change()
+            except Exception as e:
+                logger.warning(f"标签变更回调失败: {e}")
+
+    def load(self) -> int:
+        """
+        SCAN全部实体哈希，批量读取label字段
+
+        Returns:
+            加载的实体数量
+        """
+        start = time.perf_counter()
+        count = 0
+        for client in self.redis_clients:
+            keys = []
+            for key in client.scan_iter(match=f"{self.key_prefix}*", count=self.scan_count):
+                keys.append(key)
+                if len(keys) >= self.scan_count:
+                    count += self._load_keys(client, keys)
+                    keys = []
+            if keys:
+                count += self._load_keys(client, keys)
+
+        with self._lock:
+            self._stats['loads'] += 1
+            self._stats['last_load_seconds'] = round(time.perf_counter() - start, 3)
+        self._ready.set()
+        logger.info(f"标签表加载了{count}个实体，耗时{time.perf_counter() - start:.2f}秒")
+        return count
+
+    def _load_keys(self, client, keys) -> int:
+        """通过一次管道读取一组实体的label字段"""
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hget(key, 'label')
+        entity_ids, labels = [], []
+        for key, label in zip(keys, pipe.execute()):
+            entity_ids.append(self._entity_id(key))
+            labels.append(self._parse_label(label))
+        self.set_many(entity_ids, labels)
+        return len(entity_ids)
+
+    def _entity_id(self, key) -> str:
+        key = _to_str(key)
+        return key[len(self.key_prefix):] if key.startswith(self.key_prefix) else key
+
+    @staticmethod
+    def _parse_label(value) -> Optional[int]:
+        try:
+            return int(value) if value is not None else None
+        except (ValueError, TypeError):
+            return None
+
+    def _refresh_loop(self):
+        """启动时全量加载，之后按refresh_seconds定期刷新"""
+        while not self._stopped.is_set():
+            try:
+                self.load()
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                logger.error(f"加载标签表失败: {e}")
+                self._stopped.wait(30)
+                continue
+            if self.refresh_seconds <= 0:
+                return
+            self._stopped.wait(self.refresh_seconds)
+
+    def _listen(self, client):
+        """订阅键空间通知和更新频道，断开后重新订阅并全量加载"""
+        db = client.connection_pool.connection_kwargs.get('db', 0)
+        pattern = f"__keyspace@{db}__:{self.key_prefix}*"
+        reconnect = False
+
+        while not self._stopped.is_set():
+            pubsub = None
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                if self.keyspace_events:
+                    pubsub.psubscribe(pattern)
+                if self.channel:
+                    pubsub.subscribe(self.channel)
+                if reconnect:
+                    self.load()
+
+                while not self._stopped.is_set():
+                    changed = []
+                    message = pubsub.get_message(timeout=1.0)
+                    while message is not None:
+                        self._handle_message(message, changed)
+                        message = pubsub.get_message(timeout=0)
+                    if changed:
+                        self._load_keys(client, changed)
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                logger.warning(f"标签更新订阅中断: {e}")
+                reconnect = True
+                self._stopped.wait(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _handle_message(self, message: Dict, changed: List):
+        """
+        处理一条订阅消息
+
+        Args:
+            message: pubsub消息
+            changed: 需要回查label字段的实体键（原地追加）
+        """
+        channel = _to_str(message.get('channel'))
+        data = message.get('data')
+
+        if message.get('type') == 'pmessage':
+            # 键空间通知：频道为__keyspace@db__:键名，数据为事件名
+            key = channel.split(':', 1)[1]
+            event = _to_str(data)
+            if event in ('del', 'expired', 'evicted'):
+                self.set(self._entity_id(key), None)
+                with self._lock:
+                    self._stats['deletes'] += 1
+            elif event.startswith('h'):
+                changed.append(key)
+            return
+
+        try:
+            payload = json.loads(data)
+            for item in payload if isinstance(payload, list) else [payload]:
+                self.set(str(item['entity_id']), self._parse_label(item.get('label')))
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            logger.warning(f"解析标签更新消息失败: {e}")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'ready': self._ready.is_set(),
+                'entities': len(self._ids),
+                'labeled': int(np.count_nonzero(self._labels[:len(self._ids)] != UNKNOWN_LABEL)),
+                'label_bytes': int(self._labels.nbytes),
+                'channel': self.channel,
+                'keyspace_events': self.keyspace_events
+            })
+        return stats
@@ -1,8 +1,10 @@
 import os
 import pickle
-import torch
+import hashlib
+import numpy as np
 import logging
-from sklearn.preprocessing import StandardScaler
+from app.config import Config
+from app.models.fused_encoder import FusedEncoder
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -16,11 +18,13 @@ _loaded_models = {}
 _encoder = None
 _scaler = None
 _thresholds = {}
+_model_version = None  # 编码器模型版本（编码器与标准化器文件内容哈希）
+_fused_encoder = None  # 折叠了标准化参数的纯NumPy编码器
 models_loaded = False  # 添加模型加载状态标志
 
 def load_models():
     """加载所有深度学习模型"""
-    global _loaded_models, _encoder, _scaler, _thresholds, models_loaded
+    global _loaded_models, _encoder, _scaler, _thresholds, _model_version, _fused_encoder, models_loaded
     
     logger.info("加载深度学习模型...")
     print("[模型] 开始加载深度学习模型...")
@@ -29,71 +33,24 @@ def load_models():
         # 加载编码器模型和标准化器
         encoder_path = os.path.join(MODEL_DIR, 'encoder_35_to_128.pkl')
         scaler_path = os.path.join(MODEL_DIR, 'encoder_35_to_128_scaler.pkl')
+        fused_path = os.path.join(MODEL_DIR, 'encoder_35_to_128_fused.npz')
         
         print(f"[模型] 编码器模型路径: {encoder_path}")
         print(f"[模型] 标准化器路径: {scaler_path}")
         
-        if os.path.exists(encoder_path):
-            print("[模型] 开始加载编码器模型...")
-            loaded_obj = torch.load(encoder_path, map_location='cpu')
-            print(f"[模型] 加载的对象类型: {type(loaded_obj)}")
-            
-            # 检查是否是OrderedDict（状态字典），如果是则需要创建模型实例并加载状态
-            if isinstance(loaded_obj, dict) or str(type(loaded_obj)) == "<class 'collections.OrderedDict'>":
-                print("[模型] 检测到状态字典，需要创建模型实例")
-                try:
-                    # 导入正确的模型结构
-                    from torch import nn
-                    
-                    # 定义编码器模型结构（与训练时保持一致）
-                    class Encoder(nn.Module):
-                        """编码器网络：将35维数据映射到128维"""
-                        def __init__(self, input_dim=35, hidden_dim=64, latent_dim=128):
-                            super(Encoder, self).__init__()
-                            
-                            self.encoder = nn.Sequential(
-                                nn.Linear(input_dim, hidden_dim),
-                                nn.ReLU(),
-                                nn.Linear(hidden_dim, hidden_dim*2),
-                                nn.ReLU(),
-                                nn.Linear(hidden_dim*2, latent_dim),
-                                nn.ReLU()
-                            )
-                            
-                        def forward(self, x):
-                            return self.encoder(x)
-                    
-                    # 创建模型实例并加载状态字典
-                    _encoder = Encoder()
-                    _encoder.load_state_dict(loaded_obj)
-                    _encoder.eval()  # 设置为评估模式
-                    print("[模型] 成功从状态字典创建模型实例")
-                except Exception as e:
-                    print(f"[模型] 从状态字典创建模型实例失败: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    _encoder = loaded_obj  # 回退到原始对象
-            else:
-                _encoder = loaded_obj
-                print("[模型] 直接使用加载的对象作为模型")
-            
-            print(f"[模型] 编码器模型加载成功: {_encoder}")
-            logger.info("编码器模型加载成功")
-        else:
-            print(f"[模型] 编码器模型文件不存在: {encoder_path}")
-            logger.warning(f"编码器模型文件不存在: {encoder_path}")
-            
-        if os.path.exists(scaler_path):
-            print("[模型] 开始加载标准化器...")
-            with open(scaler_path, 'rb') as f:
-                _scaler = pickle.load(f)
-            print(f"[模型] 标准化器加载成功: {_scaler}")
-            logger.info("编码器标准化器加载成功")
-        else:
-            print(f"[模型] 编码器标准化器文件不存在: {scaler_path}")
-            logger.warning(f"编码器标准化器文件不存在: {scaler_path}")
+        # 模型版本随编码器文件内容变化，依赖编码结果的缓存以此失效
+        _model_version = _compute_model_version([encoder_path, scaler_path])
+        print(f"[模型] 编码器模型版本: {_model_version}")
+        
+        # 融合编码器文件与当前模型版本一致时直接加载，不需要导入torch
+        _fused_encoder = None
+        if Config.ENCODER_BACKEND == 'fused':
+            _fused_encoder = _load_fused_encoder(fused_path, _model_version)
         
-        print(f"[模型] 当前编码器: {_encoder}, 当前标准化器: {_scaler}")
+        if _fused_encoder is None:
+            _load_torch_encoder(encoder_path, scaler_path)
+            if Config.ENCODER_BACKEND == 'fused':
+                _fused_encoder = _compile_fused_encoder(fused_path, _model_version)
         
         # 加载费用异常检测模型
         try:
@@ -124,14 +81,169 @@ def load_models():
         logger.error(f"加载模型时出错: {e}", exc_info=True)
         print(f"[模型] 加载模型时出错: {e}")
 
+def _load_torch_encoder(encoder_path, scaler_path):
+    """加载torch编码器模型和标准化器"""
+    global _encoder, _scaler
+    import torch
+    
+    if os.path.exists(encoder_path):
+        print("[模型] 开始加载编码器模型...")
+        loaded_obj = torch.load(encoder_path, map_location='cpu')
+        print(f"[模型] 加载的对象类型: {type(loaded_obj)}")
+        
+        # 检查是否是OrderedDict（状态字典），如果是则需要创建模型实例并加载状态
+        if isinstance(loaded_obj, dict) or str(type(loaded_obj)) == "<class 'collections.OrderedDict'>":
+            print("[模型] 检测到状态字典，需要创建模型实例")
+            try:
+                # 导入正确的模型结构
+                from torch import nn
+                
+                # 定义编码器模型结构（与训练时保持一致）
+                class Encoder(nn.Module):
+                    """编码器网络：将35维数据映射到128维"""
+                    def __init__(self, input_dim=35, hidden_dim=64, latent_dim=128):
+                        super(Encoder, self).__init__()
+                        
+                        self.encoder = nn.Sequential(
+                            nn.Linear(input_dim, hidden_dim),
+                            nn.ReLU(),
+                            nn.Linear(hidden_dim, hidden_dim*2),
+                            nn.ReLU(),
+                            nn.Linear(hidden_dim*2, latent_dim),
+                            nn.ReLU()
+                        )
+                        
+                    def forward(self, x):
+                        return self.encoder(x)
+                
+                # 创建模型实例并加载状态字典
+                _encoder = Encoder()
+                _encoder.load_state_dict(loaded_obj)
+                _encoder.eval()  # 设置为评估模式
+                print("[模型] 成功从状态字典创建模型实例")
+            except Exception as e:
+                print(f"[模型] 从状态字典创建模型实例失败: {e}")
+                import traceback
+                traceback.print_exc()
+                _encoder = loaded_obj  # 回退到原始对象
+        else:
+            _encoder = loaded_obj
+            print("[模型] 直接使用加载的对象作为模型")
+        
+        print(f"[模型] 编码器模型加载成功: {_encoder}")
+        logger.info("编码器模型加载成功")
+    else:
+        print(f"[模型] 编码器模型文件不存在: {encoder_path}")
+        logger.warning(f"编码器模型文件不存在: {encoder_path}")
+        
+    if os.path.exists(scaler_path):
+        print("[模型] 开始加载标准化器...")
+        with open(scaler_path, 'rb') as f:
+            _scaler = pickle.load(f)
+        print(f"[模型] 标准化器加载成功: {_scaler}")
+        logger.info("编码器标准化器加载成功")
+    else:
+        print(f"[模型] 编码器标准化器文件不存在: {scaler_path}")
+        logger.warning(f"编码器标准化器文件不存在: {scaler_path}")
+    
+    print(f"[模型] 当前编码器: {_encoder}, 当前标准化器: {_scaler}")
+
+def _load_fused_encoder(fused_path, model_version):
+    """加载与当前模型版本一致的融合编码器，不存在或版本不一致时返回None"""
+    if not os.path.exists(fused_path):
+        return None
+    try:
+        fused = FusedEncoder.load(fused_path)
+    except Exception as e:
+        logger.warning(f"加载融合编码器失败: {e}")
+        return None
+    if fused.source_version != model_version:
+        print(f"[模型] 融合编码器版本({fused.source_version})与模型版本不一致，重新生成")
+        return None
+    print(f"[模型] 融合编码器加载成功: {fused}")
+    logger.info("融合编码器加载成功")
+    return fused
+
+def _compile_fused_encoder(fused_path, model_version):
+    """从torch编码器生成融合编码器并与torch路径核对数值，失败时返回None（继续使用torch路径）"""
+    if _encoder is None or _scaler is None:
+        return None
+    try:
+        fused = FusedEncoder.from_torch(_encoder, _scaler, source_version=model_version)
+        max_error = fused.verify(_encoder, _scaler, atol=Config.ENCODER_FUSED_ATOL)
+    except Exception as e:
+        logger.warning(f"生成融合编码器失败，使用torch推理: {e}")
+        print(f"[模型] 生成融合编码器失败，使用torch推理: {e}")
+        return None
+    print(f"[模型] 融合编码器生成成功: {fused}, 最大绝对误差: {max_error:.2e}")
+    logger.info(f"融合编码器生成成功，最大绝对误差: {max_error:.2e}")
+    try:
+        fused.save(fused_path)
+    except OSError as e:
+        # 模型目录只读时每次启动重新生成
+        logger.warning(f"保存融合编码器失败: {e}")
+    return fused
+
+def _compute_model_version(paths):
+    """根据模型文件内容计算版本号"""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def get_model_version():
+    """获取编码器模型版本"""
+    global _model_version
+    return _model_version or 'unversioned'
+
+def get_fused_encoder():
+    """获取融合编码器，未启用或生成失败时返回None"""
+    global _fused_encoder
+    return _fused_encoder
+
 def get_encoder():
-    """获取编码器模型和标准化器"""
+    """
+    获取编码器模型和标准化器
+
+    融合编码器文件与模型版本一致、直接加载时不会导入torch，也不加载编码器和标准化器，此时返回(None, None)，
+    编码应通过encode_vectors（或get_fused_encoder）完成。
+    """
     global _encoder, _scaler
     # 只在调试模式下打印详细日志
     if os.environ.get('DEBUG', '').lower() in ('1', 'true'):
         print(f"[模型] 获取编码器: encoder={_encoder is not None}, scaler={_scaler is not None}")
     return _encoder, _scaler
 
+def encode_vectors(vectors_35d):
+    """
+    批量将35维向量编码为128维向量
+    
+    优先使用融合编码器（纯NumPy），未启用时回退到scaler.transform + torch编码器。
+    
+    Args:
+        vectors_35d: (N, 35) 向量矩阵
+        
+    Returns:
+        (N, 128) float32矩阵，编码器未加载时返回None
+    """
+    fused = get_fused_encoder()
+    if fused is not None:
+        return fused.encode(vectors_35d)
+    
+    encoder, scaler = get_encoder()
+    if encoder is None or scaler is None:
+        logger.error("编码器或标准化器未加载")
+        return None
+    
+    import torch
+    vectors_scaled = scaler.transform(np.asarray(vectors_35d, dtype=np.float32))
+    with torch.no_grad():
+        vectors_128d = encoder(torch.FloatTensor(vectors_scaled))
+    return vectors_128d.numpy().astype(np.float32)
+
 def get_models():
     """获取所有加载的模型"""
     global _loaded_models
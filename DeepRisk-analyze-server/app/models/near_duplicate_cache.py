@@ -0,0 +1,255 @@
+import time
+import random
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class NearDuplicateCache:
+    """
+    近重复向量的近邻结果缓存（局部敏感哈希）
+
+    128维编码向量归一化后与num_bits个随机超平面求符号，得到LSH签名作为桶键；
+    新向量落入同一个桶且与桶内某个缓存向量的余弦距离不超过tolerance时，直接复用其近邻列表，跳过相似度查询。
+    同一批次内的近重复向量只查询第一条，其余复用该条的查询结果。
+
+    复用的近邻列表是近似结果，按verify_rate抽样命中仍执行查询，统计复用结果与真实结果的
+    Top-k重合率和平均距离偏差，用于评估tolerance是否合适。
+
+    编码器模型版本变化时整体清空（签名基于128维嵌入空间）。
+    """
+
+    def __init__(self, dim: int = 128, num_bits: int = 16, tolerance: float = 0.02, max_buckets: int = 10000,
+                 bucket_size: int = 4, ttl: float = 300, verify_rate: float = 0.01, seed: int = 42):
+        """
+        Args:
+            dim: 向量维度
+            num_bits: 签名位数（随机超平面个数），位数越多桶越细
+            tolerance: 复用近邻结果的最大余弦距离
+            max_buckets: 最多保留的桶数，超出时淘汰最久未使用的桶
+            bucket_size: 每个桶最多保留的向量数
+            ttl: 缓存条目过期时间（秒）
+            verify_rate: 命中后仍执行查询以校验误差的抽样比例
+            seed: 随机超平面的随机种子，多进程使用相同种子时签名一致
+        """
+        if not 0 < num_bits <= 63:
+            raise ValueError(f"签名位数必须在1到63之间: {num_bits}")
+
+        self.dim = dim
+        self.num_bits = num_bits
+        self.tolerance = float(tolerance)
+        self.max_buckets = max_buckets
+        self.bucket_size = max(int(bucket_size), 1)
+        self.ttl = ttl
+        self.verify_rate = float(verify_rate)
+
+        rng = np.random.default_rng(seed)
+        self._planes = rng.normal(size=(dim, num_bits)).astype(np.float32)
+        self._weights = (1 << np.arange(num_bits, dtype=np.int64))
+        self._random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        # (签名, 作用域) -> [(过期时间, 归一化向量, 近邻列表)]
+        self._buckets = OrderedDict()
+        self._model_version = None
+
+        self._stats = {
+            'hits': 0,
+            'batch_hits': 0,
+            'misses': 0,
+            'collisions': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'errors': 0,
+            'verifications': 0
+        }
+        self._verify_recall_sum = 0.0
+        self._verify_distance_sum = 0.0
+        self._verify_recall_min = None
+
+    def signatures(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算LSH签名
+
+        Args:
+            vectors: (n, dim) 向量矩阵
+
+        Returns:
+            (签名数组, 归一化后的向量矩阵)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        normalized = vectors / norms
+        bits = (normalized @ self._planes) > 0
+        return bits.astype(np.int64) @ self._weights, normalized
+
+    def lookup_many(self, vectors_128d: Sequence[np.ndarray], scopes: Sequence[Optional[str]],
+                    model_version: str) -> Tuple[List, Dict[int, int], set]:
+        """
+        批量查找近重复向量的近邻结果
+
+        Args:
+            vectors_128d: 128维编码向量列表
+            scopes: 与向量一一对应的近邻结果作用域（如KNN预过滤条件）
+            model_version: 当前编码器模型版本
+
+        Returns:
+            (hits, aliases, verify)
+            hits: 与输入一致的列表，命中位置为(近邻列表, 余弦距离)，未命中为None
+            aliases: 批次内的近重复 {下标: 同批次中需要查询的代表下标}
+            verify: 命中但被抽中校验的下标，调用方仍需查询并调用record_verification
+        """
+        self._check_version(model_version)
+        count = len(vectors_128d)
+        hits = [None] * count
+        aliases = {}
+        verify = set()
+        if count == 0:
+            return hits, aliases, verify
+
+        signatures, normalized = self.signatures(np.stack(vectors_128d))
+        keys = [(int(signature), scope) for signature, scope in zip(signatures, scopes)]
+        now = time.monotonic()
+        # 本批次未命中的代表向量: 桶键 -> [(下标, 归一化向量)]
+        pending = {}
+        batch_hits = 0
+        collisions = 0
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entries = self._buckets.get(key)
+                if entries:
+                    entries[:] = [entry for entry in entries if entry[0] > now]
+                    best = self._nearest(normalized[i], [entry[1] for entry in entries])
+                    if best is not None:
+                        self._buckets.move_to_end(key)
+                        hits[i] = (entries[best[0]][2], best[1])
+                        if self.verify_rate > 0 and self._random.random() < self.verify_rate:
+                            verify.add(i)
+                        continue
+                    if entries:
+                        collisions += 1
+
+                representatives = pending.setdefault(key, [])
+                best = self._nearest(normalized[i], [vector for _, vector in representatives])
+                if best is not None:
+                    aliases[i] = representatives[best[0]][0]
+                    batch_hits += 1
+                else:
+                    representatives.append((i, normalized[i]))
+
+            self._stats['hits'] += sum(hit is not None for hit in hits)
+            self._stats['batch_hits'] += batch_hits
+            self._stats['misses'] += count - batch_hits - sum(hit is not None for hit in hits)
+            self._stats['collisions'] += collisions
+
+        return hits, aliases, verify
+
+    def put_many(self, vectors_128d: Sequence[np.ndarray], scopes: Sequence[Optional[str]],
+                 batch_similar_entities: Sequence[List[Dict]]):
+        """
+        写入新查询到的近邻结果，空结果不写入
+
+        Args:
+            vectors_128d: 128维编码向量列表
+            scopes: 近邻结果作用域列表
+            batch_similar_entities: 与向量一一对应的近邻列表
+        """
+        items = [(i, entities) for i, entities in enumerate(batch_similar_entities) if entities]
+        if not items:
+            return
+
+        signatures, normalized = self.signatures(np.stack([vectors_128d[i] for i, _ in items]))
+        expire_at = time.monotonic() + self.ttl
+        with self._lock:
+            for (i, entities), signature, vector in zip(items, signatures, normalized):
+                key = (int(signature), scopes[i])
+                entries = self._buckets.setdefault(key, [])
+                entries.append((expire_at, vector, entities))
+                if len(entries) > self.bucket_size:
+                    del entries[0]
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def record_verification(self, cached: List[Dict], actual: List[Dict]):
+        """
+        记录一次抽样校验：复用的近邻列表与真实查询结果的Top-k重合率和平均距离偏差
+
+        Args:
+            cached: 缓存复用的近邻列表
+            actual: 实际查询得到的近邻列表
+        """
+        if not actual:
+            return
+        cached_ids = {entity['entity_id'] for entity in cached}
+        recall = sum(entity['entity_id'] in cached_ids for entity in actual) / len(actual)
+        cached_mean = np.mean([entity['similarity_score'] for entity in cached]) if cached else 0.0
+        actual_mean = np.mean([entity['similarity_score'] for entity in actual])
+        with self._lock:
+            self._stats['verifications'] += 1
+            self._verify_recall_sum += recall
+            self._verify_distance_sum += abs(float(cached_mean) - float(actual_mean))
+            if self._verify_recall_min is None or recall < self._verify_recall_min:
+                self._verify_recall_min = recall
+
+    def record_error(self, error: Exception):
+        """记录一次缓存查询或写入异常（调用方按未命中处理）"""
+        with self._lock:
+            self._stats['errors'] += 1
+        logger.warning(f"近重复缓存异常: {error}")
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._buckets.clear()
+            self._stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict:
+        """获取命中、误差和容量统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['buckets'] = len(self._buckets)
+            stats['entries'] = sum(len(entries) for entries in self._buckets.values())
+            verifications = stats['verifications']
+            stats['verify_mean_recall'] = self._verify_recall_sum / verifications if verifications else None
+            stats['verify_mean_distance_error'] = self._verify_distance_sum / verifications if verifications else None
+            stats['verify_min_recall'] = self._verify_recall_min
+        lookups = stats['hits'] + stats['batch_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['batch_hits']) / lookups if lookups else 0.0
+        stats.update({
+            'num_bits': self.num_bits,
+            'tolerance': self.tolerance,
+            'verify_rate': self.verify_rate,
+            'model_version': self._model_version
+        })
+        return stats
+
+    def _nearest(self, vector: np.ndarray, candidates: List[np.ndarray]) -> Optional[Tuple[int, float]]:
+        """桶内余弦距离最近且不超过tolerance的向量，返回(下标, 距离)"""
+        if not candidates:
+            return None
+        distances = 1.0 - np.stack(candidates) @ vector
+        best = int(np.argmin(distances))
+        if distances[best] > self.tolerance:
+            return None
+        return best, float(distances[best])
+
+    def _check_version(self, model_version: str):
+        """模型版本变化时清空缓存"""
+        if model_version == self._model_version:
+            return
+        with self._lock:
+            if model_version != self._model_version:
+                if self._model_version is not None:
+                    logger.info(f"编码器模型版本变化({self._model_version} -> {model_version})，清空近重复缓存")
+                    self._stats['invalidations'] += 1
+                self._buckets.clear()
+                self._model_version = model_version
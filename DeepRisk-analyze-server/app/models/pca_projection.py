@@ -0,0 +1,168 @@
+"""
+128维嵌入的PCA降维投影
+
+离线在实体向量（先做L2归一化）上拟合，投影矩阵与编码器放在同一目录，并记录拟合时的编码器模型版本，
+编码器更新后需要重新拟合。两阶段检索（TwoStageVectorIndex）在投影空间中粗筛候选，再用完整向量精排。
+
+用法:
+    python -m app.models.pca_projection --vectors data/vectors_128d.npy --dim 32
+    python -m app.models.pca_projection --from-redis --dim 24 --sample 200000
+"""
+import os
+import sys
+import logging
+import argparse
+import numpy as np
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """按行L2归一化（零向量保持不变）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class PcaProjection:
+    """PCA投影: (x - mean) @ components.T"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance_ratio: np.ndarray,
+                 source_version: Optional[str] = None):
+        """
+        Args:
+            mean: (d,) 拟合数据的均值
+            components: (dim, d) 主成分，按解释方差降序
+            explained_variance_ratio: (dim,) 各主成分的解释方差比例
+            source_version: 拟合时的编码器模型版本
+        """
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.explained_variance_ratio = np.asarray(explained_variance_ratio, dtype=np.float32)
+        self.source_version = source_version
+        # 投影写成一次矩阵乘法加偏置：x @ W - mean @ W
+        self._weight = np.ascontiguousarray(self.components.T)
+        self._offset = self.mean @ self._weight
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int, sample: Optional[int] = None, seed: int = 42,
+            source_version: Optional[str] = None) -> 'PcaProjection':
+        """
+        拟合PCA投影
+
+        Args:
+            vectors: (N, d) 已归一化的向量
+            dim: 投影维度
+            sample: 最多使用的样本数，为None时使用全部数据
+            seed: 采样随机种子
+            source_version: 编码器模型版本
+
+        Returns:
+            PcaProjection实例
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not 0 < dim <= vectors.shape[1]:
+            raise ValueError(f"投影维度必须在1到{vectors.shape[1]}之间: {dim}")
+        if sample is not None and vectors.shape[0] > sample:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(vectors.shape[0], sample, replace=False)]
+
+        data = vectors.astype(np.float64)
+        mean = data.mean(axis=0)
+        # 协方差矩阵只有d×d，直接特征分解比对N×d矩阵做SVD更省内存
+        covariance = (data - mean).T @ (data - mean) / max(data.shape[0] - 1, 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues = np.maximum(eigenvalues[order], 0.0)
+        components = eigenvectors[:, order[:dim]].T
+        ratio = eigenvalues[:dim] / max(eigenvalues.sum(), 1e-12)
+        return cls(mean, components, ratio, source_version)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """投影到低维空间，输入为(N, d)或(d,)"""
+        projected = np.asarray(vectors, dtype=np.float32) @ self._weight
+        projected -= self._offset
+        return projected
+
+    def save(self, path: str):
+        """保存为npz文件"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, mean=self.mean, components=self.components,
+                 explained_variance_ratio=self.explained_variance_ratio,
+                 source_version=np.array(self.source_version or ''))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PcaProjection':
+        """从npz文件加载"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['mean'], data['components'], data['explained_variance_ratio'],
+                       str(data['source_version']) or None)
+
+    def __repr__(self):
+        return (f"PcaProjection({self.input_dim}→{self.output_dim}, "
+                f"explained={float(self.explained_variance_ratio.sum()):.3f}, version={self.source_version})")
+
+
+def projection_path(dim: int, model_dir: Optional[str] = None) -> str:
+    """编码器目录下指定维度的投影文件路径"""
+    if model_dir is None:
+        from app.models.model_loader import MODEL_DIR
+        model_dir = MODEL_DIR
+    return os.path.join(model_dir, f'encoder_35_to_128_pca{dim}.npz')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="拟合128维嵌入的PCA投影")
+    parser.add_argument('--vectors', help="实体向量.npy文件")
+    parser.add_argument('--from-redis', action='store_true', help="从Redis实体哈希中读取向量")
+    parser.add_argument('--dim', type=int, default=32, help="投影维度（建议16-32）")
+    parser.add_argument('--sample', type=int, default=200000, help="最多使用的样本数")
+    parser.add_argument('--output', help="输出路径，默认编码器目录下的encoder_35_to_128_pca{dim}.npz")
+    parser.add_argument('--redis-host', default=None, help="Redis主机，默认Config.REDIS_HOST")
+    parser.add_argument('--redis-port', type=int, default=None, help="Redis端口，默认Config.REDIS_PORT")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from app.config import Config
+    from app.models.model_loader import load_models, get_model_version
+
+    if args.vectors:
+        vectors = np.load(args.vectors)
+    elif args.from_redis:
+        from app.redis_pool import get_redis_client
+        from app.models.vector_search import InMemoryVectorIndex
+
+        redis_client = get_redis_client(decode_responses=False, host=args.redis_host, port=args.redis_port, db=0)
+        mirror = InMemoryVectorIndex(metric='L2', exact_threshold=sys.maxsize)
+        mirror.load_from_redis(redis_client, key_prefix=Config.VECTOR_KEY_PREFIX,
+                               vector_type=Config.VECTOR_STORAGE_DTYPE)
+        vectors = mirror._snapshot['vectors'] if mirror.is_available() else np.empty((0, 128), dtype=np.float32)
+    else:
+        parser.error("必须指定--vectors或--from-redis")
+    if len(vectors) == 0:
+        parser.error("没有可用于拟合的向量")
+
+    # 投影文件记录编码器版本，服务端加载时据此判断是否过期
+    load_models()
+    projection = PcaProjection.fit(normalize_rows(vectors), args.dim, sample=args.sample,
+                                   source_version=get_model_version())
+    output = args.output or projection_path(args.dim)
+    projection.save(output)
+    print(f"[PCA] {projection} 已保存到 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
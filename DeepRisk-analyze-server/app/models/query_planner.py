@@ -0,0 +1,180 @@
+import logging
+import threading
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class KnnQueryPlanner:
+    """
+    按延迟预算规划KNN查询参数（k和EF_RUNTIME）
+
+    - 按EF_RUNTIME档位分别记录单条查询耗时的指数滑动平均，用于估计各档位的批次耗时
+    - 负载信号（待处理队列深度）越高，可用预算越低：繁忙时选择较低的EF_RUNTIME和k，
+      空闲时在预算内选择最高的EF_RUNTIME以提高召回率
+    - 没有任何耗时样本时使用默认档位
+
+    k会影响风险评分（相似实体少于5个时评分会上调），默认min_k == max_k，即只调整EF_RUNTIME。
+    """
+
+    def __init__(self, default_budget_ms: float = 50.0, ef_levels: Sequence[int] = (10, 20, 40, 80, 160),
+                 default_ef: Optional[int] = 10, min_k: int = 10, max_k: int = 10,
+                 idle_queue_depth: int = 0, busy_queue_depth: int = 64,
+                 busy_budget_ratio: float = 0.5, ewma_alpha: float = 0.2):
+        """
+        Args:
+            default_budget_ms: 默认单次请求（整个批次）的检索延迟预算（毫秒）
+            ef_levels: 可选的EF_RUNTIME档位，为空时不设置EF_RUNTIME（FLAT索引）
+            default_ef: 没有耗时样本时使用的EF_RUNTIME
+            min_k: 满负载时的k
+            max_k: 空闲时的k
+            idle_queue_depth: 队列深度不超过该值视为空闲
+            busy_queue_depth: 队列深度达到该值视为满负载
+            busy_budget_ratio: 满负载时实际可用预算占请求预算的比例
+            ewma_alpha: 耗时滑动平均的平滑系数
+        """
+        if min_k > max_k:
+            raise ValueError(f"min_k({min_k})不能大于max_k({max_k})")
+
+        self.default_budget_ms = default_budget_ms
+        self.ef_levels = sorted(set(int(ef) for ef in ef_levels))
+        self.default_ef = default_ef if not self.ef_levels or default_ef in self.ef_levels else self.ef_levels[0]
+        self.min_k = min_k
+        self.max_k = max_k
+        self.idle_queue_depth = idle_queue_depth
+        self.busy_queue_depth = max(busy_queue_depth, idle_queue_depth + 1)
+        self.busy_budget_ratio = busy_budget_ratio
+        self.ewma_alpha = ewma_alpha
+
+        self._lock = threading.Lock()
+        self._queue_depth = 0
+        # EF_RUNTIME档位 -> 单条查询耗时的滑动平均（毫秒）
+        self._latency_ms = {}
+        self._stats = {
+            'plans': 0,
+            'over_budget': 0
+        }
+
+    def update_load(self, queue_depth: int):
+        """
+        更新负载信号
+
+        Args:
+            queue_depth: 当前待处理的消息/请求数
+        """
+        self._queue_depth = max(int(queue_depth), 0)
+
+    def load_pressure(self) -> float:
+        """当前负载压力，0表示空闲，1表示满负载"""
+        depth = self._queue_depth
+        if depth <= self.idle_queue_depth:
+            return 0.0
+        span = self.busy_queue_depth - self.idle_queue_depth
+        return min((depth - self.idle_queue_depth) / span, 1.0)
+
+    def plan(self, budget_ms: Optional[float] = None, num_queries: int = 1) -> Dict:
+        """
+        为一次检索选择查询参数
+
+        Args:
+            budget_ms: 本次请求的检索延迟预算（毫秒），为None时使用默认预算
+            num_queries: 本次需要执行的查询条数（同一批次通过一次管道发送）
+
+        Returns:
+            查询参数字典: {'k', 'ef_runtime', 'budget_ms', 'load'}，
+            ef_runtime为None表示使用索引默认值
+        """
+        budget_ms = self.default_budget_ms if budget_ms is None else float(budget_ms)
+        pressure = self.load_pressure()
+        effective_budget = budget_ms * (1.0 - (1.0 - self.busy_budget_ratio) * pressure)
+
+        k = int(round(self.max_k - (self.max_k - self.min_k) * pressure))
+        ef_runtime = self._choose_ef(effective_budget, max(num_queries, 1))
+
+        # HNSW要求EF_RUNTIME不小于k
+        if ef_runtime is not None:
+            ef_runtime = max(ef_runtime, k)
+
+        with self._lock:
+            self._stats['plans'] += 1
+
+        return {
+            'k': k,
+            'ef_runtime': ef_runtime,
+            'budget_ms': round(budget_ms, 3),
+            'load': round(pressure, 3)
+        }
+
+    def record_latency(self, plan: Dict, elapsed_ms: float, num_queries: int = 1,
+                       ef_runtime: Optional[int] = None):
+        """
+        记录一次检索的实际耗时
+
+        Args:
+            plan: plan()返回的查询参数
+            elapsed_ms: 整个批次的检索耗时（毫秒）
+            num_queries: 批次中的查询条数
+            ef_runtime: 实际发送给FT.SEARCH的EF_RUNTIME（调用方可能调高了规划值），为None时使用plan中的值
+        """
+        if ef_runtime is None:
+            ef_runtime = plan.get('ef_runtime')
+        per_query = elapsed_ms / max(num_queries, 1)
+        with self._lock:
+            previous = self._latency_ms.get(ef_runtime)
+            if previous is None:
+                self._latency_ms[ef_runtime] = per_query
+            else:
+                self._latency_ms[ef_runtime] = previous + self.ewma_alpha * (per_query - previous)
+            if elapsed_ms > plan.get('budget_ms', float('inf')):
+                self._stats['over_budget'] += 1
+
+    def get_stats(self) -> Dict:
+        """获取规划器状态"""
+        with self._lock:
+            stats = dict(self._stats)
+            latency = {str(ef): round(ms, 3) for ef, ms in sorted(self._latency_ms.items(), key=lambda x: x[0] or 0)}
+        stats.update({
+            'queue_depth': self._queue_depth,
+            'load': round(self.load_pressure(), 3),
+            'default_budget_ms': self.default_budget_ms,
+            'ef_levels': self.ef_levels,
+            'k_range': [self.min_k, self.max_k],
+            'latency_per_query_ms': latency
+        })
+        return stats
+
+    def _choose_ef(self, budget_ms: float, num_queries: int) -> Optional[int]:
+        """在预算内选择最高的EF_RUNTIME档位，没有档位满足预算时选择最低档位"""
+        if not self.ef_levels:
+            return None
+
+        with self._lock:
+            latency = dict(self._latency_ms)
+        if not any(ef is not None for ef in latency):
+            return self.default_ef
+
+        chosen = self.ef_levels[0]
+        for ef in self.ef_levels:
+            estimate = self._estimate_latency(latency, ef)
+            if estimate is not None and estimate * num_queries <= budget_ms:
+                chosen = ef
+            else:
+                break
+        return chosen
+
+    def _estimate_latency(self, latency: Dict, ef: int) -> Optional[float]:
+        """
+        估计某个档位的单条查询耗时
+
+        有样本时直接使用；没有样本时按最接近的已知EF_RUNTIME线性外推（HNSW查询代价近似与EF_RUNTIME成正比），
+        向上外推保证较高档位在有实测数据前不会被低估。已知EF_RUNTIME可以不是档位值（实际查询时被调高到k+1）。
+        """
+        if ef in latency:
+            return latency[ef]
+        known = [level for level in latency if level is not None]
+        if not known:
+            return None
+        nearest = min(known, key=lambda level: abs(level - ef))
+        return latency[nearest] * max(ef / nearest, 1.0)
+
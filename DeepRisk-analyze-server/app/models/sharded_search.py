@@ -0,0 +1,304 @@
+import heapq
+import bisect
+import asyncio
+import hashlib
+import logging
+import threading
+import numpy as np
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from app.models.vector_search import (
+    VectorSearchBackend, RediSearchBackend, InMemoryVectorIndex, create_search_backend
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ConsistentHashRing:
+    """
+    一致性哈希环
+
+    每个分片在环上放置vnodes个虚拟节点（md5），实体按entity_id的哈希顺时针落到第一个虚拟节点所属的分片。
+    增加一个分片只会迁移约1/N的实体。
+    """
+
+    def __init__(self, shard_names: Sequence[str], vnodes: int = 160):
+        """
+        Args:
+            shard_names: 分片名称（如host:port），名称决定虚拟节点位置，同名分片在不同进程中映射一致
+            vnodes: 每个分片的虚拟节点数
+        """
+        if not shard_names:
+            raise ValueError("分片列表不能为空")
+        if len(set(shard_names)) != len(shard_names):
+            raise ValueError("分片名称不能重复")
+
+        self.shard_names = list(shard_names)
+        self.vnodes = max(int(vnodes), 1)
+
+        points = []
+        for shard, name in enumerate(self.shard_names):
+            for replica in range(self.vnodes):
+                points.append((self._hash(f"{name}#{replica}"), shard))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def get_shard(self, entity_id) -> int:
+        """实体所在分片的下标"""
+        position = bisect.bisect(self._hashes, self._hash(str(entity_id)))
+        return self._shards[position % len(self._shards)]
+
+    def partition(self, entity_ids: Sequence) -> List[List[int]]:
+        """
+        按分片划分实体
+
+        Args:
+            entity_ids: 实体ID列表
+
+        Returns:
+            每个分片对应的实体下标列表
+        """
+        groups = [[] for _ in self.shard_names]
+        for i, entity_id in enumerate(entity_ids):
+            groups[self.get_shard(entity_id)].append(i)
+        return groups
+
+    def __len__(self) -> int:
+        return len(self.shard_names)
+
+
+class PartialShardResults(list):
+    """部分分片查询失败时的归并结果，记录缺失的分片，调用方据此标记结果并跳过缓存"""
+
+    def __init__(self, results: List[List[Dict]], missing_shards: List[str], total_shards: int):
+        super().__init__(results)
+        self.missing_shards = missing_shards
+        self.total_shards = total_shards
+
+
+class ShardedSearchBackend(VectorSearchBackend):
+    """
+    分片向量检索后端
+
+    实体按一致性哈希分布在多个分片（每个分片是一个独立的检索后端，通常是不同Redis节点上的
+    entity_vectors索引）。查询并发发送到全部分片，各分片的Top-k（按similarity_score升序）
+    通过堆归并为全局Top-k。单个分片失败时返回其余分片的结果（PartialShardResults），
+    全部分片失败时抛出异常。
+    """
+
+    name = "sharded"
+
+    def __init__(self, shards: List[VectorSearchBackend], shard_names: Sequence[str], vnodes: int = 160):
+        """
+        Args:
+            shards: 分片检索后端，与shard_names一一对应
+            shard_names: 分片名称
+            vnodes: 一致性哈希每个分片的虚拟节点数
+        """
+        if len(shards) != len(shard_names):
+            raise ValueError("分片后端数量与分片名称数量不一致")
+
+        self.shards = list(shards)
+        self.ring = ConsistentHashRing(shard_names, vnodes)
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='vector-shard')
+        self._lock = threading.Lock()
+        self._shard_errors = [0] * len(self.shards)
+
+    @property
+    def supports_ef_runtime(self) -> bool:
+        return all(getattr(shard, 'supports_ef_runtime', False) for shard in self.shards)
+
+    def is_available(self) -> bool:
+        return any(shard.is_available() for shard in self.shards)
+
+    def search_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                     ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """每个分片在线程池中执行一次批量查询（RediSearch分片为一次管道），再逐条归并"""
+        futures = [
+            self._executor.submit(shard.search_batch, vectors_128d, k, ef_runtime, filters)
+            for shard in self.shards
+        ]
+        shard_results = []
+        for shard, future in enumerate(futures):
+            try:
+                shard_results.append(future.result())
+            except Exception as e:
+                shard_results.append(self._shard_failed(shard, e))
+        return self._merge(shard_results, len(vectors_128d), k)
+
+    async def asearch_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                            ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """asyncio.gather并发查询全部分片"""
+        replies = await asyncio.gather(
+            *(shard.asearch_batch(vectors_128d, k, ef_runtime, filters) for shard in self.shards),
+            return_exceptions=True
+        )
+        shard_results = [
+            self._shard_failed(shard, reply) if isinstance(reply, Exception) else reply
+            for shard, reply in enumerate(replies)
+        ]
+        return self._merge(shard_results, len(vectors_128d), k)
+
+    def _shard_failed(self, shard: int, error: Exception):
+        logger.warning(f"分片[{self.ring.shard_names[shard]}]查询失败: {error}")
+        with self._lock:
+            self._shard_errors[shard] += 1
+        return error
+
+    def _merge(self, shard_results: List, count: int, k: int) -> List[List[Dict]]:
+        """
+        归并各分片的Top-k
+
+        Args:
+            shard_results: 每个分片的批量结果，失败的分片为异常对象
+            count: 查询条数
+            k: 全局返回的实体数
+
+        Returns:
+            与输入顺序一致的全局Top-k列表的列表，有分片失败时为PartialShardResults
+        """
+        succeeded = [results for results in shard_results if not isinstance(results, Exception)]
+        if not succeeded:
+            raise shard_results[0]
+
+        merged = []
+        for i in range(count):
+            # 各分片结果已按距离升序排列，heapq.merge只需比较各列表的头部
+            streams = [results[i] for results in succeeded if results[i]]
+            merged.append(list(islice(heapq.merge(*streams, key=lambda entity: entity['similarity_score']), k)))
+
+        if len(succeeded) < len(shard_results):
+            missing = [
+                name for name, results in zip(self.ring.shard_names, shard_results) if isinstance(results, Exception)
+            ]
+            return PartialShardResults(merged, missing, len(shard_results))
+        return merged
+
+    def mirror_in_memory(self, **kwargs) -> 'ShardedSearchBackend':
+        """
+        为每个RediSearch分片构建内存镜像索引，组成同样分片方式的内存后端（降级索引使用）
+
+        Args:
+            **kwargs: 传给create_search_backend('memory')的参数
+
+        Returns:
+            内存镜像的分片后端
+        """
+        mirrors = []
+        for shard in self.shards:
+            if isinstance(shard, RediSearchBackend):
+                mirrors.append(create_search_backend(
+                    'memory', redis_client=shard.redis_client, key_prefix=shard.key_prefix,
+                    vector_type=shard.vector_type, **kwargs
+                ))
+            else:
+                mirrors.append(shard)
+        return ShardedSearchBackend(mirrors, self.ring.shard_names, self.ring.vnodes)
+
+    def reload(self) -> Optional[int]:
+        """重新加载各内存镜像分片，全部分片都直接查询Redis时返回None"""
+        counts = [shard.reload() for shard in self.shards]
+        if all(count is None for count in counts):
+            return None
+        return sum(count or 0 for count in counts)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            errors = list(self._shard_errors)
+        shards = []
+        for name, shard, error_count in zip(self.ring.shard_names, self.shards, errors):
+            stats = shard.get_stats()
+            stats.update({'shard': name, 'errors': error_count})
+            shards.append(stats)
+        return {
+            "backend": self.name,
+            "available": self.is_available(),
+            "num_shards": len(self.shards),
+            "vnodes": self.ring.vnodes,
+            "shards": shards
+        }
+
+    @classmethod
+    def build_in_memory(cls, shard_names: Sequence[str], entity_ids: List[str], vectors: np.ndarray,
+                        labels: Optional[List] = None, attributes: Optional[Dict[str, List]] = None,
+                        vnodes: int = 160, **kwargs) -> 'ShardedSearchBackend':
+        """
+        按一致性哈希将实体划分到多个进程内索引（不依赖Redis，用于测试和基准）
+
+        Args:
+            shard_names: 分片名称
+            entity_ids: 实体ID列表
+            vectors: (N, 128) 向量矩阵
+            labels: 标签列表
+            attributes: 过滤属性 {字段名: 取值列表}
+            vnodes: 一致性哈希每个分片的虚拟节点数
+            **kwargs: 传给InMemoryVectorIndex的参数
+
+        Returns:
+            分片后端
+        """
+        ring = ConsistentHashRing(shard_names, vnodes)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        shards = []
+        for indices in ring.partition(entity_ids):
+            index = InMemoryVectorIndex(**kwargs)
+            if indices:
+                index.build(
+                    [entity_ids[i] for i in indices],
+                    vectors[indices],
+                    [labels[i] for i in indices] if labels is not None else None,
+                    {field: [values[i] for i in indices] for field, values in (attributes or {}).items()} or None
+                )
+            shards.append(index)
+        return cls(shards, shard_names, vnodes)
+
+
+def parse_shard_address(spec: str):
+    """解析分片地址host:port，返回(host, port)"""
+    host, _, port = spec.strip().rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"分片地址格式应为host:port: {spec}")
+    return host, int(port)
+
+
+def create_sharded_backend(backend_type: str, shard_specs: Sequence[str], index_name: str = 'entity_vectors',
+                           key_prefix: str = 'entity:', vector_type: str = 'FLOAT32', vnodes: int = 160,
+                           **kwargs) -> ShardedSearchBackend:
+    """
+    按分片地址列表创建分片后端，每个分片使用各自节点上的共享连接池
+
+    Args:
+        backend_type: 每个分片的后端类型，'redis' 或 'memory'（从各分片节点镜像加载）
+        shard_specs: 分片地址列表，格式host:port
+        index_name: 各分片上的RediSearch索引名
+        key_prefix: 实体哈希键前缀
+        vector_type: Redis中向量的存储类型（FLOAT32/FLOAT16）
+        vnodes: 一致性哈希每个分片的虚拟节点数
+        **kwargs: 传给InMemoryVectorIndex的参数
+
+    Returns:
+        分片后端
+    """
+    from app.redis_pool import get_redis_client, get_async_redis_client
+
+    shards = []
+    for spec in shard_specs:
+        host, port = parse_shard_address(spec)
+        shards.append(create_search_backend(
+            backend_type,
+            redis_client=get_redis_client(decode_responses=False, host=host, port=port, db=0),
+            index_name=index_name,
+            key_prefix=key_prefix,
+            async_client_factory=lambda host=host, port=port: get_async_redis_client(host=host, port=port, db=0),
+            vector_type=vector_type,
+            **kwargs
+        ))
+    return ShardedSearchBackend(shards, [spec.strip() for spec in shard_specs], vnodes)
@@ -0,0 +1,214 @@
+import os
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+
+from app.models.vector_search import InMemoryVectorIndex, vector_dtype
+from app.models.pca_projection import PcaProjection, normalize_rows, projection_path
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TwoStageVectorIndex(InMemoryVectorIndex):
+    """
+    两阶段向量检索：PCA低维粗筛 + 完整向量余弦精排
+
+    - 第一阶段：归一化后的128维向量经PCA投影到16-32维，在投影空间中（精确或IVF）取Top-k'候选，
+      索引内存和扫描代价按维度比例下降
+    - 第二阶段：候选的完整向量与查询向量批量计算精确余弦距离，取Top-k
+
+    完整向量的来源：
+    - memory: 进程内保存（默认float16，为float32的一半）
+    - redis: 不在进程内保存，精排时通过一次管道HMGET读取候选实体的向量字段
+
+    返回的similarity_score为1-余弦相似度，与COSINE索引一致。
+    """
+
+    name = "two_stage"
+
+    RERANK_SOURCES = ('memory', 'redis')
+    RERANK_DTYPES = ('float32', 'float16')
+
+    def __init__(self, projection: PcaProjection, candidate_k: int = 100, rerank_source: str = 'memory',
+                 rerank_dtype: str = 'float16', redis_client=None, key_prefix: str = 'entity:',
+                 vector_type: str = 'FLOAT32', **kwargs):
+        """
+        Args:
+            projection: PCA投影
+            candidate_k: 第一阶段候选数k'（实际取max(k', k)）
+            rerank_source: 精排向量来源，memory或redis
+            rerank_dtype: memory来源时完整向量的存储类型
+            redis_client: redis来源时读取向量的客户端（不解码响应）
+            key_prefix: 实体哈希键前缀
+            vector_type: Redis中向量的存储类型（FLOAT32/FLOAT16）
+            **kwargs: 第一阶段InMemoryVectorIndex的参数（exact_threshold、nprobe、quantization等）
+        """
+        if rerank_source not in self.RERANK_SOURCES:
+            raise ValueError(f"不支持的精排向量来源: {rerank_source}")
+        if rerank_dtype not in self.RERANK_DTYPES:
+            raise ValueError(f"不支持的精排向量存储类型: {rerank_dtype}")
+        kwargs.pop('metric', None)
+        # 归一化向量之间的欧氏距离与余弦距离单调对应，投影空间中使用L2
+        super().__init__(metric='L2', **kwargs)
+
+        self.projection = projection
+        self.candidate_k = candidate_k
+        self.rerank_source = rerank_source
+        self.rerank_dtype = np.dtype(rerank_dtype)
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.vector_type = vector_type
+
+    def _build_snapshot(self, entity_ids: List[str], vectors: np.ndarray, labels: Optional[List] = None,
+                        attributes: Optional[Dict[str, List]] = None) -> Dict:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 2 and vectors.shape[1] != self.projection.input_dim:
+            raise ValueError(f"向量维度{vectors.shape[1]}与PCA投影输入维度{self.projection.input_dim}不一致")
+
+        normalized = normalize_rows(vectors)
+        snapshot = super()._build_snapshot(entity_ids, self.projection.transform(normalized), labels, attributes)
+        snapshot['full_vectors'] = normalized.astype(self.rerank_dtype) if self.rerank_source == 'memory' else None
+        return snapshot
+
+    def search_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                     ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot['ids']:
+            return [[] for _ in vectors_128d]
+
+        valid_indices = [i for i, vector in enumerate(vectors_128d) if vector is not None]
+        if not valid_indices:
+            return [[] for _ in vectors_128d]
+
+        queries = normalize_rows(np.asarray([vectors_128d[i] for i in valid_indices], dtype=np.float32))
+        candidate_k = max(self.candidate_k, k)
+        rows = self._search_rows(snapshot, self.projection.transform(queries), valid_indices, len(vectors_128d),
+                                 candidate_k, filters)
+
+        # 第二阶段：候选下标补齐为(n, k')矩阵，一次批量计算全部查询的精确余弦距离
+        candidates = np.full((len(valid_indices), candidate_k), -1, dtype=np.int64)
+        for row, i in enumerate(valid_indices):
+            if rows[i] is not None:
+                indices = rows[i][0]
+                candidates[row, :len(indices)] = indices
+
+        distances = self._rerank_distances(snapshot, queries, candidates)
+        k = min(k, candidate_k)
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < candidate_k else \
+            np.tile(np.arange(candidate_k), (len(valid_indices), 1))
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.take_along_axis(top_distances, order, axis=1)
+
+        results = [[] for _ in vectors_128d]
+        for row, i in enumerate(valid_indices):
+            valid = np.isfinite(top_distances[row])
+            results[i] = self._to_entities(snapshot, candidates[row, top[row][valid]], top_distances[row][valid])
+        return results
+
+    def _rerank_distances(self, snapshot, queries: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """
+        候选的精确余弦距离
+
+        Args:
+            snapshot: 索引快照
+            queries: (n, d) 已归一化的查询向量
+            candidates: (n, k') 候选下标，-1为填充位
+
+        Returns:
+            (n, k') 距离矩阵，填充位为inf
+        """
+        padding = candidates < 0
+        safe = np.where(padding, 0, candidates)
+        if snapshot['full_vectors'] is not None:
+            full = snapshot['full_vectors'][safe]
+        else:
+            full, padding = self._fetch_full_vectors(snapshot, safe, padding)
+        # (n, k', d)·(n, d) -> (n, k')
+        similarities = np.einsum('nkd,nd->nk', full.astype(np.float32, copy=False), queries)
+        distances = 1.0 - similarities
+        distances[padding] = np.inf
+        return distances
+
+    def _fetch_full_vectors(self, snapshot, candidates: np.ndarray, padding: np.ndarray):
+        """
+        通过一次Redis管道读取候选实体的完整向量
+
+        Returns:
+            ((n, k', d) 归一化向量, 更新后的填充位掩码)，读取失败的候选视为填充位
+        """
+        dim = self.projection.input_dim
+        unique = np.unique(candidates[~padding])
+        if unique.size == 0:
+            return np.zeros(candidates.shape + (dim,), dtype=np.float32), padding
+
+        ids = snapshot['ids']
+        dtype = vector_dtype(self.vector_type)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for idx in unique:
+            pipe.hget(f"{self.key_prefix}{ids[idx]}", 'vector')
+        replies = pipe.execute(raise_on_error=False)
+
+        vectors = np.zeros((len(unique), dim), dtype=np.float32)
+        missing = np.zeros(len(unique), dtype=bool)
+        for j, reply in enumerate(replies):
+            if isinstance(reply, Exception) or reply is None:
+                missing[j] = True
+            else:
+                vectors[j] = np.frombuffer(reply, dtype=dtype)
+
+        positions = np.minimum(np.searchsorted(unique, candidates), len(unique) - 1)
+        return normalize_rows(vectors)[positions], padding | missing[positions]
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        snapshot = self._snapshot
+        full_vectors = None if snapshot is None else snapshot.get('full_vectors')
+        stats.update({
+            "metric": "COSINE",
+            "projection_dim": self.projection.output_dim,
+            "projection_version": self.projection.source_version,
+            "explained_variance": round(float(self.projection.explained_variance_ratio.sum()), 4),
+            "candidate_k": self.candidate_k,
+            "rerank_source": self.rerank_source,
+            "rerank_bytes": 0 if full_vectors is None else int(full_vectors.nbytes)
+        })
+        return stats
+
+
+def create_two_stage_backend(redis_client=None, key_prefix: str = 'entity:', vector_type: str = 'FLOAT32',
+                             dim: int = 32, candidate_k: int = 100, rerank_source: str = 'memory',
+                             projection_file: Optional[str] = None, model_version: Optional[str] = None,
+                             **kwargs) -> TwoStageVectorIndex:
+    """
+    加载PCA投影并从Redis镜像构建两阶段索引
+
+    Args:
+        redis_client: 不解码响应的Redis客户端
+        key_prefix: 实体哈希键前缀
+        vector_type: Redis中向量的存储类型
+        dim: 投影维度，未指定projection_file时按维度定位编码器目录下的投影文件
+        candidate_k: 第一阶段候选数
+        rerank_source: 精排向量来源，memory或redis
+        projection_file: 投影文件路径
+        model_version: 当前编码器模型版本，与投影文件记录的版本不一致时拒绝加载
+        **kwargs: 第一阶段InMemoryVectorIndex的参数
+
+    Returns:
+        两阶段索引
+    """
+    path = projection_file or projection_path(dim)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"PCA投影文件不存在: {path}，请先运行 python -m app.models.pca_projection")
+    projection = PcaProjection.load(path)
+    if model_version is not None and projection.source_version != model_version:
+        raise ValueError(f"PCA投影版本({projection.source_version})与编码器模型版本({model_version})不一致，需要重新拟合")
+
+    index = TwoStageVectorIndex(projection, candidate_k=candidate_k, rerank_source=rerank_source,
+                                redis_client=redis_client, key_prefix=key_prefix, vector_type=vector_type, **kwargs)
+    if redis_client is not None:
+        count = index.load_from_redis(redis_client, key_prefix=key_prefix, vector_type=vector_type)
+        logger.info(f"两阶段索引从Redis镜像加载了{count}个实体向量: {projection}")
+    return index
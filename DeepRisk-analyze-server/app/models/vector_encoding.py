@@ -0,0 +1,53 @@
+"""
+结果向量编码
+
+只依赖numpy，风险检测核心不可用时消费者的降级路径同样按RESULT_VECTOR_ENCODING编码结果中的向量。
+"""
+import base64
+import numpy as np
+from typing import List, Dict, Union
+
+# 向量编码方式：list为JSON浮点数组，其余为base64编码的小端二进制
+_VECTOR_ENCODING_DTYPES = {
+    'base64_f16': '<f2',
+    'base64_f32': '<f4'
+}
+
+def encode_vector(vector: np.ndarray, encoding: str = 'list') -> Union[List[float], Dict]:
+    """
+    编码结果中的向量
+    
+    Args:
+        vector: 向量
+        encoding: list / base64_f16 / base64_f32
+        
+    Returns:
+        list编码返回浮点数组，base64编码返回 {"encoding", "dtype", "data"} 字典
+    """
+    vector = np.asarray(vector)
+    if encoding == 'list':
+        return vector.tolist()
+    
+    dtype = _VECTOR_ENCODING_DTYPES.get(encoding)
+    if dtype is None:
+        raise ValueError(f"未知的向量编码方式: {encoding}")
+    return {
+        "encoding": "base64",
+        "dtype": "float16" if dtype == '<f2' else "float32",
+        "data": base64.b64encode(vector.astype(dtype).tobytes()).decode('ascii')
+    }
+
+def decode_vector(payload: Union[List[float], Dict]) -> np.ndarray:
+    """
+    解码encode_vector的输出
+    
+    Args:
+        payload: 浮点数组或base64编码字典
+        
+    Returns:
+        float32向量
+    """
+    if isinstance(payload, dict):
+        dtype = '<f2' if payload.get('dtype') == 'float16' else '<f4'
+        return np.frombuffer(base64.b64decode(payload['data']), dtype=dtype).astype(np.float32)
+    return np.asarray(payload, dtype=np.float32)
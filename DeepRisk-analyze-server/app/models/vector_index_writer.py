@@ -0,0 +1,185 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Optional
+
+from app.models.index_builder import write_entity_vectors, write_sharded_entity_vectors
+from app.models.vector_search import vector_dtype
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class VectorIndexWriter:
+    """
+    实体向量的异步回写（write-behind）
+
+    评分路径只把(实体ID, 128维向量, 元数据)放入有界队列，后台线程按max_batch条或flush_interval秒
+    聚合一批，通过管道HSET写入实体哈希，RediSearch索引自动收录新实体。
+    队列满时直接丢弃并计数，不阻塞评分路径；写入失败的批次记录日志后丢弃。
+    同一批次内重复的实体只写入最后一次的向量。
+
+    配置了分片时按一致性哈希写入实体所属的分片节点。
+    """
+
+    def __init__(self, redis_client=None, key_prefix: str = 'entity:', vector_type: str = 'FLOAT32',
+                 max_queue_size: int = 10000, flush_interval: float = 1.0, max_batch: int = 500,
+                 redis_clients: Optional[List] = None, ring=None, on_flush: Optional[Callable[[int], None]] = None):
+        """
+        Args:
+            redis_client: 不解码响应的Redis客户端（未分片时使用）
+            key_prefix: 实体哈希键前缀
+            vector_type: 向量存储类型，需与索引的TYPE一致
+            max_queue_size: 队列容量
+            flush_interval: 最长聚合时间（秒）
+            max_batch: 每批最多写入的实体数
+            redis_clients: 各分片的Redis客户端，与ring的分片顺序一致
+            ring: 分片使用的ConsistentHashRing
+            on_flush: 每批写入成功后以写入的实体数调用（如使依赖索引内容的缓存失效）
+        """
+        if redis_client is None and not (redis_clients and ring is not None):
+            raise ValueError("必须指定redis_client或redis_clients和ring")
+
+        self.redis_client = redis_client
+        self.redis_clients = redis_clients
+        self.ring = ring
+        self.on_flush = on_flush
+        self.key_prefix = key_prefix
+        self.vector_type = vector_type
+        self.flush_interval = float(flush_interval)
+        self.max_batch = max(int(max_batch), 1)
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._stats = {
+            'queued': 0,
+            'dropped': 0,
+            'written': 0,
+            'batches': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0
+        }
+
+        self._thread = threading.Thread(target=self._run, name='vector-index-writer', daemon=True)
+        self._thread.start()
+        # 进程退出时写完队列中剩余的实体
+        atexit.register(self.close)
+
+    def submit(self, entity_id: str, vector_128d: np.ndarray, attributes: Optional[Dict] = None) -> bool:
+        """
+        提交一个待回写的实体，不阻塞
+
+        Args:
+            entity_id: 实体ID
+            vector_128d: 128维编码向量
+            attributes: 元数据 {字段名: 取值}，如business_type、tenant、activity_date、risk_score
+
+        Returns:
+            False表示队列已满或已关闭，本次回写被丢弃
+        """
+        if self._stopped.is_set():
+            return False
+        try:
+            self._queue.put_nowait((str(entity_id), vector_128d, attributes or {}))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['queued'] += 1
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """停止后台线程，写完队列中已有的实体"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        """获取回写队列和写入统计"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'queue_size': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'flush_interval': self.flush_interval,
+            'max_batch': self.max_batch,
+            'sharded': self.ring is not None
+        })
+        return stats
+
+    def _run(self):
+        while not self._stopped.is_set() or not self._queue.empty():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+    def _collect_batch(self) -> List:
+        """等待第一个实体，然后在flush_interval内最多聚合max_batch个"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopped.is_set():
+                # 关闭时不再等待，只取队列中已有的实体
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List):
+        """将一批实体通过管道写入Redis"""
+        # 同一实体只保留最后一次提交
+        latest = {}
+        for entity_id, vector_128d, attributes in batch:
+            latest[entity_id] = (vector_128d, attributes)
+
+        entity_ids = list(latest)
+        vectors = np.stack([np.asarray(latest[entity_id][0], dtype=np.float32) for entity_id in entity_ids])
+        fields = sorted({field for _, attributes in latest.values() for field in attributes})
+        attributes = {field: [latest[entity_id][1].get(field) for entity_id in entity_ids] for field in fields}
+
+        start = time.perf_counter()
+        # 缓存版本号由on_flush回调统一更新，这里不再INCR
+        try:
+            if self.ring is not None:
+                written = write_sharded_entity_vectors(
+                    self.redis_clients, self.ring, entity_ids, vectors, key_prefix=self.key_prefix,
+                    vector_dtype=vector_dtype(self.vector_type), attributes=attributes, cache_generation_key=None
+                )
+            else:
+                written = write_entity_vectors(
+                    self.redis_client, entity_ids, vectors, key_prefix=self.key_prefix,
+                    vector_dtype=vector_dtype(self.vector_type), attributes=attributes, cache_generation_key=None
+                )
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            logger.error(f"回写{len(entity_ids)}个实体向量失败: {e}")
+            return
+
+        with self._lock:
+            self._stats['written'] += written
+            self._stats['batches'] += 1
+            self._stats['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(written)
+            except Exception as e:
+                logger.warning(f"回写完成回调失败: {e}")
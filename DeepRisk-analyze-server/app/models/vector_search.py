@@ -0,0 +1,973 @@
+import numpy as np
+import asyncio
+import datetime
+import logging
+import threading
+from typing import List, Dict, Tuple, Optional, Callable, Union
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _to_str(value) -> str:
+    """bytes转str"""
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+# 回复中用到的字段名的bytes形式，客户端不解码响应时优先按bytes键查找
+_FIELD_NAME_BYTES = {
+    name: name.encode('utf-8')
+    for name in ('entity_id', 'label', 'similarity_score', 'results', 'id', 'extra_attributes')
+}
+
+
+def _get_field(mapping: Dict, name: str):
+    """按字段名取值，兼容bytes和str两种键"""
+    value = mapping.get(_FIELD_NAME_BYTES.get(name) or name.encode('utf-8'))
+    if value is None:
+        value = mapping.get(name)
+    return value
+
+
+# RediSearch向量字段TYPE与存储/查询时使用的小端numpy类型
+VECTOR_DTYPES = {
+    'FLOAT32': '<f4',
+    'FLOAT16': '<f2'
+}
+
+
+def vector_dtype(vector_type: str) -> np.dtype:
+    """获取向量TYPE对应的numpy类型"""
+    try:
+        return np.dtype(VECTOR_DTYPES[vector_type.upper()])
+    except KeyError:
+        raise ValueError(f"不支持的向量存储类型: {vector_type}")
+
+
+# 实体过滤属性：TAG字段按取值精确匹配，NUMERIC字段按范围匹配
+TAG_ATTRIBUTES = ('business_type', 'tenant')
+NUMERIC_ATTRIBUTES = ('activity_date',)
+
+# TAG查询中需要转义的字符
+_TAG_SPECIAL_CHARS = set(',.<>{}[]"\':;!@#$%^&*()-+=~|/\\ ')
+
+
+def escape_tag_value(value) -> str:
+    """转义TAG查询值中的特殊字符"""
+    return ''.join('\\' + char if char in _TAG_SPECIAL_CHARS else char for char in str(value))
+
+
+def normalize_date(value) -> Optional[int]:
+    """
+    将日期转换为YYYYMMDD整数，作为activity_date的NUMERIC取值
+
+    支持date/datetime、'2024-05-01'、'2024/05/01'、'20240501'和整数，无法解析时返回None。
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.year * 10000 + value.month * 100 + value.day
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    text = str(value).strip()[:10].replace('-', '').replace('/', '')
+    try:
+        return int(text) if len(text) == 8 else None
+    except ValueError:
+        return None
+
+
+class SearchFilter:
+    """
+    KNN预过滤条件
+
+    KNN只在满足条件的实体中查找近邻，避免其他业务线/租户的实体占用Top-k。
+    TAG条件可以是单个取值或取值列表（任一匹配），日期范围为闭区间。
+    """
+
+    def __init__(self, business_type: Union[str, List[str], None] = None,
+                 tenant: Union[str, List[str], None] = None,
+                 date_from=None, date_to=None, expression: Optional[str] = None):
+        """
+        Args:
+            business_type: 业务类型
+            tenant: 租户
+            date_from: 活动日期下限
+            date_to: 活动日期上限
+            expression: 原始RediSearch过滤表达式，只有RediSearch后端支持
+        """
+        self.tags = {}
+        for field, value in (('business_type', business_type), ('tenant', tenant)):
+            values = [value] if isinstance(value, str) else list(value or [])
+            values = sorted(set(str(v) for v in values if v not in (None, '')))
+            if values:
+                self.tags[field] = values
+        self.date_from = normalize_date(date_from)
+        self.date_to = normalize_date(date_to)
+        self.expression = expression or None
+
+    def is_empty(self) -> bool:
+        return not self.tags and self.date_from is None and self.date_to is None and self.expression is None
+
+    def to_query(self) -> str:
+        """转换为FT.SEARCH的预过滤查询，无条件时为'*'"""
+        clauses = [
+            '@%s:{%s}' % (field, '|'.join(escape_tag_value(value) for value in values))
+            for field, values in self.tags.items()
+        ]
+        if self.date_from is not None or self.date_to is not None:
+            lower = '-inf' if self.date_from is None else str(self.date_from)
+            upper = '+inf' if self.date_to is None else str(self.date_to)
+            clauses.append('@activity_date:[%s %s]' % (lower, upper))
+        if self.expression is not None:
+            clauses.append(self.expression)
+        if not clauses:
+            return '*'
+        return '(%s)' % ' '.join(clauses)
+
+    def cache_scope(self) -> Optional[str]:
+        """作为嵌入与近邻缓存键的一部分，不同过滤条件的近邻结果分开缓存"""
+        return None if self.is_empty() else self.to_query()
+
+    def __repr__(self):
+        return f"SearchFilter({self.to_query()})"
+
+
+def _expand_filters(filters, count: int) -> List[Optional[SearchFilter]]:
+    """将单个过滤条件或过滤条件列表展开为与查询向量一一对应的列表，空条件视为None"""
+    if filters is None or isinstance(filters, SearchFilter):
+        filters = [filters] * count
+    elif len(filters) != count:
+        raise ValueError("过滤条件数量与查询向量数量不一致")
+    return [None if f is None or f.is_empty() else f for f in filters]
+
+
+class VectorSearchBackend:
+    """
+    向量检索后端接口
+
+    所有后端返回统一格式的相似实体列表：
+    [{'entity_id': str, 'similarity_score': float, 'label': int或None}, ...]
+    其中similarity_score沿用RediSearch的距离语义（越小越相似），按升序排列。
+    """
+
+    name = "base"
+    # 是否支持按查询设置EF_RUNTIME（HNSW索引）
+    supports_ef_runtime = False
+
+    def is_available(self) -> bool:
+        """后端是否可用"""
+        return True
+
+    def search(self, vector_128d: np.ndarray, k: int = 10, ef_runtime: Optional[int] = None,
+               filters: Optional[SearchFilter] = None) -> List[Dict]:
+        """
+        查询单个向量的Top-k相似实体
+
+        Args:
+            vector_128d: 128维查询向量
+            k: 返回最相似的k个实体
+            ef_runtime: HNSW查询时的候选列表大小，为None时使用索引默认值
+            filters: 预过滤条件，为None时在全部实体中查找
+
+        Returns:
+            相似实体列表
+        """
+        return self.search_batch([vector_128d], k, ef_runtime=ef_runtime, filters=filters)[0]
+
+    def search_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                     ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """
+        批量查询Top-k相似实体
+
+        Args:
+            vectors_128d: 128维查询向量列表，元素可以为None
+            k: 每个向量返回最相似的k个实体
+            ef_runtime: HNSW查询时的候选列表大小，为None时使用索引默认值，不支持的后端忽略
+            filters: 整个批次共用的SearchFilter，或与查询向量一一对应的SearchFilter列表
+
+        Returns:
+            与输入顺序一致的相似实体列表的列表，单条失败时对应位置为空列表
+        """
+        raise NotImplementedError
+
+    async def asearch_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                            ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """
+        search_batch的异步版本
+
+        默认在事件循环的线程池中执行search_batch，避免阻塞事件循环；
+        具备原生异步客户端的后端可以覆盖此方法。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.search_batch, vectors_128d, k, ef_runtime, filters)
+
+    def reload(self) -> Optional[int]:
+        """
+        从数据源重新加载索引
+
+        Returns:
+            重新加载的实体数量，直接查询Redis的后端无需加载，返回None
+        """
+        return None
+
+    def get_stats(self) -> Dict:
+        """获取后端状态信息"""
+        return {"backend": self.name, "available": self.is_available()}
+
+
+def detect_vector_algorithm(redis_client, index_name: str) -> Optional[str]:
+    """
+    从FT.INFO的attributes中读取向量字段的索引算法
+
+    Returns:
+        'HNSW'或'FLAT'，索引不存在或FT.INFO未返回算法（较旧的RediSearch版本）时为None
+    """
+    try:
+        reply = redis_client.execute_command('FT.INFO', index_name)
+    except Exception as e:
+        logger.warning(f"读取索引{index_name}的FT.INFO失败: {e}")
+        return None
+
+    if isinstance(reply, dict):
+        attributes = _get_field(reply, 'attributes') or []
+    else:
+        info = dict(zip([_to_str(key) for key in reply[::2]], reply[1::2]))
+        attributes = info.get('attributes') or []
+
+    for attribute in attributes:
+        if isinstance(attribute, dict):
+            fields = {_to_str(key).lower(): value for key, value in attribute.items()}
+        else:
+            fields = {_to_str(key).lower(): value for key, value in zip(attribute[::2], attribute[1::2])}
+        if _to_str(fields.get('type', '')).upper() == 'VECTOR' and fields.get('algorithm') is not None:
+            return _to_str(fields['algorithm']).upper()
+    return None
+
+
+class RediSearchBackend(VectorSearchBackend):
+    """
+    基于RediSearch向量索引的检索后端
+
+    创建时通过FT.INFO检测索引算法，只有HNSW索引才在查询中携带EF_RUNTIME
+    （FLAT索引不接受该参数，检测不到算法时同样按不支持处理）。
+    """
+
+    name = "redis"
+
+    # 查询只返回评分需要的字段，避免传回向量二进制数据
+    RETURN_FIELDS = ('entity_id', 'label', 'similarity_score')
+    # 本地标签表就绪后只返回距离，实体ID取自文档键
+    SCORE_ONLY_FIELDS = ('similarity_score',)
+
+    def __init__(self, redis_client, index_name: str = 'entity_vectors', key_prefix: str = 'entity:',
+                 async_client_factory: Optional[Callable] = None, vector_type: str = 'FLOAT32',
+                 label_store=None):
+        """
+        Args:
+            redis_client: 不解码响应的Redis客户端
+            index_name: RediSearch索引名
+            key_prefix: 实体哈希键前缀
+            async_client_factory: 在事件循环中返回redis.asyncio客户端的工厂函数，
+                为None时异步查询退化为线程池中的同步查询
+            vector_type: 索引向量字段的TYPE（FLOAT32/FLOAT16），查询向量按同一类型编码
+            label_store: 进程内标签表（LabelStore），就绪后标签在本地解析
+        """
+        self.redis_client = redis_client
+        self.index_name = index_name
+        self.key_prefix = key_prefix
+        self.async_client_factory = async_client_factory
+        self.vector_type = vector_type.upper()
+        self._dtype = vector_dtype(self.vector_type)
+        self.label_store = label_store
+        self.algorithm = detect_vector_algorithm(redis_client, index_name) if redis_client is not None else None
+        self.supports_ef_runtime = self.algorithm == 'HNSW'
+
+    def is_available(self) -> bool:
+        return self.redis_client is not None
+
+    def _local_labels(self) -> bool:
+        return self.label_store is not None and self.label_store.is_ready()
+
+    def search(self, vector_128d: np.ndarray, k: int = 10, ef_runtime: Optional[int] = None,
+               filters: Optional[SearchFilter] = None) -> List[Dict]:
+        search_filter = _expand_filters(filters, 1)[0]
+        result = self.redis_client.execute_command(*self._build_knn_query(vector_128d, k, ef_runtime, search_filter))
+        return self._parse_search_result(result)
+
+    def search_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                     ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """所有KNN查询通过一次非事务Redis管道发送，单条查询失败不影响其他查询"""
+        results = [[] for _ in vectors_128d]
+        search_filters = _expand_filters(filters, len(vectors_128d))
+
+        pipe = self.redis_client.pipeline(transaction=False)
+
+        # 记录每条管道命令对应的输入下标
+        query_indices = []
+        for i, vector_128d in enumerate(vectors_128d):
+            if vector_128d is None:
+                continue
+            try:
+                pipe.execute_command(*self._build_knn_query(vector_128d, k, ef_runtime, search_filters[i]))
+                query_indices.append(i)
+            except Exception as e:
+                logger.warning(f"构造第{i}条相似度查询失败: {e}")
+
+        if not query_indices:
+            return results
+
+        # raise_on_error=False: 错误以异常对象的形式逐条返回
+        replies = pipe.execute(raise_on_error=False)
+
+        for i, reply in zip(query_indices, replies):
+            if isinstance(reply, Exception):
+                logger.warning(f"第{i}条相似度查询失败: {reply}")
+                continue
+            try:
+                results[i] = self._parse_search_result(reply)
+            except Exception as e:
+                logger.warning(f"解析第{i}条相似度查询结果失败: {e}")
+
+        return results
+
+    async def asearch_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                            ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """基于redis.asyncio的批量查询，所有KNN查询通过一次异步管道发送"""
+        if self.async_client_factory is None:
+            return await super().asearch_batch(vectors_128d, k, ef_runtime, filters)
+
+        results = [[] for _ in vectors_128d]
+        search_filters = _expand_filters(filters, len(vectors_128d))
+        client = self.async_client_factory()
+
+        async with client.pipeline(transaction=False) as pipe:
+            query_indices = []
+            for i, vector_128d in enumerate(vectors_128d):
+                if vector_128d is None:
+                    continue
+                try:
+                    pipe.execute_command(*self._build_knn_query(vector_128d, k, ef_runtime, search_filters[i]))
+                    query_indices.append(i)
+                except Exception as e:
+                    logger.warning(f"构造第{i}条相似度查询失败: {e}")
+
+            if not query_indices:
+                return results
+
+            replies = await pipe.execute(raise_on_error=False)
+
+        for i, reply in zip(query_indices, replies):
+            if isinstance(reply, Exception):
+                logger.warning(f"第{i}条相似度查询失败: {reply}")
+                continue
+            try:
+                results[i] = self._parse_search_result(reply)
+            except Exception as e:
+                logger.warning(f"解析第{i}条相似度查询结果失败: {e}")
+
+        return results
+
+    def _build_knn_query(self, vector_128d: np.ndarray, k: int, ef_runtime: Optional[int] = None,
+                         search_filter: Optional[SearchFilter] = None) -> Tuple:
+        """
+        构造FT.SEARCH KNN查询命令参数
+
+        Args:
+            vector_128d: 128维向量
+            k: 返回最相似的k个实体
+            ef_runtime: HNSW查询时的候选列表大小，为None或索引不是HNSW时不指定（FLAT索引不支持该参数）
+            search_filter: 预过滤条件，KNN只在满足条件的实体中查找
+
+        Returns:
+            可直接传给execute_command的命令参数元组
+        """
+        # 查询向量类型必须与索引的TYPE一致
+        vector_128d = np.asarray(vector_128d, dtype=np.float32).astype(self._dtype)
+
+        prefilter = '*' if search_filter is None else search_filter.to_query()
+        if ef_runtime is None or not self.supports_ef_runtime:
+            knn_clause = '%s=>[KNN %d @vector $vec AS similarity_score]' % (prefilter, k)
+            params = ('PARAMS', '2', 'vec', vector_128d.tobytes())
+        else:
+            knn_clause = '%s=>[KNN %d @vector $vec EF_RUNTIME $ef AS similarity_score]' % (prefilter, k)
+            params = ('PARAMS', '4', 'vec', vector_128d.tobytes(), 'ef', str(int(ef_runtime)))
+
+        return_fields = self.SCORE_ONLY_FIELDS if self._local_labels() else self.RETURN_FIELDS
+        return (
+            'FT.SEARCH', self.index_name,
+            knn_clause,
+            *params,
+            'RETURN', str(len(return_fields)), *return_fields,
+            'SORTBY', 'similarity_score', 'ASC',
+            'DIALECT', '2',
+            'LIMIT', '0', str(k)
+        )
+
+    def _parse_search_result(self, result) -> List[Dict]:
+        """
+        解析FT.SEARCH返回结果
+
+        查询已通过RETURN只返回entity_id、label和similarity_score（标签表就绪时只返回similarity_score），
+        直接按字段名取值，不再逐字段尝试UTF-8解码。同时支持RESP2（扁平数组）和RESP3（映射）两种回复格式。
+
+        Args:
+            result: FT.SEARCH原始返回值
+
+        Returns:
+            相似实体列表，包含实体ID、相似度得分和标签
+        """
+        if isinstance(result, dict):
+            return self._parse_resp3_result(result)
+
+        similar_entities = []
+        # RESP2: [total, key1, [field, value, ...], key2, [...], ...]
+        for i in range(1, len(result) - 1, 2):
+            fields = result[i + 1]
+            values = {}
+            for j in range(0, len(fields) - 1, 2):
+                values[fields[j]] = fields[j + 1]
+            entity = self._to_entity(result[i], values)
+            if entity is not None:
+                similar_entities.append(entity)
+
+        return similar_entities
+
+    def _parse_resp3_result(self, result: Dict) -> List[Dict]:
+        """解析RESP3格式的FT.SEARCH回复"""
+        similar_entities = []
+        for item in _get_field(result, 'results') or []:
+            entity = self._to_entity(_get_field(item, 'id'), _get_field(item, 'extra_attributes') or {})
+            if entity is not None:
+                similar_entities.append(entity)
+        return similar_entities
+
+    def _to_entity(self, doc_key, values: Dict) -> Optional[Dict]:
+        """
+        由文档键和返回字段构造相似实体
+
+        Args:
+            doc_key: 文档键，entity_id字段缺失时去掉键前缀作为实体ID
+            values: 字段名到字段值的映射，键可以是bytes或str
+
+        Returns:
+            相似实体字典，字段缺失或格式错误时返回None
+        """
+        entity_id = _get_field(values, 'entity_id')
+        similarity_score = _get_field(values, 'similarity_score')
+        label = _get_field(values, 'label')
+
+        if entity_id is None and doc_key is not None:
+            entity_id = _to_str(doc_key)
+            if entity_id.startswith(self.key_prefix):
+                entity_id = entity_id[len(self.key_prefix):]
+
+        if not entity_id or similarity_score is None:
+            return None
+
+        try:
+            entity_id = _to_str(entity_id)
+            if label is not None:
+                label = int(label)
+            elif self.label_store is not None:
+                label = self.label_store.get(entity_id)
+            return {
+                'entity_id': entity_id,
+                'similarity_score': float(similarity_score),
+                'label': label
+            }
+        except (ValueError, TypeError) as e:
+            logger.warning(f"转换实体信息字段时出错: {e}")
+            return None
+
+    def get_stats(self) -> Dict:
+        return {"backend": self.name, "available": self.is_available(), "index_name": self.index_name,
+                "vector_type": self.vector_type, "algorithm": self.algorithm,
+                "supports_ef_runtime": self.supports_ef_runtime, "local_labels": self._local_labels()}
+
+
+class InMemoryVectorIndex(VectorSearchBackend):
+    """
+    进程内NumPy向量索引
+
+    - 实体数不超过exact_threshold时使用精确检索（矩阵乘法 + argpartition）
+    - 超过时使用IVF倒排分区检索：k-means粗聚类，每次查询只扫描nprobe个最近分区
+
+    距离与RediSearch保持一致：COSINE为1-余弦相似度，IP为1-内积，L2为欧氏距离平方，
+    因此风险评分逻辑无需区分后端。
+    带过滤条件的查询先按属性数组得到候选集，候选集不超过exact_threshold时在候选集内精确检索。
+
+    向量可以量化存储以减少内存：float16为原来的1/2，int8（按维度的min/max标量量化）为原来的1/4。
+    查询向量保持float32，距离计算时分块反量化候选向量。
+
+    从Redis镜像加载时记录数据源，reload()按同样的参数重新加载，新快照构建完成后整体替换旧快照，
+    回写和离线重建写入的实体之后才能被检索到（重新加载期间内存占用约为两份快照）。
+    """
+
+    name = "memory"
+
+    QUANTIZATIONS = ('none', 'float16', 'int8')
+    # 量化存储时每次反量化的向量数，限制距离计算的临时内存
+    DEQUANTIZE_CHUNK = 16384
+
+    def __init__(self, metric: str = 'COSINE', exact_threshold: int = 50000,
+                 nlist: Optional[int] = None, nprobe: int = 8, kmeans_iters: int = 10,
+                 seed: int = 42, quantization: str = 'none'):
+        metric = metric.upper()
+        if metric not in ('COSINE', 'IP', 'L2'):
+            raise ValueError(f"不支持的距离度量: {metric}")
+        quantization = (quantization or 'none').lower()
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"不支持的量化方式: {quantization}")
+
+        self.metric = metric
+        self.exact_threshold = exact_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.quantization = quantization
+
+        # 索引快照，整体替换保证查询线程读取到一致的数据
+        self._lock = threading.Lock()
+        self._snapshot = None
+        # load_from_redis的参数，reload()时使用
+        self._source = None
+
+    def is_available(self) -> bool:
+        return self._snapshot is not None
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return 0 if snapshot is None else len(snapshot['ids'])
+
+    def build(self, entity_ids: List[str], vectors: np.ndarray, labels: Optional[List] = None,
+              attributes: Optional[Dict[str, List]] = None):
+        """
+        构建索引
+
+        Args:
+            entity_ids: 实体ID列表
+            vectors: (N, d) 向量矩阵
+            labels: 标签列表，None表示无标签
+            attributes: 过滤属性 {字段名: 与实体一一对应的取值列表}，字段见TAG_ATTRIBUTES和NUMERIC_ATTRIBUTES
+        """
+        snapshot = self._build_snapshot(entity_ids, vectors, labels, attributes)
+        with self._lock:
+            self._snapshot = snapshot
+
+    def _build_snapshot(self, entity_ids: List[str], vectors: np.ndarray, labels: Optional[List] = None,
+                        attributes: Optional[Dict[str, List]] = None) -> Dict:
+        """构建索引快照，参数见build"""
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+        if vectors.ndim != 2 or vectors.shape[0] != len(entity_ids):
+            raise ValueError("向量矩阵形状与实体ID数量不一致")
+
+        if labels is None:
+            labels = [None] * len(entity_ids)
+        # 标签以int32存储，-1表示无标签
+        label_array = np.array([-1 if label is None else int(label) for label in labels], dtype=np.int32)
+
+        data = self._prepare_vectors(vectors)
+        snapshot = {
+            'ids': [str(entity_id) for entity_id in entity_ids],
+            'labels': label_array,
+            'vectors': data,
+            'quant_scale': None,
+            'quant_offset': None,
+            'sq_norms': None,
+            'centroids': None,
+            'lists': None,
+            'attributes': self._build_attributes(len(entity_ids), attributes or {})
+        }
+
+        # IVF聚类在量化前的float32数据上训练
+        if len(entity_ids) > self.exact_threshold:
+            centroids, assignments = self._train_ivf(data)
+            snapshot['centroids'] = centroids
+            snapshot['lists'] = [np.flatnonzero(assignments == c) for c in range(centroids.shape[0])]
+
+        self._quantize(snapshot, data)
+        if self.metric == 'L2':
+            # 使用量化后重建的向量计算范数，与检索时的内积保持一致
+            snapshot['sq_norms'] = np.concatenate([
+                np.einsum('ij,ij->i', block, block)
+                for block in self._iter_dequantized(snapshot, snapshot['vectors'])
+            ]) if len(entity_ids) else np.empty(0, dtype=np.float32)
+
+        mode = "精确" if snapshot['centroids'] is None else f"IVF, {snapshot['centroids'].shape[0]}个分区"
+        logger.info(f"内存向量索引构建完成({mode}): {len(entity_ids)}个实体, 量化方式 {self.quantization}, "
+                    f"向量占用 {snapshot['vectors'].nbytes / 1024 / 1024:.1f}MB")
+        return snapshot
+
+    def _quantize(self, snapshot, data: np.ndarray):
+        """按量化方式转换快照中的向量存储"""
+        if self.quantization == 'float16':
+            snapshot['vectors'] = data.astype(np.float16)
+        elif self.quantization == 'int8' and data.shape[0]:
+            # 按维度的min/max线性映射到[-128, 127]
+            lower = data.min(axis=0)
+            scale = (data.max(axis=0) - lower) / 255.0
+            scale[scale == 0] = 1.0
+            codes = np.rint((data - lower) / scale) - 128.0
+            snapshot['vectors'] = np.clip(codes, -128, 127).astype(np.int8)
+            snapshot['quant_scale'] = scale.astype(np.float32)
+            snapshot['quant_offset'] = (lower + 128.0 * scale).astype(np.float32)
+
+    def _iter_dequantized(self, snapshot, data: np.ndarray):
+        """分块返回float32向量，非量化存储时直接返回原数组"""
+        if data.dtype == np.float32:
+            yield data
+            return
+        for start in range(0, data.shape[0], self.DEQUANTIZE_CHUNK):
+            block = data[start:start + self.DEQUANTIZE_CHUNK].astype(np.float32)
+            if snapshot['quant_scale'] is not None:
+                block *= snapshot['quant_scale']
+                block += snapshot['quant_offset']
+            yield block
+
+    def _build_attributes(self, count: int, attributes: Dict[str, List]) -> Dict:
+        """
+        将过滤属性转换为数组：TAG字段编码为int32取值编号（-1表示缺失）并保存取值表，
+        NUMERIC字段转换为int64（0表示缺失）
+        """
+        arrays = {}
+        for field in TAG_ATTRIBUTES:
+            values = attributes.get(field)
+            if values is None:
+                continue
+            vocabulary = {}
+            codes = np.full(count, -1, dtype=np.int32)
+            for i, value in enumerate(values):
+                if value is None or value == '':
+                    continue
+                value = _to_str(value)
+                codes[i] = vocabulary.setdefault(value, len(vocabulary))
+            arrays[field] = (codes, vocabulary)
+        for field in NUMERIC_ATTRIBUTES:
+            values = attributes.get(field)
+            if values is None:
+                continue
+            numbers = [normalize_date(_to_str(v)) if isinstance(v, bytes) else normalize_date(v) for v in values]
+            arrays[field] = np.array([0 if v is None else v for v in numbers], dtype=np.int64)
+        return arrays
+
+    def load_from_redis(self, redis_client, key_prefix: str = 'entity:', vector_field: str = 'vector',
+                        scan_count: int = 1000, vector_type: str = 'FLOAT32') -> int:
+        """
+        从Redis哈希数据镜像构建索引
+
+        Args:
+            redis_client: 不解码响应的Redis客户端
+            key_prefix: 实体哈希键前缀
+            vector_field: 向量字段名
+            scan_count: 每次SCAN的数量，同时作为HMGET管道的批大小
+            vector_type: Redis中向量的存储类型（FLOAT32/FLOAT16）
+
+        Returns:
+            加载的实体数量
+        """
+        self._source = dict(redis_client=redis_client, key_prefix=key_prefix, vector_field=vector_field,
+                            scan_count=scan_count, vector_type=vector_type)
+        entity_ids, vectors, labels = [], [], []
+        attributes = {field: [] for field in TAG_ATTRIBUTES + NUMERIC_ATTRIBUTES}
+        dtype = vector_dtype(vector_type)
+
+        keys = []
+        for key in redis_client.scan_iter(match=f"{key_prefix}*", count=scan_count):
+            keys.append(key)
+            if len(keys) >= scan_count:
+                self._load_hash_chunk(redis_client, keys, key_prefix, vector_field, entity_ids, vectors, labels,
+                                      attributes, dtype)
+                keys = []
+        if keys:
+            self._load_hash_chunk(redis_client, keys, key_prefix, vector_field, entity_ids, vectors, labels,
+                                  attributes, dtype)
+
+        if not entity_ids:
+            # 保留已有快照
+            logger.warning(f"Redis中没有找到前缀为{key_prefix}的实体向量")
+            return 0
+
+        self.build(entity_ids, np.vstack(vectors), labels, attributes)
+        return len(entity_ids)
+
+    def reload(self) -> Optional[int]:
+        """按上次load_from_redis的参数重新加载，没有从Redis加载过时返回None"""
+        if self._source is None:
+            return None
+        return self.load_from_redis(**self._source)
+
+    def _load_hash_chunk(self, redis_client, keys, key_prefix, vector_field, entity_ids, vectors, labels,
+                         attributes, dtype=np.float32):
+        """批量读取一组实体哈希"""
+        attribute_fields = TAG_ATTRIBUTES + NUMERIC_ATTRIBUTES
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, 'entity_id', 'label', vector_field, *attribute_fields)
+
+        for key, (entity_id, label, blob, *attribute_values) in zip(keys, pipe.execute()):
+            if blob is None:
+                continue
+            vector = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+            if vectors and vector.shape[0] != vectors[0].shape[0]:
+                logger.warning(f"实体向量维度不一致，已跳过: {key}")
+                continue
+            if entity_id is None:
+                # 没有entity_id字段时使用键名去掉前缀作为实体ID
+                entity_id = key.decode('utf-8') if isinstance(key, bytes) else key
+                entity_id = entity_id[len(key_prefix):]
+            elif isinstance(entity_id, bytes):
+                entity_id = entity_id.decode('utf-8')
+            try:
+                label = int(label) if label is not None else None
+            except (ValueError, TypeError):
+                label = None
+
+            entity_ids.append(entity_id)
+            vectors.append(vector)
+            labels.append(label)
+            for field, value in zip(attribute_fields, attribute_values):
+                attributes[field].append(value)
+
+    def search_batch(self, vectors_128d: List[np.ndarray], k: int = 10,
+                     ef_runtime: Optional[int] = None, filters=None) -> List[List[Dict]]:
+        """ef_runtime对内存索引无意义（精确检索或固定nprobe的IVF检索），忽略"""
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot['ids']:
+            return [[] for _ in vectors_128d]
+
+        valid_indices = [i for i, vector in enumerate(vectors_128d) if vector is not None]
+        if not valid_indices:
+            return [[] for _ in vectors_128d]
+
+        queries = self._prepare_vectors(np.asarray([vectors_128d[i] for i in valid_indices], dtype=np.float32))
+        rows = self._search_rows(snapshot, queries, valid_indices, len(vectors_128d), k, filters)
+        return [[] if row is None else self._to_entities(snapshot, *row) for row in rows]
+
+    def _search_rows(self, snapshot, queries: np.ndarray, valid_indices: List[int], count: int, k: int,
+                     filters=None) -> List:
+        """
+        检索Top-k的快照下标
+
+        Args:
+            snapshot: 索引快照
+            queries: 已预处理的查询矩阵，第row行对应输入中的第valid_indices[row]条
+            valid_indices: 有效查询在输入中的下标
+            count: 输入查询条数
+            k: 每条查询返回的数量
+            filters: 整个批次共用的SearchFilter，或与输入一一对应的SearchFilter列表
+
+        Returns:
+            与输入顺序一致的(下标数组, 距离数组)列表，无效查询或无候选时为None
+        """
+        results = [None] * count
+        search_filters = _expand_filters(filters, count)
+
+        # 相同过滤条件的查询一起检索，候选集只计算一次
+        groups = {}
+        for row, i in enumerate(valid_indices):
+            search_filter = search_filters[i]
+            key = None if search_filter is None else search_filter.to_query()
+            groups.setdefault(key, (search_filter, []))[1].append(row)
+
+        for search_filter, rows in groups.values():
+            mask = None if search_filter is None else self._filter_mask(snapshot, search_filter)
+            candidates = None if mask is None else np.flatnonzero(mask)
+            if candidates is not None and candidates.size == 0:
+                continue
+
+            if snapshot['centroids'] is None or (candidates is not None and candidates.size <= self.exact_threshold):
+                top_indices, top_distances = self._search_exact(snapshot, queries[rows], k, candidates)
+                for offset, row in enumerate(rows):
+                    results[valid_indices[row]] = (top_indices[offset], top_distances[offset])
+            else:
+                for row in rows:
+                    results[valid_indices[row]] = self._search_ivf(snapshot, queries[row], k, mask)
+
+        return results
+
+    def _filter_mask(self, snapshot, search_filter: SearchFilter) -> np.ndarray:
+        """计算满足过滤条件的实体掩码，索引中没有的属性视为全部不匹配"""
+        if search_filter.expression is not None:
+            raise ValueError("内存向量索引不支持原始过滤表达式")
+
+        attributes = snapshot['attributes']
+        mask = np.ones(len(snapshot['ids']), dtype=bool)
+        for field, values in search_filter.tags.items():
+            if field not in attributes:
+                return np.zeros_like(mask)
+            codes, vocabulary = attributes[field]
+            wanted = [vocabulary[value] for value in values if value in vocabulary]
+            mask &= np.isin(codes, wanted)
+
+        if search_filter.date_from is not None or search_filter.date_to is not None:
+            dates = attributes.get('activity_date')
+            if dates is None:
+                return np.zeros_like(mask)
+            mask &= dates > 0
+            if search_filter.date_from is not None:
+                mask &= dates >= search_filter.date_from
+            if search_filter.date_to is not None:
+                mask &= dates <= search_filter.date_to
+        return mask
+
+    def _prepare_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        """COSINE度量下预先归一化，检索时只需内积"""
+        if self.metric != 'COSINE':
+            return vectors
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _distances(self, snapshot, queries: np.ndarray, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """计算查询向量到候选向量的距离矩阵"""
+        data = snapshot['vectors'] if candidates is None else snapshot['vectors'][candidates]
+        if data.dtype == np.float32:
+            products = queries @ data.T
+        else:
+            blocks = [queries @ block.T for block in self._iter_dequantized(snapshot, data)]
+            products = np.hstack(blocks) if blocks else np.empty((queries.shape[0], 0), dtype=np.float32)
+        if self.metric == 'L2':
+            sq_norms = snapshot['sq_norms'] if candidates is None else snapshot['sq_norms'][candidates]
+            query_sq_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+            return np.maximum(query_sq_norms + sq_norms[None, :] - 2 * products, 0.0)
+        return 1.0 - products
+
+    def _search_exact(self, snapshot, queries: np.ndarray, k: int, candidates: Optional[np.ndarray] = None):
+        """精确检索：一次矩阵乘法得到全部（或候选集内的）距离，再用argpartition取Top-k"""
+        distances = self._distances(snapshot, queries, candidates)
+        k = min(k, distances.shape[1])
+        if k < distances.shape[1]:
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(distances.shape[1]), (distances.shape[0], 1))
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        if candidates is not None:
+            top = candidates[top]
+        return top, np.take_along_axis(top_distances, order, axis=1)
+
+    def _search_ivf(self, snapshot, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        """IVF检索：先选nprobe个最近分区，再在分区候选集（满足过滤条件的部分）内精确排序"""
+        centroids = snapshot['centroids']
+        nprobe = min(self.nprobe, centroids.shape[0])
+        centroid_distances = self._centroid_distances(centroids, query)
+        probes = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([snapshot['lists'][c] for c in probes])
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if candidates.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        distances = self._distances(snapshot, query[None, :], candidates)[0]
+        k = min(k, distances.shape[0])
+        top = np.argpartition(distances, k - 1)[:k] if k < distances.shape[0] else np.arange(distances.shape[0])
+        top = top[np.argsort(distances[top])]
+        return candidates[top], distances[top]
+
+    def _centroid_distances(self, centroids: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """分区选择统一使用欧氏距离平方"""
+        if queries.ndim == 1:
+            diff = centroids - queries[None, :]
+            return np.einsum('ij,ij->i', diff, diff)
+        return (np.einsum('ij,ij->i', queries, queries)[:, None]
+                + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+                - 2 * queries @ centroids.T)
+
+    def _train_ivf(self, data: np.ndarray):
+        """
+        训练IVF粗聚类
+
+        Returns:
+            (centroids, assignments)
+        """
+        n = data.shape[0]
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+
+        # 在采样子集上训练聚类中心，避免大规模数据时训练过慢
+        sample_size = min(n, nlist * 256)
+        sample = data[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iters):
+            assignments = np.argmin(self._centroid_distances(centroids, sample), axis=1)
+            for c in range(nlist):
+                members = sample[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+
+        # 分块分配全量数据，控制距离矩阵的内存占用
+        assignments = np.empty(n, dtype=np.int32)
+        chunk = 65536
+        for start in range(0, n, chunk):
+            assignments[start:start + chunk] = np.argmin(
+                self._centroid_distances(centroids, data[start:start + chunk]), axis=1)
+        return centroids, assignments
+
+    def _to_entities(self, snapshot, indices, distances) -> List[Dict]:
+        """将索引下标转换为相似实体列表"""
+        ids = snapshot['ids']
+        labels = snapshot['labels']
+        return [
+            {
+                'entity_id': ids[idx],
+                'similarity_score': float(distance),
+                'label': int(labels[idx]) if labels[idx] >= 0 else None
+            }
+            for idx, distance in zip(indices, distances)
+        ]
+
+    def get_stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "backend": self.name,
+            "available": self.is_available(),
+            "metric": self.metric,
+            "size": len(self),
+            "mode": "unavailable" if snapshot is None else ("exact" if snapshot['centroids'] is None else "ivf"),
+            "nlist": None if snapshot is None or snapshot['centroids'] is None else int(snapshot['centroids'].shape[0]),
+            "nprobe": self.nprobe,
+            "quantization": self.quantization,
+            "vector_bytes": 0 if snapshot is None else int(snapshot['vectors'].nbytes)
+        }
+
+
+def create_search_backend(backend_type: str, redis_client=None, index_name: str = 'entity_vectors',
+                          key_prefix: str = 'entity:', async_client_factory: Optional[Callable] = None,
+                          vector_type: str = 'FLOAT32', label_store=None, **kwargs) -> VectorSearchBackend:
+    """
+    根据配置创建向量检索后端
+
+    Args:
+        backend_type: 'redis' 或 'memory'
+        redis_client: Redis客户端，memory后端用于镜像加载哈希数据
+        index_name: RediSearch索引名
+        key_prefix: 实体哈希键前缀
+        async_client_factory: redis后端的asyncio客户端工厂函数
+        vector_type: Redis中向量的存储类型（FLOAT32/FLOAT16）
+        label_store: redis后端使用的进程内标签表，memory后端的标签已在索引快照中
+        **kwargs: 传给InMemoryVectorIndex的参数，redis后端忽略
+
+    Returns:
+        向量检索后端实例
+    """
+    backend_type = (backend_type or 'redis').lower()
+
+    if backend_type == 'redis':
+        return RediSearchBackend(redis_client, index_name=index_name, key_prefix=key_prefix,
+                                 async_client_factory=async_client_factory, vector_type=vector_type,
+                                 label_store=label_store)
+
+    if backend_type == 'memory':
+        index = InMemoryVectorIndex(**kwargs)
+        if redis_client is not None:
+            try:
+                count = index.load_from_redis(redis_client, key_prefix=key_prefix, vector_type=vector_type)
+                logger.info(f"从Redis镜像加载了{count}个实体向量")
+            except Exception as e:
+                logger.error(f"从Redis镜像加载实体向量失败: {e}")
+        return index
+
+    raise ValueError(f"未知的向量检索后端: {backend_type}")
@@ -0,0 +1,389 @@
+import time
+import queue
+import random
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 队列满时的处理方式
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+
+class CallbackDispatcher:
+    """
+    回调结果投递器
+
+    固定数量的工作线程从有界队列中取结果POST到回调URL，每个工作线程持有一个keep-alive的
+    requests.Session，连接在请求之间复用，不再为每条结果新建线程和TCP连接。
+
+    - 队列满时按overflow_policy处理：block（阻塞等待block_timeout秒后丢弃）、
+      drop_newest（丢弃新结果）、drop_oldest（丢弃最早排队的结果）
+    - 连接错误、超时、429和5xx按指数退避重试max_retries次，其他4xx不重试
+    - on_done回调在投递结束（成功或最终失败）后以(result, success)调用
+
+    指定batch_url且batch_size大于1时启用批量模式：工作线程等待第一条结果后在batch_linger秒内
+    最多聚合batch_size条，以JSON数组POST到batch_url。接收方按顺序返回每条结果的状态
+    （{"results": [{"requestId": ..., "status": "OK" | "ERROR", "message": ...}]}），
+    状态为ERROR的结果视为被接收方拒绝，不再重试；整批请求失败时按上述规则重试整批。
+    响应不是JSON、缺少逐条状态或条数/requestId与请求不一致时无法确认哪些结果被接收，整批视为失败。
+    """
+
+    def __init__(self, url: str, workers: int = 8, max_queue_size: int = 10000, overflow_policy: str = 'block',
+                 block_timeout: float = 1.0, max_retries: int = 3, retry_delay: float = 2.0,
+                 max_retry_delay: float = 30.0, timeout: float = 30.0, batch_url: Optional[str] = None,
+                 batch_size: int = 1, batch_linger: float = 0.05):
+        """
+        Args:
+            url: 回调URL
+            workers: 工作线程数（同时也是到回调服务的最大连接数）
+            max_queue_size: 队列容量
+            overflow_policy: 队列满时的处理方式，见OVERFLOW_POLICIES
+            block_timeout: block策略下最长等待时间（秒）
+            max_retries: 最大重试次数
+            retry_delay: 首次重试前的等待时间（秒），之后每次翻倍
+            max_retry_delay: 单次重试等待时间上限（秒）
+            timeout: 单次HTTP请求超时（秒）
+            batch_url: 批量回调URL，为None时逐条投递
+            batch_size: 每批最多投递的结果数
+            batch_linger: 批量模式下等待凑批的最长时间（秒）
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"不支持的队列溢出策略: {overflow_policy}")
+
+        self.url = url
+        self.workers = max(int(workers), 1)
+        self.overflow_policy = overflow_policy
+        self.block_timeout = float(block_timeout)
+        self.max_retries = max(int(max_retries), 0)
+        self.retry_delay = float(retry_delay)
+        self.max_retry_delay = float(max_retry_delay)
+        self.timeout = float(timeout)
+        self.batch_url = batch_url
+        self.batch_size = max(int(batch_size), 1)
+        self.batch_linger = float(batch_linger)
+        self.bulk = bool(batch_url) and self.batch_size > 1
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopped = threading.Event()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            'submitted': 0,
+            'delivered': 0,
+            'failed': 0,
+            'retries': 0,
+            'dropped': 0,
+            'deferred': 0,
+            'rejected': 0,
+            'batches': 0,
+            'total_latency_ms': 0.0
+        }
+        # 失败原因 -> 次数（如status_500、timeout、connection_error）
+        self._failure_reasons = {}
+
+        self._threads = []
+        for i in range(self.workers):
+            target = self._batch_worker if self.bulk else self._worker
+            thread = threading.Thread(target=target, name=f'callback-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, result: Dict, on_done: Optional[Callable[[Dict, bool], None]] = None,
+               block: bool = True) -> bool:
+        """
+        提交一条待投递的结果
+
+        Args:
+            result: 回调请求体
+            on_done: 投递结束后的回调(result, success)
+            block: 为False时block策略下队列满也不等待，直接返回False（不调用on_done，由调用方重试），
+                   用于不能阻塞的线程（如pika的I/O线程）
+
+        Returns:
+            False表示结果没有进入投递队列（按溢出策略丢弃，或不等待时队列已满）
+        """
+        if self._stopped.is_set():
+            return False
+        item = (result, on_done, time.perf_counter())
+
+        try:
+            if self.overflow_policy == 'block' and block:
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow_policy == 'block' and not block:
+                with self._lock:
+                    self._stats['deferred'] += 1
+                return False
+            if self.overflow_policy != 'drop_oldest':
+                self._drop(result, on_done)
+                return False
+            # 丢弃最早排队的结果，为新结果腾出位置
+            try:
+                oldest = self._queue.get_nowait()
+                self._drop(oldest[0], oldest[1])
+                self._queue.task_done()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._drop(result, on_done)
+                return False
+
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def send(self, result: Dict) -> bool:
+        """在调用线程中同步投递一条结果（带重试），使用调用线程自己的keep-alive会话"""
+        return self._deliver(result)
+
+    def close(self, timeout: float = 10.0):
+        """停止接收新结果，等待队列中已有的结果投递完成"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    def get_stats(self) -> Dict:
+        """获取投递统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+            stats['failure_reasons'] = dict(self._failure_reasons)
+        finished = stats['delivered'] + stats['failed']
+        stats['avg_latency_ms'] = round(stats.pop('total_latency_ms') / finished, 3) if finished else 0.0
+        if self.bulk:
+            stats['avg_batch_size'] = round(finished / stats['batches'], 2) if stats['batches'] else 0.0
+        stats.update({
+            'queue_size': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'workers': self.workers,
+            'overflow_policy': self.overflow_policy,
+            'max_retries': self.max_retries,
+            'bulk': self.bulk,
+            'batch_size': self.batch_size if self.bulk else 1,
+            'batch_linger': self.batch_linger if self.bulk else 0.0
+        })
+        return stats
+
+    def _drop(self, result: Dict, on_done):
+        with self._lock:
+            self._stats['dropped'] += 1
+        logger.warning(f"回调队列已满，丢弃结果: {result.get('requestId', 'unknown')}")
+        self._notify(on_done, result, False)
+
+    def _worker(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            try:
+                result, on_done, queued_at = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                self._in_flight += 1
+            try:
+                success = self._deliver(result)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._stats['total_latency_ms'] += (time.perf_counter() - queued_at) * 1000
+                self._queue.task_done()
+            self._notify(on_done, result, success)
+
+    def _batch_worker(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            with self._lock:
+                self._in_flight += len(batch)
+            try:
+                outcomes = self._deliver_batch([result for result, _, _ in batch])
+            finally:
+                now = time.perf_counter()
+                with self._lock:
+                    self._in_flight -= len(batch)
+                    self._stats['total_latency_ms'] += sum((now - queued_at) * 1000 for _, _, queued_at in batch)
+                for _ in batch:
+                    self._queue.task_done()
+            for (result, on_done, _), success in zip(batch, outcomes):
+                self._notify(on_done, result, success)
+
+    def _collect_batch(self) -> List:
+        """等待第一条结果，然后在batch_linger内最多聚合batch_size条"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.batch_linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stopped.is_set():
+                    # 超过等待时间或正在关闭时，只取队列中已有的结果
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _session(self) -> requests.Session:
+        """当前线程的keep-alive会话"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Content-Type': 'application/json'})
+            self._local.session = session
+        return session
+
+    def _reset_session(self):
+        session = getattr(self._local, 'session', None)
+        self._local.session = None
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def _deliver(self, result: Dict) -> bool:
+        """POST一条结果，可重试的失败按指数退避重试"""
+        request_id = result.get('requestId', 'unknown')
+        response, reason = self._post(self.url, result)
+        if response is not None:
+            with self._lock:
+                self._stats['delivered'] += 1
+            logger.debug(f"回调成功: {request_id}")
+            return True
+
+        with self._lock:
+            self._stats['failed'] += 1
+            self._failure_reasons[reason] = self._failure_reasons.get(reason, 0) + 1
+        logger.warning(f"回调失败({reason})，已放弃: {request_id}")
+        return False
+
+    def _deliver_batch(self, results: List[Dict]) -> List[bool]:
+        """
+        以JSON数组POST一批结果
+
+        Returns:
+            每条结果是否投递成功，与results顺序一致
+        """
+        response, reason = self._post(self.batch_url, results)
+        with self._lock:
+            self._stats['batches'] += 1
+        if response is None:
+            with self._lock:
+                self._stats['failed'] += len(results)
+                self._failure_reasons[reason] = self._failure_reasons.get(reason, 0) + len(results)
+            logger.warning(f"批量回调失败({reason})，已放弃{len(results)}条结果")
+            return [False] * len(results)
+
+        outcomes = self._parse_batch_statuses(response, results)
+        if outcomes is None:
+            with self._lock:
+                self._stats['failed'] += len(results)
+                self._failure_reasons['invalid_response'] = \
+                    self._failure_reasons.get('invalid_response', 0) + len(results)
+            logger.warning(f"批量回调响应中没有与请求一致的逐条状态，{len(results)}条结果视为失败")
+            return [False] * len(results)
+
+        rejected = outcomes.count(False)
+        with self._lock:
+            self._stats['delivered'] += len(outcomes) - rejected
+            self._stats['failed'] += rejected
+            self._stats['rejected'] += rejected
+            if rejected:
+                self._failure_reasons['rejected'] = self._failure_reasons.get('rejected', 0) + rejected
+        if rejected:
+            logger.warning(f"批量回调中{rejected}/{len(results)}条结果被接收方拒绝")
+        logger.debug(f"批量回调成功: {len(results) - rejected}/{len(results)}")
+        return outcomes
+
+    @staticmethod
+    def _parse_batch_statuses(response, results: List[Dict]) -> Optional[List[bool]]:
+        """
+        解析批量回调响应中的逐条状态
+
+        Returns:
+            每条结果是否被接收（状态为OK且requestId一致），响应中没有与请求一致的逐条状态时返回None
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            return None
+        statuses = body.get('results') if isinstance(body, dict) else body
+        if not isinstance(statuses, list) or len(statuses) != len(results):
+            return None
+
+        outcomes = []
+        for result, status in zip(results, statuses):
+            if not isinstance(status, dict):
+                return None
+            request_id = status.get('requestId')
+            if request_id is not None and request_id != result.get('requestId'):
+                return None
+            outcomes.append(str(status.get('status', '')).upper() == 'OK')
+        return outcomes
+
+    def _post(self, url: str, payload) -> Tuple[Optional[requests.Response], Optional[str]]:
+        """
+        POST请求体，连接错误、超时、429和5xx按指数退避重试
+
+        Returns:
+            (成功时的响应, 最终失败时的原因)
+        """
+        reason = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session().post(url, json=payload, timeout=self.timeout)
+                if 200 <= response.status_code < 300:
+                    return response, None
+                reason = f"status_{response.status_code}"
+                # 请求本身有问题，重试也不会成功
+                retryable = response.status_code == 429 or response.status_code >= 500
+            except requests.Timeout:
+                reason, retryable = 'timeout', True
+            except requests.ConnectionError:
+                reason, retryable = 'connection_error', True
+                # 连接可能已被服务端关闭，丢弃会话重新建立
+                self._reset_session()
+            except Exception as e:
+                reason, retryable = type(e).__name__, False
+                logger.error(f"发送回调请求失败: {e}")
+
+            # 关闭过程中最多重试一次，避免拖长退出时间
+            if not retryable or attempt >= self.max_retries or (self._stopped.is_set() and attempt > 0):
+                break
+            with self._lock:
+                self._stats['retries'] += 1
+            delay = min(self.retry_delay * (2 ** attempt), self.max_retry_delay)
+            # 加入抖动，避免所有工作线程同时重试
+            time.sleep(delay * random.uniform(0.5, 1.0))
+        return None, reason
+
+    @staticmethod
+    def _notify(on_done, result: Dict, success: bool):
+        if on_done is None:
+            return
+        try:
+            on_done(result, success)
+        except Exception as e:
+            logger.error(f"回调完成通知出错: {e}")
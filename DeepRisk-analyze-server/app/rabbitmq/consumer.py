@@ -4,15 +4,18 @@ import threading
 import logging
 import asyncio
 import aiohttp
-import torch
 import numpy as np
-import redis
 import time
 import os
+import math
+import queue
 from typing import List, Dict
 from collections import deque
 from app.config import Config
-from app.models.model_loader import get_encoder
+from app.redis_pool import get_redis_client, get_pool_stats
+from app.models.vector_search import SearchFilter
+from app.models.model_loader import encode_vectors
+from app.rabbitmq.callback_dispatcher import CallbackDispatcher
 
 # 添加FraudDetectionCore的导入
 try:
@@ -26,6 +29,22 @@ except ImportError as e:
 
 logger = logging.getLogger(__name__)
 
+
+def build_connection_params():
+    """根据Config构造RabbitMQ连接参数"""
+    return pika.ConnectionParameters(
+        host=Config.RABBITMQ_HOST,
+        port=Config.RABBITMQ_PORT,
+        virtual_host=Config.RABBITMQ_VHOST,
+        credentials=pika.PlainCredentials(
+            Config.RABBITMQ_USERNAME,
+            Config.RABBITMQ_PASSWORD
+        ),
+        heartbeat=600,
+        blocked_connection_timeout=300
+    )
+
+
 class RiskAssessmentConsumer:
     def __init__(self, app=None):
         self.app = app
@@ -37,42 +56,54 @@ class RiskAssessmentConsumer:
         self._fraud_detector = None
         self.last_error = None
         
-        # 异步HTTP会话
-        self._http_session = None
+        # 回调结果投递器（工作线程池 + keep-alive会话）
+        self._callback_dispatcher = None
         
         # 批处理相关配置
         self.batch_queue = deque()  # 存储待处理的消息
         self.batch_size = 16  # 根据测试结果，16是平衡性能和稳定性的批处理大小
         self.batch_timeout = 0.02  # 优化超时时间
-        self.last_batch_time = time.time()  # 上次批处理时间
+        self._flush_timer = None  # 批处理超时定时器，由pika在消费线程的I/O循环中触发
+        
+        # 推理流水线：I/O线程解码后的批次 -> 有界队列 -> 推理工作线程 -> 经add_callback_threadsafe回到I/O线程确认
+        self.inference_workers = max(Config.CONSUMER_INFERENCE_WORKERS, 0)
+        # 至少容纳预取数量的消息凑成的满批次，正常情况下I/O线程提交批次时不会遇到队列已满
+        self._work_queue = queue.Queue(maxsize=max(
+            Config.CONSUMER_WORK_QUEUE_SIZE, math.ceil(Config.RABBITMQ_PREFETCH_COUNT / self.batch_size), 1
+        ))
+        self._worker_threads = []
+        self._pipeline_lock = threading.Lock()
+        self._queued_messages = 0  # 已进入推理队列、尚未被工作线程取走的消息数
+        self._inflight_batches = 0  # 已进入推理队列、尚未完成确认的批次数
+        self._deferred_flushes = 0  # 推理队列已满、批次留待下次定时器提交的次数
+        self._pending_callbacks = 0  # 结果已进入投递队列、等待投递结果后再确认的消息数
+        self._connection = None
+        self._channel = None
 
     def init_app(self, app):
         """初始化配置"""
         self.app = app
         try:
             # 使用Config类而不是app.config
-            self._connection_params = pika.ConnectionParameters(
-                host=Config.RABBITMQ_HOST,
-                port=Config.RABBITMQ_PORT,
-                virtual_host=Config.RABBITMQ_VHOST,
-                credentials=pika.PlainCredentials(
-                    Config.RABBITMQ_USERNAME,
-                    Config.RABBITMQ_PASSWORD
-                ),
-                heartbeat=600,
-                blocked_connection_timeout=300
-            )
+            self._connection_params = build_connection_params()
+            
+            if Config.CALLBACK_URL:
+                self._callback_dispatcher = CallbackDispatcher(
+                    Config.CALLBACK_URL,
+                    workers=Config.CALLBACK_WORKERS,
+                    max_queue_size=Config.CALLBACK_QUEUE_SIZE,
+                    overflow_policy=Config.CALLBACK_OVERFLOW_POLICY,
+                    block_timeout=Config.CALLBACK_BLOCK_TIMEOUT,
+                    max_retries=Config.CALLBACK_MAX_RETRIES,
+                    retry_delay=Config.CALLBACK_RETRY_DELAY,
+                    timeout=Config.CALLBACK_TIMEOUT,
+                    batch_url=Config.CALLBACK_BATCH_URL if Config.CALLBACK_BATCH_ENABLED else None,
+                    batch_size=Config.CALLBACK_BATCH_SIZE,
+                    batch_linger=Config.CALLBACK_BATCH_LINGER_MS / 1000
+                )
             
-            # 初始化Redis客户端
-            self._redis_client = redis.Redis(
-                host=Config.REDIS_HOST,
-                port=Config.REDIS_PORT,
-                db=Config.REDIS_DB,
-                password=Config.REDIS_PASSWORD,
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5
-            )
+            # 初始化Redis客户端（共享连接池的文本视图）
+            self._redis_client = get_redis_client(decode_responses=True)
             
             # 测试Redis连接
             self._redis_client.ping()
@@ -106,20 +137,34 @@ class RiskAssessmentConsumer:
             logger.error("消费者未正确初始化")
             return
             
+        self._worker_threads = []
+        for i in range(self.inference_workers):
+            thread = threading.Thread(target=self._inference_worker, name=f'inference-worker-{i}', daemon=True)
+            thread.start()
+            self._worker_threads.append(thread)
+        
         self._consumer_thread = threading.Thread(target=self._consume_messages, daemon=True)
         self._consumer_thread.start()
-        logger.info("消费者线程已启动")
+        logger.info(f"消费者线程已启动，推理工作线程: {self.inference_workers}")
 
     def stop_consuming(self):
         """停止消费者"""
         self._stop_event.set()
+        # 在I/O线程中取消消费，start_consuming返回后由消费线程等待流水线中的批次确认完成
+        connection, channel = self._connection, self._channel
+        if connection is not None and channel is not None:
+            try:
+                connection.add_callback_threadsafe(channel.stop_consuming)
+            except Exception as e:
+                logger.warning(f"取消消费失败: {e}")
         if self._consumer_thread and self._consumer_thread.is_alive():
-            self._consumer_thread.join(timeout=5)
+            self._consumer_thread.join(timeout=10)
+        for thread in self._worker_threads:
+            thread.join(timeout=1)
         
-        # 关闭HTTP会话
-        if self._http_session:
-            # 注意：这里需要异步关闭，但在同步环境中我们只能尽量处理
-            pass
+        # 投递完队列中剩余的回调结果
+        if self._callback_dispatcher is not None:
+            self._callback_dispatcher.close()
             
         logger.info("消费者已停止")
 
@@ -130,9 +175,14 @@ class RiskAssessmentConsumer:
                 connection = pika.BlockingConnection(self._connection_params)
                 channel = connection.channel()
                 
+                # 旧连接上未确认的消息会由RabbitMQ重新投递，丢弃本地残留的批次和定时器
+                self.batch_queue.clear()
+                self._flush_timer = None
+                self._connection, self._channel = connection, channel
+                
                 # 声明队列
                 channel.queue_declare(queue=Config.RABBITMQ_QUEUE, durable=True)
-                channel.basic_qos(prefetch_count=50)  # 调整预取数量为50
+                channel.basic_qos(prefetch_count=Config.RABBITMQ_PREFETCH_COUNT)
                 
                 # 设置回调函数
                 channel.basic_consume(
@@ -143,8 +193,13 @@ class RiskAssessmentConsumer:
                 
                 logger.info(f"等待消息，队列: {Config.RABBITMQ_QUEUE}")
                 
-                # 启动消费
-                channel.start_consuming()
+                # 启动消费（stop_consuming可能在连接建立期间被调用）
+                if not self._stop_event.is_set():
+                    channel.start_consuming()
+                
+                # stop_consuming取消了消费：继续处理I/O事件，直到流水线中的批次都已确认
+                self._drain_pipeline(connection)
+                connection.close()
                 
             except Exception as e:
                 if not self._stop_event.is_set():
@@ -166,27 +221,61 @@ class RiskAssessmentConsumer:
             }
             self.batch_queue.append(message_info)
             
-            # 检查是否应该处理批处理
-            current_time = time.time()
-            if (len(self.batch_queue) >= self.batch_size or 
-                current_time - self.last_batch_time >= self.batch_timeout):
-                self._process_batch()
-                self.last_batch_time = current_time
+            # 批次已满立即处理；否则由批次第一条消息启动的定时器保证batch_timeout内处理，
+            # 不依赖后续消息的到达
+            if len(self.batch_queue) >= self.batch_size:
+                self._flush_batch(channel.connection)
+            elif self._flush_timer is None:
+                self._schedule_flush(channel.connection)
                 
         except Exception as e:
             logger.error(f"批处理消息处理错误: {e}")
             channel.basic_nack(method.delivery_tag, requeue=False)
 
+    def _schedule_flush(self, connection):
+        """batch_timeout秒后处理当前批次（call_later的回调在start_consuming所在的线程中执行）"""
+        self._flush_timer = connection.call_later(self.batch_timeout, lambda: self._on_flush_timer(connection))
+
+    def _on_flush_timer(self, connection):
+        """批处理超时：无论批次是否凑满都立即处理"""
+        self._flush_timer = None
+        try:
+            self._flush_batch(connection)
+        except Exception as e:
+            logger.error(f"定时批处理出错: {e}")
+
+    def _flush_batch(self, connection):
+        """处理当前批次，队列中仍有剩余消息时为其重新启动定时器"""
+        if self._flush_timer is not None:
+            connection.remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        if self._stop_event.is_set():
+            # 正在停止：不再提交新批次，未确认的消息在连接关闭后由RabbitMQ重新投递
+            return
+        self._process_batch()
+        if self.batch_queue:
+            self._schedule_flush(connection)
+
     def _process_batch(self):
         """处理批处理消息"""
         if not self.batch_queue:
             return
+        
+        if self._worker_threads and self._work_queue.full():
+            # 推理队列已满（大量不满批的小批次）：消息留在batch_queue中，由_flush_batch重新启动的定时器
+            # 稍后再提交，I/O线程不等待；积压的消息受预取数量限制，RabbitMQ不会继续投递
+            self._deferred_flushes += 1
+            return
             
         batch_messages = []
         # 取出批处理大小的消息
         batch_count = min(len(self.batch_queue), self.batch_size)
         for _ in range(batch_count):
             batch_messages.append(self.batch_queue.popleft())
+        
+        # 上报积压（未成批的消息和等待推理的消息），积压越多相似度查询越保守（较低的EF_RUNTIME）
+        if self._fraud_detector is not None:
+            self._fraud_detector.update_load(len(self.batch_queue) + self._queued_messages)
             
         # 只在批处理较大时记录日志
         if batch_count >= 8:
@@ -216,7 +305,8 @@ class RiskAssessmentConsumer:
                             'doctor_id': doctor_id,
                             'channel': msg_info['channel'],
                             'method': msg_info['method'],
-                            'original_message': message
+                            'original_message': message,
+                            'search_filter': self._build_search_filter(message)
                         })
                     else:
                         # 向量无效，直接处理并确认
@@ -227,22 +317,23 @@ class RiskAssessmentConsumer:
                     msg_info['channel'].basic_nack(msg_info['method'].delivery_tag, requeue=False)
             
             if vectors_35d:
-                # 批量处理向量
-                results = self._batch_process_vectors(vectors_35d, message_details)
-                
-                # 发送结果并确认消息（使用异步回调）
-                for i, (result, msg_detail) in enumerate(zip(results, message_details)):
+                if self._worker_threads:
+                    # 交给推理工作线程，I/O线程立即返回继续收消息和处理心跳。
+                    # 只有I/O线程向队列提交，上面已确认队列未满，put_nowait不会失败
+                    with self._pipeline_lock:
+                        self._queued_messages += len(message_details)
+                        self._inflight_batches += 1
                     try:
-                        # 异步发送回调，不阻塞消息确认
-                        self._send_result_async_fire_and_forget(result)
-                        # 立即确认消息
-                        msg_detail['channel'].basic_ack(msg_detail['method'].delivery_tag)
-                        # 只在批处理较大时记录成功日志
-                        if batch_count >= 8:
-                            logger.info(f"消息处理成功并确认: {msg_detail['request_id']}")
-                    except Exception as e:
-                        logger.error(f"处理单个消息结果时出错: {e}")
-                        msg_detail['channel'].basic_nack(msg_detail['method'].delivery_tag, requeue=False)
+                        self._work_queue.put_nowait(
+                            (message_details[0]['channel'].connection, vectors_35d, message_details)
+                        )
+                    except queue.Full:
+                        with self._pipeline_lock:
+                            self._queued_messages -= len(message_details)
+                            self._inflight_batches -= 1
+                        raise
+                else:
+                    self._settle(self._infer_batch(vectors_35d, message_details))
                         
         except Exception as e:
             logger.error(f"批处理执行失败: {e}")
@@ -250,6 +341,156 @@ class RiskAssessmentConsumer:
             for msg_info in batch_messages:
                 msg_info['channel'].basic_nack(msg_info['method'].delivery_tag, requeue=True)
 
+    def _inference_worker(self):
+        """推理工作线程：编码、KNN查询、提交回调，再把确认交回连接所在的I/O线程"""
+        while not (self._stop_event.is_set() and self._work_queue.empty()):
+            try:
+                connection, vectors_35d, message_details = self._work_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            with self._pipeline_lock:
+                self._queued_messages -= len(message_details)
+            settlements = None
+            try:
+                # 连接已断开时消息会被重新投递，不再处理
+                if connection.is_open:
+                    settlements = self._infer_batch(vectors_35d, message_details)
+            except Exception as e:
+                logger.error(f"批处理执行失败: {e}")
+                settlements = [(msg_detail['channel'], msg_detail['method'].delivery_tag, 'requeue')
+                               for msg_detail in message_details]
+            finally:
+                self._work_queue.task_done()
+            
+            try:
+                if settlements is None:
+                    raise RuntimeError("连接已关闭")
+                # pika的连接和通道不是线程安全的，确认必须在I/O线程中执行
+                connection.add_callback_threadsafe(lambda settlements=settlements: self._settle(settlements))
+            except Exception as e:
+                with self._pipeline_lock:
+                    self._inflight_batches -= 1
+                logger.warning(f"无法确认{len(message_details)}条消息（{e}），将由RabbitMQ重新投递")
+
+    def _infer_batch(self, vectors_35d, message_details):
+        """
+        批量评分并提交回调
+        
+        Returns:
+            [(channel, delivery_tag, 'ack' | 'nack' | 'requeue')]，由_settle在I/O线程中执行；
+            等待投递结果的消息不在其中，由_on_callback_done确认
+        """
+        results = self._batch_process_vectors(vectors_35d, message_details)
+        # 没有推理工作线程时在I/O线程中执行，投递队列满时不能等待
+        block = bool(self._worker_threads)
+        
+        settlements = []
+        for result, msg_detail in zip(results, message_details):
+            try:
+                # 异步发送回调；回调未进入投递队列时重新入队，由RabbitMQ重新投递
+                action = self._submit_result(result, msg_detail['channel'], msg_detail['method'], block=block)
+                if action is None:
+                    # 等待投递结果，由_on_callback_done确认
+                    continue
+                if action == 'ack':
+                    # 只在批处理较大时记录成功日志
+                    if len(message_details) >= 8:
+                        logger.info(f"消息处理成功: {msg_detail['request_id']}")
+                else:
+                    logger.warning(f"回调未能提交，消息重新入队: {msg_detail['request_id']}")
+            except Exception as e:
+                logger.error(f"处理单个消息结果时出错: {e}")
+                action = 'nack'
+            settlements.append((msg_detail['channel'], msg_detail['method'].delivery_tag, action))
+        return settlements
+
+    def _submit_result(self, result, channel, method, block: bool):
+        """
+        提交一条回调结果
+        
+        ACK_ON_CALLBACK_FAILURE为false时消息在投递完成后才确认，投递失败（包括批量回调中被逐条拒绝）的消息
+        与未能提交的消息一样重新入队
+        
+        Returns:
+            需要立即执行的确认动作'ack' | 'requeue'，None表示等待投递结果后由_on_callback_done确认
+        """
+        if self._callback_dispatcher is None or Config.ACK_ON_CALLBACK_FAILURE:
+            return 'ack' if self._send_result_async_fire_and_forget(result, block=block) else 'requeue'
+        
+        notified = []
+        
+        def on_done(result, success):
+            notified.append(success)
+            self._on_callback_done(channel, method, success)
+        
+        with self._pipeline_lock:
+            self._pending_callbacks += 1
+        if self._send_result_async_fire_and_forget(result, block=block, on_done=on_done) or notified:
+            # 按溢出策略丢弃时投递器已同步通知on_done，同样由_on_callback_done处理
+            return None
+        with self._pipeline_lock:
+            self._pending_callbacks -= 1
+        return 'requeue'
+
+    def _on_callback_done(self, channel, method, success: bool):
+        """投递结束（在投递器的工作线程中调用）：把确认交回连接所在的I/O线程"""
+        if success:
+            action = 'ack'
+        elif getattr(method, 'redelivered', False):
+            # 已重新投递过仍然失败，不再入队，避免接收方持续拒绝的结果反复投递
+            logger.error(f"回调投递再次失败，拒绝消息: {method.delivery_tag}")
+            action = 'nack'
+        else:
+            logger.warning(f"回调投递失败，消息重新入队: {method.delivery_tag}")
+            action = 'requeue'
+        
+        def settle():
+            try:
+                self._settle_messages([(channel, method.delivery_tag, action)])
+            finally:
+                with self._pipeline_lock:
+                    self._pending_callbacks -= 1
+        
+        try:
+            channel.connection.add_callback_threadsafe(settle)
+        except Exception as e:
+            with self._pipeline_lock:
+                self._pending_callbacks -= 1
+            logger.warning(f"无法确认消息{method.delivery_tag}（{e}），将由RabbitMQ重新投递")
+
+    def _settle(self, settlements):
+        """在I/O线程中确认或拒绝一批消息，完成流水线中的一个批次"""
+        self._settle_messages(settlements)
+        if self._worker_threads:
+            with self._pipeline_lock:
+                self._inflight_batches -= 1
+
+    def _settle_messages(self, settlements):
+        """在I/O线程中逐条确认或拒绝"""
+        for channel, delivery_tag, action in settlements:
+            try:
+                if not channel.is_open:
+                    continue
+                if action == 'ack':
+                    channel.basic_ack(delivery_tag)
+                else:
+                    channel.basic_nack(delivery_tag, requeue=(action == 'requeue'))
+            except Exception as e:
+                logger.error(f"确认消息失败: {e}")
+
+    def _drain_pipeline(self, connection, timeout: float = 8.0):
+        """处理I/O事件直到推理队列中的批次和等待投递结果的消息都已确认或超时，未确认的消息在连接关闭后重新投递"""
+        deadline = time.monotonic() + timeout
+        while (self._inflight_batches > 0 or self._pending_callbacks > 0) and time.monotonic() < deadline:
+            connection.process_data_events(time_limit=0.1)
+
+    def _build_search_filter(self, message):
+        """根据消息中的业务类型和租户构造KNN预过滤条件，未启用预过滤时返回None"""
+        if not Config.KNN_PREFILTER_ENABLED:
+            return None
+        return SearchFilter(business_type=message.get('businessType'), tenant=message.get('tenant'))
+
     def _batch_process_vectors(self, vectors_35d, message_details):
         """批量处理向量"""
         results = []
@@ -263,16 +504,21 @@ class RiskAssessmentConsumer:
                 doctor_ids = [msg_detail['doctor_id'] for msg_detail in message_details]
                 
                 # 使用批处理方法处理所有向量
-                batch_results = self._fraud_detector.process_vectors_batch(vectors_35d, doctor_ids)
+                batch_results = self._fraud_detector.process_vectors_batch(
+                    vectors_35d, doctor_ids,
+                    search_filters=[msg_detail['search_filter'] for msg_detail in message_details]
+                )
                 
                 # 转换为所需的返回格式
                 for i, fraud_result in enumerate(batch_results):
                     msg_detail = message_details[i]
                     result = {
                         "requestId": msg_detail['request_id'],
-                        "status": "SUCCESS" if "error" not in fraud_result else "ERROR",
+                        # 相似度查询超时或熔断时为DEGRADED
+                        "status": "ERROR" if "error" in fraud_result else fraud_result.get("status", "SUCCESS"),
                         "doctorId": fraud_result.get("doctor_id"),
-                        "fraudScore": fraud_result.get("fraud_score", 0.0),
+                        # DEGRADED结果没有评分，不能当作0分
+                        "fraudScore": None if fraud_result.get("status") == "DEGRADED" else fraud_result.get("fraud_score", 0.0),
                         "fraudLevel": fraud_result.get("fraud_level", "未知"),
                         "similarDoctors": fraud_result.get("similar_doctors", []),
                         "processed": True
@@ -332,25 +578,13 @@ class RiskAssessmentConsumer:
     def _batch_encode_vectors(self, vectors_35d):
         """批量编码向量"""
         try:
-            encoder, scaler = get_encoder()
-            if encoder is None or scaler is None:
-                return [None] * len(vectors_35d)
-            
             # 转换为numpy数组
             vectors_array = np.array(vectors_35d, dtype=np.float32)
             
-            # 批量标准化
-            vectors_scaled = scaler.transform(vectors_array)
-            
-            # 转换为PyTorch张量
-            vectors_tensor = torch.FloatTensor(vectors_scaled)
-            
-            # 批量编码
-            with torch.no_grad():
-                vectors_128d = encoder(vectors_tensor)
-            
-            # 转换回numpy数组
-            results = vectors_128d.numpy()
+            # 批量编码（融合编码器或torch编码器）
+            results = encode_vectors(vectors_array)
+            if results is None:
+                return [None] * len(vectors_35d)
             
             # 转换为列表
             return [results[i].flatten().astype(np.float32) for i in range(results.shape[0])]
@@ -370,74 +604,48 @@ class RiskAssessmentConsumer:
                 "processed": True
             }
             
-            # 异步发送回调，不阻塞消息确认
-            self._send_result_async_fire_and_forget(result)
-            # 立即确认消息
-            channel.basic_ack(method.delivery_tag)
+            # 在I/O线程中执行，投递队列满时不能等待；未提交的消息重新入队
+            action = self._submit_result(result, channel, method, block=False)
+            if action == 'ack':
+                channel.basic_ack(method.delivery_tag)
+            elif action == 'requeue':
+                channel.basic_nack(method.delivery_tag, requeue=True)
         except Exception as e:
             logger.error(f"处理无效向量时出错: {e}")
             channel.basic_nack(method.delivery_tag, requeue=False)
 
-    def _send_result_async_fire_and_forget(self, result):
-        """发送结果到回调URL（"fire and forget"方式）"""
+    def _send_result_async_fire_and_forget(self, result, block: bool = True, on_done=None):
+        """
+        发送结果到回调URL（"fire and forget"方式）
+        
+        Args:
+            result: 回调请求体
+            block: 投递队列满时是否等待（I/O线程中调用时为False）
+            on_done: 投递结束后的回调(result, success)
+            
+        Returns:
+            结果是否进入投递队列
+        """
         try:
-            if not hasattr(Config, 'CALLBACK_URL') or not Config.CALLBACK_URL:
+            if self._callback_dispatcher is None:
                 logger.warning("未配置回调URL")
                 return True  # 如果没有配置回调URL，则认为成功
             
-            # 使用fire and forget方式发送HTTP请求
-            # 这里我们创建一个独立的线程来发送请求，但不等待结果
-            thread = threading.Thread(target=self._send_http_request, args=(result,))
-            thread.daemon = True
-            thread.start()
-            
-            return True
+            # 放入投递队列后立即返回，由投递器的工作线程发送（失败按退避重试）
+            return self._callback_dispatcher.submit(result, on_done, block=block)
         except Exception as e:
-            logger.error(f"启动异步回调请求失败: {e}")
+            logger.error(f"提交异步回调请求失败: {e}")
             return False
 
-    def _send_http_request(self, result):
-        """在独立线程中发送HTTP请求"""
-        try:
-            import requests
-            # 发送HTTP POST请求
-            response = requests.post(
-                Config.CALLBACK_URL,
-                json=result,
-                timeout=30,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"回调成功: {result.get('requestId', 'unknown')}")
-            else:
-                logger.warning(f"回调失败，状态码: {response.status_code}")
-        except Exception as e:
-            logger.error(f"发送回调请求失败: {e}")
-
     def _send_result(self, result):
         """发送结果到回调URL（同步方法，为兼容性保留）"""
         try:
-            if not hasattr(Config, 'CALLBACK_URL') or not Config.CALLBACK_URL:
+            if self._callback_dispatcher is None:
                 logger.warning("未配置回调URL")
                 return True  # 如果没有配置回调URL，则认为成功
             
-            # 发送HTTP POST请求
-            import requests
-            response = requests.post(
-                Config.CALLBACK_URL,
-                json=result,
-                timeout=30,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"回调成功: {result.get('requestId', 'unknown')}")
-                return True
-            else:
-                logger.warning(f"回调失败，状态码: {response.status_code}")
-                return False
-                
+            # 在当前线程中使用keep-alive会话发送，失败按退避重试
+            return self._callback_dispatcher.send(result)
         except Exception as e:
             logger.error(f"发送回调请求失败: {e}")
             return False
@@ -465,11 +673,23 @@ class RiskAssessmentConsumer:
             'running': self._consumer_thread is not None and self._consumer_thread.is_alive(),
             'batch_queue_size': len(self.batch_queue),
             'batch_size': self.batch_size,
+            'pipeline': {
+                'inference_workers': len(self._worker_threads),
+                'work_queue_size': self._work_queue.qsize(),
+                'work_queue_capacity': self._work_queue.maxsize,
+                'queued_messages': self._queued_messages,
+                'inflight_batches': self._inflight_batches,
+                'deferred_flushes': self._deferred_flushes,
+                'pending_callbacks': self._pending_callbacks
+            },
             'last_error': self.last_error,
             'queue': Config.RABBITMQ_QUEUE if hasattr(Config, 'RABBITMQ_QUEUE') else 'unknown',
             'exchange': Config.RABBITMQ_EXCHANGE if hasattr(Config, 'RABBITMQ_EXCHANGE') else 'unknown',
             'routing_key': Config.RABBITMQ_ROUTING_KEY if hasattr(Config, 'RABBITMQ_ROUTING_KEY') else 'unknown',
-            'thread_alive': self._consumer_thread is not None and self._consumer_thread.is_alive() if hasattr(self, '_consumer_thread') else False
+            'thread_alive': self._consumer_thread is not None and self._consumer_thread.is_alive() if hasattr(self, '_consumer_thread') else False,
+            'redis_pools': get_pool_stats(),
+            'vector_search': self._fraud_detector.get_search_stats() if self._fraud_detector is not None else None,
+            'callback': self._callback_dispatcher.get_stats() if self._callback_dispatcher is not None else None
         }
         return status
 
@@ -3,15 +3,16 @@ import json
 import threading
 import logging
 import requests
-import torch
 import numpy as np
-import redis
 import time
 import pymysql
 from typing import List, Dict
 from collections import deque
 from app.config import Config
-from app.models.model_loader import get_encoder
+from app.redis_pool import get_redis_client
+from app.models.vector_search import SearchFilter
+from app.models.model_loader import encode_vectors
+from app.models.vector_encoding import encode_vector
 
 # 添加FraudDetectionCore的导入
 try:
@@ -40,7 +41,7 @@ class OptimizedRiskAssessmentConsumer:
         self.batch_queue = deque()  # 存储待处理的消息
         self.batch_size = 32  # 批处理大小
         self.batch_timeout = 0.1  # 批处理超时时间（秒）
-        self.last_batch_time = time.time()  # 上次批处理时间
+        self._flush_timer = None  # 批处理超时定时器，由pika在消费线程的I/O循环中触发
 
     def init_app(self, app):
         """初始化配置"""
@@ -59,16 +60,8 @@ class OptimizedRiskAssessmentConsumer:
                 blocked_connection_timeout=300
             )
             
-            # 初始化Redis客户端
-            self._redis_client = redis.Redis(
-                host=Config.REDIS_HOST,
-                port=Config.REDIS_PORT,
-                db=Config.REDIS_DB,
-                password=Config.REDIS_PASSWORD,
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5
-            )
+            # 初始化Redis客户端（共享连接池的文本视图）
+            self._redis_client = get_redis_client(decode_responses=True)
             
             # 测试Redis连接
             self._redis_client.ping()
@@ -122,6 +115,10 @@ class OptimizedRiskAssessmentConsumer:
                 connection = pika.BlockingConnection(self._connection_params)
                 channel = connection.channel()
                 
+                # 旧连接上未确认的消息会由RabbitMQ重新投递，丢弃本地残留的批次和定时器
+                self.batch_queue.clear()
+                self._flush_timer = None
+                
                 # 声明队列
                 channel.queue_declare(queue=Config.RABBITMQ_QUEUE, durable=True)
                 channel.basic_qos(prefetch_count=100)  # 增加预取数量以支持批处理
@@ -160,18 +157,39 @@ class OptimizedRiskAssessmentConsumer:
             }
             self.batch_queue.append(message_info)
             
-            # 检查是否应该处理批处理
-            current_time = time.time()
-            if (len(self.batch_queue) >= self.batch_size or 
-                current_time - self.last_batch_time >= self.batch_timeout):
-                self._process_batch()
-                self.last_batch_time = current_time
+            # 批次已满立即处理；否则由批次第一条消息启动的定时器保证batch_timeout内处理，
+            # 不依赖后续消息的到达
+            if len(self.batch_queue) >= self.batch_size:
+                self._flush_batch(channel.connection)
+            elif self._flush_timer is None:
+                self._schedule_flush(channel.connection)
                 
         except Exception as e:
             logger.error(f"批处理消息处理错误: {e}")
             print(f"[批处理] 消息处理错误: {e}")
             channel.basic_nack(method.delivery_tag, requeue=False)
 
+    def _schedule_flush(self, connection):
+        """batch_timeout秒后处理当前批次（call_later的回调在start_consuming所在的线程中执行）"""
+        self._flush_timer = connection.call_later(self.batch_timeout, lambda: self._on_flush_timer(connection))
+
+    def _on_flush_timer(self, connection):
+        """批处理超时：无论批次是否凑满都立即处理"""
+        self._flush_timer = None
+        try:
+            self._flush_batch(connection)
+        except Exception as e:
+            logger.error(f"定时批处理出错: {e}")
+
+    def _flush_batch(self, connection):
+        """处理当前批次，队列中仍有剩余消息时为其重新启动定时器"""
+        if self._flush_timer is not None:
+            connection.remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        self._process_batch()
+        if self.batch_queue:
+            self._schedule_flush(connection)
+
     def _process_batch(self):
         """处理批处理消息"""
         if not self.batch_queue:
@@ -182,6 +200,10 @@ class OptimizedRiskAssessmentConsumer:
         batch_count = min(len(self.batch_queue), self.batch_size)
         for _ in range(batch_count):
             batch_messages.append(self.batch_queue.popleft())
+        
+        # 上报剩余积压，积压越多相似度查询越保守（较低的EF_RUNTIME）
+        if self._fraud_detector is not None:
+            self._fraud_detector.update_load(len(self.batch_queue))
             
         print(f"[批处理] 开始处理批处理，包含 {len(batch_messages)} 条消息")
         logger.info(f"开始处理批处理，包含 {len(batch_messages)} 条消息")
@@ -210,7 +232,8 @@ class OptimizedRiskAssessmentConsumer:
                             'doctor_id': doctor_id,
                             'channel': msg_info['channel'],
                             'method': msg_info['method'],
-                            'original_message': message
+                            'original_message': message,
+                            'search_filter': self._build_search_filter(message)
                         })
                     else:
                         # 向量无效，直接处理并确认
@@ -245,6 +268,12 @@ class OptimizedRiskAssessmentConsumer:
             for msg_info in batch_messages:
                 msg_info['channel'].basic_nack(msg_info['method'].delivery_tag, requeue=True)
 
+    def _build_search_filter(self, message):
+        """根据消息中的业务类型和租户构造KNN预过滤条件，未启用预过滤时返回None"""
+        if not Config.KNN_PREFILTER_ENABLED:
+            return None
+        return SearchFilter(business_type=message.get('businessType'), tenant=message.get('tenant'))
+
     def _batch_process_vectors(self, vectors_35d, message_details):
         """批量处理向量"""
         results = []
@@ -259,19 +288,27 @@ class OptimizedRiskAssessmentConsumer:
                 for i, vector_35d in enumerate(vectors_35d):
                     msg_detail = message_details[i]
                     try:
-                        fraud_result = self._fraud_detector.process_vector(vector_35d, msg_detail['doctor_id'])
+                        fraud_result = self._fraud_detector.process_vector(
+                            vector_35d, msg_detail['doctor_id'], search_filter=msg_detail['search_filter']
+                        )
                         
                         result = {
                             "requestId": msg_detail['request_id'],
-                            "status": "SUCCESS",
-                            "doctorId": msg_detail['doctor_id'],
-                            "vector_35d": fraud_result.get("vector_35d", vector_35d.tolist()),
-                            "vector_128d": fraud_result.get("vector_128d", []),
-                            "fraudScore": fraud_result.get("fraud_score", 0.0),
+                            # 相似度查询超时或熔断时为DEGRADED
+                            "status": fraud_result.get("status", "SUCCESS"),
+                            "doctorId": msg_detail['doctor_id']
+                        }
+                        # 仅在full结果配置下转发向量，避免每条回调都携带原始向量
+                        for vector_key in ("vector_35d", "vector_128d"):
+                            if vector_key in fraud_result:
+                                result[vector_key] = fraud_result[vector_key]
+                        result.update({
+                            # DEGRADED结果没有评分，不能当作0分
+                            "fraudScore": None if fraud_result.get("status") == "DEGRADED" else fraud_result.get("fraud_score", 0.0),
                             "fraudLevel": fraud_result.get("fraud_level", "未知"),
                             "similarDoctors": fraud_result.get("similar_doctors", []),
                             "processed": True
-                        }
+                        })
                         results.append(result)
                     except Exception as e:
                         logger.error(f"处理向量时出错: {e}")
@@ -302,14 +339,17 @@ class OptimizedRiskAssessmentConsumer:
                         result = {
                             "requestId": msg_detail['request_id'],
                             "status": "SUCCESS",
-                            "doctorId": msg_detail['doctor_id'],
-                            "vector_35d": vectors_35d[i].tolist(),
-                            "vector_128d": vector_128d.tolist(),
+                            "doctorId": msg_detail['doctor_id']
+                        }
+                        if Config.RESULT_PROFILE == 'full':
+                            result["vector_35d"] = encode_vector(vectors_35d[i], Config.RESULT_VECTOR_ENCODING)
+                            result["vector_128d"] = encode_vector(vector_128d, Config.RESULT_VECTOR_ENCODING)
+                        result.update({
                             "fraudScore": fraud_score,
                             "fraudLevel": fraud_level,
                             "similarDoctors": similar_doctors,
                             "processed": True
-                        }
+                        })
                     else:
                         result = {
                             "requestId": msg_detail['request_id'],
@@ -338,25 +378,13 @@ class OptimizedRiskAssessmentConsumer:
     def _batch_encode_vectors(self, vectors_35d):
         """批量编码向量"""
         try:
-            encoder, scaler = get_encoder()
-            if encoder is None or scaler is None:
-                return [None] * len(vectors_35d)
-            
             # 转换为numpy数组
             vectors_array = np.array(vectors_35d, dtype=np.float32)
             
-            # 批量标准化
-            vectors_scaled = scaler.transform(vectors_array)
-            
-            # 转换为PyTorch张量
-            vectors_tensor = torch.FloatTensor(vectors_scaled)
-            
-            # 批量编码
-            with torch.no_grad():
-                vectors_128d = encoder(vectors_tensor)
-            
-            # 转换回numpy数组
-            results = vectors_128d.numpy()
+            # 批量编码（融合编码器或torch编码器）
+            results = encode_vectors(vectors_array)
+            if results is None:
+                return [None] * len(vectors_35d)
             
             # 转换为列表
             return [results[i].flatten().astype(np.float32) for i in range(results.shape[0])]
@@ -0,0 +1,411 @@
+import gc
+import os
+import sys
+import time
+import queue
+import atexit
+import signal
+import logging
+import threading
+import multiprocessing
+from typing import Dict, List, Optional
+
+from app.config import Config
+from app.rabbitmq.consumer import RiskAssessmentConsumer, build_connection_params
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 连续崩溃时重启等待时间的上限（秒）
+MAX_RESTART_DELAY = 60.0
+# 运行超过该时间（秒）后退出视为偶发崩溃，重启等待时间重新从restart_delay开始
+STABLE_SECONDS = 60.0
+
+
+def resolve_process_count(value) -> int:
+    """
+    解析消费者进程数配置
+
+    Args:
+        value: 进程数，'auto'或小于等于0时取CPU核数
+
+    Returns:
+        进程数（至少为1）
+    """
+    if isinstance(value, str) and value.strip().lower() == 'auto':
+        return os.cpu_count() or 1
+    count = int(value)
+    return count if count > 0 else (os.cpu_count() or 1)
+
+
+def _detach_wakeup_fd():
+    """fork出的进程继承了父进程事件循环的信号唤醒fd，不解除时本进程收到的信号会被转发给父进程的事件循环"""
+    try:
+        signal.set_wakeup_fd(-1)
+    except (ValueError, OSError):
+        pass
+
+
+def _run_worker(index: int, status_queue, report_interval: float):
+    """
+    子进程入口：在fork出的进程中运行一个独立的消费者（独立的AMQP连接和预取、Redis连接池、推理线程）
+
+    Args:
+        index: 子进程编号
+        status_queue: 上报状态的队列
+        report_interval: 上报间隔（秒）
+    """
+    parent_pid = os.getppid()
+    # 退出时不等待状态队列的后台线程把数据写完，父进程可能已停止读取
+    status_queue.cancel_join_thread()
+    _detach_wakeup_fd()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    # Ctrl+C会发给整个进程组，子进程由父进程统一停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # 每个进程只用一个torch线程，由多进程提供并行度，避免线程数超过核数
+    if 'torch' in sys.modules:
+        try:
+            sys.modules['torch'].set_num_threads(1)
+        except Exception:
+            pass
+
+    print(f"[消费者进程{index}] 启动，PID: {os.getpid()}")
+    consumer = RiskAssessmentConsumer()
+    consumer.init_app(None)
+    if not consumer._setup_complete:
+        logger.error(f"消费者进程{index}初始化失败: {consumer.last_error}")
+        sys.exit(1)
+    consumer.start_consuming()
+
+    exit_code = 0
+    while not stop_event.wait(report_interval):
+        try:
+            status_queue.put_nowait((index, os.getpid(), time.time(), consumer.get_status()))
+        except Exception as e:
+            logger.warning(f"消费者进程{index}上报状态失败: {e}")
+        if consumer.get_consumer_status() != 'running':
+            logger.error(f"消费者进程{index}的消费线程已退出")
+            exit_code = 1
+            break
+        if os.getppid() != parent_pid:
+            # 父进程被强制结束，子进程随之退出，避免脱离管理继续消费
+            logger.warning(f"消费者进程{index}的父进程已退出")
+            break
+
+    consumer.stop_consuming()
+    sys.exit(exit_code)
+
+
+def _run_zygote(control, parent_control, status_queue, report_interval: float, stop_timeout: float = 20.0):
+    """
+    模板进程入口：在父进程加载模型后fork出来，此后只有这一个线程，
+    消费者进程（包括崩溃后的替换进程）都由它fork，避免在有多个线程运行的Web进程中fork。
+
+    通过control管道接收父进程的指令，回报子进程的PID和退出码：
+    - ('spawn', index) -> ('started', index, pid)
+    - ('stop',) 结束全部子进程 -> 每个子进程('exited', index, pid, exitcode)，最后('stopped',)
+    - 子进程退出 -> ('exited', index, pid, exitcode)
+    父进程退出（管道关闭）时结束全部子进程后退出。
+
+    Args:
+        control: 与父进程通信的Connection
+        parent_control: fork时继承的父进程一端，关闭后父进程退出时才能读到EOF
+        status_queue: 子进程上报状态的队列
+        report_interval: 子进程上报状态的间隔（秒）
+        stop_timeout: 停止时等待子进程确认完在途消息的时间（秒）
+    """
+    parent_control.close()
+    _detach_wakeup_fd()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    context = multiprocessing.get_context('fork')
+    children: Dict[int, multiprocessing.Process] = {}
+
+    def reap():
+        for index, process in list(children.items()):
+            if not process.is_alive():
+                control.send(('exited', index, process.pid, process.exitcode))
+                process.close()
+                del children[index]
+
+    def stop_children():
+        for process in children.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + stop_timeout
+        for process in children.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"消费者进程{process.pid}未能按时退出，强制结束")
+                process.kill()
+                process.join(1)
+        reap()
+
+    while True:
+        try:
+            command = control.recv() if control.poll(0.5) else None
+        except (EOFError, OSError):
+            # 父进程已退出
+            break
+        if command is not None and command[0] == 'spawn':
+            index = command[1]
+            process = context.Process(
+                target=_run_worker, args=(index, status_queue, report_interval),
+                # 守护进程：模板进程异常退出时由multiprocessing结束子进程
+                name=f"risk-consumer-{index}", daemon=True
+            )
+            process.start()
+            children[index] = process
+            control.send(('started', index, process.pid))
+        elif command is not None and command[0] == 'stop':
+            stop_children()
+            control.send(('stopped',))
+        reap()
+
+    stop_children()
+
+
+class ConsumerSupervisor:
+    """
+    多进程消费者管理
+
+    构造时（应在load_models()之后、启动消费者和其他后台线程之前）执行一次gc.freeze()，
+    然后fork出单线程的模板进程，此后全部消费者进程及其替换进程都由模板进程fork：
+    模型权重和其他只读对象在fork前分配，子进程通过写时复制共享这些内存页，
+    gc.freeze()避免垃圾回收扫描这些对象时写入GC头部而触发页复制；
+    Web进程之后启动的线程（HTTP、Redis、监控线程等）持有的锁不会被fork到子进程中。
+    每个子进程有自己的AMQP连接和预取，不受父进程GIL限制。
+
+    监控线程定期收集子进程上报的状态，子进程退出后按指数退避通知模板进程重启。
+    对外提供与RiskAssessmentConsumer相同的start_consuming/stop_consuming/get_status接口，
+    /consumer路由无需区分单进程和多进程模式。
+    """
+
+    def __init__(self, processes: int, report_interval: float = 5.0, restart_delay: float = 1.0,
+                 stop_timeout: float = 20.0):
+        """
+        Args:
+            processes: 消费者进程数
+            report_interval: 子进程上报状态的间隔（秒）
+            restart_delay: 子进程退出后首次重启的等待时间（秒），连续崩溃时翻倍
+            stop_timeout: 停止时等待子进程确认完在途消息的时间（秒），超时则强制结束
+        """
+        self.processes = max(int(processes), 1)
+        self.report_interval = float(report_interval)
+        self.restart_delay = float(restart_delay)
+        self.stop_timeout = float(stop_timeout)
+
+        self._context = multiprocessing.get_context('fork')
+        self._status_queue = self._context.Queue(maxsize=self.processes * 16)
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = [self._new_slot(index) for index in range(self.processes)]
+        self._connection_params = None
+        # 与RiskAssessmentConsumer一致，/consumer/control路由据此判断是否在运行
+        self._consumer_thread = None
+        self._setup_complete = False
+        self.last_error = None
+
+        # fork前冻结已有对象（包括模型权重），模板进程和子进程中的垃圾回收不再触碰这些内存页；只执行一次
+        gc.collect()
+        gc.freeze()
+        self._control, zygote_control = self._context.Pipe()
+        self._zygote = self._context.Process(
+            target=_run_zygote,
+            args=(zygote_control, self._control, self._status_queue, self.report_interval, self.stop_timeout),
+            name='risk-consumer-zygote'
+        )
+        self._zygote.start()
+        zygote_control.close()
+        # 关闭管道后模板进程自行退出，multiprocessing在退出时等待它（atexit后注册的先执行）
+        atexit.register(self._control.close)
+
+    @staticmethod
+    def _new_slot(index: int) -> Dict:
+        return {
+            'index': index,
+            'pid': None,
+            'alive': False,
+            'started_at': None,
+            'restarts': 0,
+            'failures': 0,
+            'restart_at': None,
+            'last_exit_code': None,
+            'reported_at': None,
+            'status': None
+        }
+
+    def init_app(self, app):
+        """与RiskAssessmentConsumer接口一致；父进程只保存连接参数用于连接测试，不建立连接"""
+        try:
+            self._connection_params = build_connection_params()
+            self._setup_complete = True
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"ConsumerSupervisor初始化失败: {e}")
+
+    def start_consuming(self):
+        """通知模板进程fork全部消费者进程，并启动监控线程"""
+        if self._consumer_thread is not None:
+            return
+        if not self._zygote.is_alive():
+            self.last_error = "模板进程已退出，无法启动消费者进程"
+            logger.error(self.last_error)
+            return
+        self._stop_event.clear()
+
+        for slot in self._workers:
+            self._spawn(slot)
+        self._consumer_thread = threading.Thread(target=self._monitor, name='consumer-supervisor', daemon=True)
+        self._consumer_thread.start()
+        logger.info(f"已启动{self.processes}个消费者进程")
+        print(f"[消费者管理] 已启动{self.processes}个消费者进程")
+
+    def stop_consuming(self):
+        """通知模板进程向全部子进程发送SIGTERM，等待其确认完在途消息后退出，超时则强制结束"""
+        self._stop_event.set()
+        if self._consumer_thread is not None:
+            self._consumer_thread.join(timeout=5)
+            self._consumer_thread = None
+
+        if not self._zygote.is_alive():
+            return
+        try:
+            self._control.send(('stop',))
+            deadline = time.monotonic() + self.stop_timeout + 5
+            while time.monotonic() < deadline:
+                if self._control.poll(0.5) and self._handle_event(self._control.recv()) == 'stopped':
+                    break
+        except (EOFError, OSError) as e:
+            logger.warning(f"停止消费者进程失败: {e}")
+        logger.info("全部消费者进程已停止")
+
+    def _spawn(self, slot: Dict):
+        """通知模板进程fork一个消费者进程，PID在模板进程回报started后记录"""
+        with self._lock:
+            slot.update(restart_at=None, status=None, reported_at=None)
+        self._control.send(('spawn', slot['index']))
+
+    def _handle_event(self, event) -> str:
+        """处理模板进程回报的事件，返回事件类型"""
+        kind = event[0]
+        if kind == 'started':
+            _, index, pid = event
+            with self._lock:
+                self._workers[index].update(pid=pid, alive=True, started_at=time.time())
+        elif kind == 'exited':
+            _, index, pid, exit_code = event
+            self._on_exit(self._workers[index], pid, exit_code)
+        return kind
+
+    def _on_exit(self, slot: Dict, pid: int, exit_code):
+        """子进程退出：稳定运行一段时间后的退出不计入连续崩溃，按连续崩溃次数计算重启等待时间"""
+        now = time.time()
+        with self._lock:
+            if slot['pid'] != pid:
+                return
+            slot['alive'] = False
+            slot['last_exit_code'] = exit_code
+            if self._stop_event.is_set():
+                return
+            if slot['started_at'] is not None and now - slot['started_at'] >= STABLE_SECONDS:
+                slot['failures'] = 0
+            delay = min(self.restart_delay * (2 ** slot['failures']), MAX_RESTART_DELAY)
+            slot['failures'] += 1
+            slot['restart_at'] = now + delay
+        logger.warning(f"消费者进程{slot['index']}(PID {pid})退出，退出码: {exit_code}，{delay:.1f}秒后重启")
+
+    def _monitor(self):
+        """收集状态上报和模板进程的事件，重启已退出的子进程"""
+        while not self._stop_event.is_set():
+            self._collect_reports(timeout=0.5)
+            try:
+                while self._control.poll():
+                    self._handle_event(self._control.recv())
+            except (EOFError, OSError) as e:
+                self.last_error = f"模板进程已退出: {e}"
+                logger.error(self.last_error)
+                return
+
+            now = time.time()
+            for slot in self._workers:
+                if slot['restart_at'] is not None and now >= slot['restart_at'] and not self._stop_event.is_set():
+                    with self._lock:
+                        slot['restarts'] += 1
+                    self._spawn(slot)
+
+    def _collect_reports(self, timeout: float):
+        try:
+            reports = [self._status_queue.get(timeout=timeout)]
+        except queue.Empty:
+            return
+        except Exception as e:
+            logger.warning(f"读取消费者进程状态失败: {e}")
+            return
+        while True:
+            try:
+                reports.append(self._status_queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            for index, pid, reported_at, status in reports:
+                slot = self._workers[index]
+                # 忽略已被替换的旧进程的迟到上报
+                if slot['pid'] == pid:
+                    slot['reported_at'] = reported_at
+                    slot['status'] = status
+
+    def _get_connection(self):
+        """获取RabbitMQ连接（用于/consumer/test-connection）"""
+        import pika
+        if not self._setup_complete:
+            raise Exception("消费者未正确初始化")
+        return pika.BlockingConnection(self._connection_params)
+
+    def get_consumer_status(self):
+        """全部子进程运行时为running，部分运行时为degraded"""
+        alive = sum(1 for slot in self._workers if slot['alive'])
+        if alive == self.processes:
+            return "running"
+        if alive > 0:
+            return "degraded"
+        return "initialized" if self._setup_complete else "stopped"
+
+    def get_status(self) -> Dict:
+        """汇总各子进程上报的状态"""
+        now = time.time()
+        workers: List[Dict] = []
+        totals = {'batch_queue_size': 0, 'queued_messages': 0, 'callback_delivered': 0, 'callback_failed': 0}
+        with self._lock:
+            for slot in self._workers:
+                status: Optional[Dict] = slot['status']
+                workers.append({
+                    'index': slot['index'],
+                    'pid': slot['pid'],
+                    'alive': slot['alive'],
+                    'restarts': slot['restarts'],
+                    'last_exit_code': slot['last_exit_code'],
+                    'report_age_seconds': round(now - slot['reported_at'], 1) if slot['reported_at'] else None,
+                    'status': status
+                })
+                if status:
+                    totals['batch_queue_size'] += status.get('batch_queue_size', 0)
+                    totals['queued_messages'] += (status.get('pipeline') or {}).get('queued_messages', 0)
+                    callback = status.get('callback') or {}
+                    totals['callback_delivered'] += callback.get('delivered', 0)
+                    totals['callback_failed'] += callback.get('failed', 0)
+
+        return {
+            'mode': 'multiprocess',
+            'initialized': self._setup_complete,
+            'running': self._consumer_thread is not None and self._consumer_thread.is_alive(),
+            'processes': self.processes,
+            'zygote_alive': self._zygote.is_alive(),
+            'alive': sum(1 for worker in workers if worker['alive']),
+            'restarts': sum(worker['restarts'] for worker in workers),
+            'totals': totals,
+            'last_error': self.last_error,
+            'queue': Config.RABBITMQ_QUEUE,
+            'workers': workers
+        }
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import threading
+import redis
+from redis import asyncio as redis_asyncio
+from redis.client import Pipeline
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# 进程级连接池注册表：(host, port, db, password) -> BlockingConnectionPool
+_pools = {}
+# asyncio连接池注册表：(事件循环id, host, port, db, password) -> asyncio BlockingConnectionPool
+_async_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _decode(value):
+    """递归地将响应中的bytes解码为str，无法按UTF-8解码的二进制数据保持原样"""
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_decode(item) for item in value)
+    if isinstance(value, dict):
+        return {_decode(k): _decode(v) for k, v in value.items()}
+    if isinstance(value, set):
+        return {_decode(item) for item in value}
+    return value
+
+
+class _TextPipeline(Pipeline):
+    """文本视图的管道，逐条解码响应"""
+
+    def parse_response(self, connection, command_name, **options):
+        return _decode(super().parse_response(connection, command_name, **options))
+
+
+class TextRedis(redis.Redis):
+    """
+    共享连接池上的文本视图
+
+    连接池中的连接统一不解码响应（二进制视图可直接读取向量数据），
+    文本视图在客户端侧解码，效果等同于decode_responses=True。
+    """
+
+    def parse_response(self, connection, command_name, **options):
+        return _decode(super().parse_response(connection, command_name, **options))
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TextPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def get_connection_pool(host=None, port=None, db=None, password=None) -> redis.BlockingConnectionPool:
+    """
+    获取（必要时创建）共享的有界连接池
+
+    连接数达到REDIS_MAX_CONNECTIONS后，获取连接的线程最多等待REDIS_POOL_TIMEOUT秒，
+    而不是继续新建连接。
+
+    Args:
+        host: Redis主机，默认Config.REDIS_HOST
+        port: Redis端口，默认Config.REDIS_PORT
+        db: 数据库编号，默认Config.REDIS_DB
+        password: 密码，默认Config.REDIS_PASSWORD
+
+    Returns:
+        连接池实例
+    """
+    host = host or Config.REDIS_HOST
+    port = int(port or Config.REDIS_PORT)
+    db = Config.REDIS_DB if db is None else db
+    password = password if password is not None else Config.REDIS_PASSWORD
+    key = (host, port, db, password)
+
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # REDIS_PROTOCOL=3时使用RESP3协议（需要redis-py 5.0+）
+            protocol_kwargs = {'protocol': 3} if Config.REDIS_PROTOCOL == 3 else {}
+            pool = redis.BlockingConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                password=password,
+                decode_responses=False,
+                max_connections=Config.REDIS_MAX_CONNECTIONS,
+                timeout=Config.REDIS_POOL_TIMEOUT,
+                socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=Config.REDIS_SOCKET_CONNECT_TIMEOUT,
+                socket_keepalive=True,
+                health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+                **protocol_kwargs
+            )
+            _pools[key] = pool
+            logger.info(f"创建Redis连接池: {host}:{port}/{db}, 最大连接数 {Config.REDIS_MAX_CONNECTIONS}")
+    return pool
+
+
+def get_redis_client(decode_responses: bool = False, host=None, port=None, db=None, password=None) -> redis.Redis:
+    """
+    获取共享连接池上的Redis客户端
+
+    Args:
+        decode_responses: True返回文本视图，False返回二进制视图
+        host/port/db/password: 见get_connection_pool
+
+    Returns:
+        Redis客户端，同一地址的二进制视图和文本视图共用同一个连接池
+    """
+    pool = get_connection_pool(host=host, port=port, db=db, password=password)
+    if decode_responses:
+        return TextRedis(connection_pool=pool)
+    return redis.Redis(connection_pool=pool)
+
+
+def get_async_redis_client(host=None, port=None, db=None, password=None):
+    """
+    获取当前事件循环上的共享asyncio Redis客户端（二进制视图）
+
+    asyncio连接池绑定创建它的事件循环，因此按(事件循环, 地址)分别注册，
+    池大小和超时配置与同步连接池一致。必须在事件循环中调用。
+
+    Args:
+        host/port/db/password: 见get_connection_pool
+
+    Returns:
+        redis.asyncio.Redis客户端
+    """
+    host = host or Config.REDIS_HOST
+    port = int(port or Config.REDIS_PORT)
+    db = Config.REDIS_DB if db is None else db
+    password = password if password is not None else Config.REDIS_PASSWORD
+    loop = asyncio.get_running_loop()
+    key = (id(loop), host, port, db, password)
+
+    with _pools_lock:
+        pool = _async_pools.get(key)
+        if pool is None:
+            protocol_kwargs = {'protocol': 3} if Config.REDIS_PROTOCOL == 3 else {}
+            pool = redis_asyncio.BlockingConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                password=password,
+                decode_responses=False,
+                max_connections=Config.REDIS_MAX_CONNECTIONS,
+                timeout=Config.REDIS_POOL_TIMEOUT,
+                socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=Config.REDIS_SOCKET_CONNECT_TIMEOUT,
+                socket_keepalive=True,
+                health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+                **protocol_kwargs
+            )
+            _async_pools[key] = pool
+            logger.info(f"创建asyncio Redis连接池: {host}:{port}/{db}, 最大连接数 {Config.REDIS_MAX_CONNECTIONS}")
+    return redis_asyncio.Redis(connection_pool=pool)
+
+
+async def aclose_all_pools():
+    """断开当前事件循环上所有asyncio连接池的连接（应用关闭时调用）"""
+    loop_id = id(asyncio.get_running_loop())
+    with _pools_lock:
+        keys = [key for key in _async_pools if key[0] == loop_id]
+        pools = [_async_pools.pop(key) for key in keys]
+    for pool in pools:
+        try:
+            await pool.disconnect()
+        except Exception as e:
+            logger.warning(f"关闭asyncio Redis连接池失败: {e}")
+
+
+def get_pool_stats() -> list:
+    """获取所有连接池的使用情况"""
+    stats = []
+    for (host, port, db, _), pool in list(_pools.items()):
+        created = len(getattr(pool, '_connections', []))
+        idle_queue = getattr(pool, 'pool', None)
+        idle = sum(1 for conn in list(idle_queue.queue) if conn is not None) if idle_queue is not None else None
+        stats.append({
+            'address': f"{host}:{port}/{db}",
+            'max_connections': pool.max_connections,
+            'created_connections': created,
+            'idle_connections': idle,
+            'in_use_connections': created - idle if idle is not None else None
+        })
+    return stats
+
+
+def close_all_pools():
+    """断开所有连接池的连接（应用关闭时调用）"""
+    with _pools_lock:
+        for pool in _pools.values():
+            try:
+                pool.disconnect()
+            except Exception as e:
+                logger.warning(f"关闭Redis连接池失败: {e}")
+        _pools.clear()
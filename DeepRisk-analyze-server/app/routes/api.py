@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
+import asyncio
 import mysql.connector
 import numpy as np
 from app.models.model_loader import get_models, get_scalers, get_thresholds
+from app.models.vector_search import SearchFilter
 from app.config import Config
 
 router = APIRouter()
@@ -13,6 +15,101 @@ class RiskAssessmentRequest(BaseModel):
     date: Optional[str] = None
     businessType: Optional[str] = "general"
 
+class FraudScoreRequest(BaseModel):
+    entityId: str
+    vector: List[float]
+    profile: Optional[str] = None
+    budgetMs: Optional[float] = None  # 相似度查询延迟预算（毫秒）
+    # KNN预过滤条件：只在同一业务类型/租户/活动日期范围内的实体中查找相似实体
+    businessType: Optional[str] = None
+    tenant: Optional[str] = None
+    dateFrom: Optional[str] = None
+    dateTo: Optional[str] = None
+
+class FraudScoreBatchRequest(BaseModel):
+    items: List[FraudScoreRequest]
+    profile: Optional[str] = None
+    budgetMs: Optional[float] = None
+
+# 异步路由共享的风险检测核心实例
+_fraud_detector = None
+# 保证并发的首批请求只初始化一个实例（每个实例都会启动后台线程并加载内存索引）
+_fraud_detector_lock = asyncio.Lock()
+# 正在处理的评分请求数，作为相似度查询规划的负载信号
+_inflight_requests = 0
+
+async def get_fraud_detector():
+    """获取共享的FraudDetectionCore实例，首次调用时在线程池中初始化"""
+    global _fraud_detector
+    if _fraud_detector is None:
+        async with _fraud_detector_lock:
+            # 等待锁期间其他请求可能已完成初始化
+            if _fraud_detector is None:
+                from app.models.fraud_detection import FraudDetectionCore
+                loop = asyncio.get_running_loop()
+                _fraud_detector = await loop.run_in_executor(None, FraudDetectionCore)
+    return _fraud_detector
+
+def _build_search_filter(item: FraudScoreRequest) -> SearchFilter:
+    """根据请求中的业务类型、租户和日期范围构造KNN预过滤条件"""
+    return SearchFilter(
+        business_type=item.businessType,
+        tenant=item.tenant,
+        date_from=item.dateFrom,
+        date_to=item.dateTo
+    )
+
+@router.post("/fraud-score")
+async def fraud_score(request: FraudScoreRequest):
+    """同步返回单个实体的向量相似度风险评分"""
+    if not request.entityId:
+        raise HTTPException(status_code=400, detail="实体编号不能为空")
+    if len(request.vector) != 35:
+        raise HTTPException(status_code=400, detail=f"输入向量必须是35维，当前维度: {len(request.vector)}")
+    
+    global _inflight_requests
+    detector = await get_fraud_detector()
+    _inflight_requests += 1
+    try:
+        detector.update_load(_inflight_requests - 1)
+        result = await detector.aprocess_vector(request.vector, request.entityId, profile=request.profile,
+                                                budget_ms=request.budgetMs,
+                                                search_filter=_build_search_filter(request))
+    finally:
+        _inflight_requests -= 1
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+    return result
+
+@router.post("/fraud-score/batch")
+async def fraud_score_batch(request: FraudScoreBatchRequest):
+    """同步返回一批实体的向量相似度风险评分"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="评分请求不能为空")
+    for item in request.items:
+        if len(item.vector) != 35:
+            raise HTTPException(status_code=400, detail=f"实体[{item.entityId}]输入向量必须是35维，当前维度: {len(item.vector)}")
+    
+    global _inflight_requests
+    detector = await get_fraud_detector()
+    vectors_35d = [np.array(item.vector, dtype=np.float32) for item in request.items]
+    entity_ids = [item.entityId for item in request.items]
+    _inflight_requests += 1
+    try:
+        detector.update_load(_inflight_requests - 1)
+        results = await detector.aprocess_vectors_batch(vectors_35d, entity_ids, profile=request.profile,
+                                                        budget_ms=request.budgetMs,
+                                                        search_filters=[_build_search_filter(item) for item in request.items])
+    finally:
+        _inflight_requests -= 1
+    return {"results": results}
+
+@router.get("/fraud-score/stats")
+async def fraud_score_stats():
+    """相似度查询的熔断器、降级和查询规划状态"""
+    detector = await get_fraud_detector()
+    return detector.get_search_stats()
+
 @router.post("/risk-assessment")
 async def risk_assessment(request: RiskAssessmentRequest):
     entity_id = request.entityId
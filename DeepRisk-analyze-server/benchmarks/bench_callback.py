@@ -0,0 +1,93 @@
+"""
+回调投递基准：逐条 vs 批量
+
+在进程内启动回调桩服务，用CallbackDispatcher分别以逐条和批量模式投递同样数量的结果，
+报告总耗时、结果吞吐、HTTP请求数和逐条状态统计。
+
+用法:
+    python benchmarks/bench_callback.py --results 20000 --workers 8 --batch-size 100 --linger-ms 50
+    python benchmarks/bench_callback.py --latency-ms 2 --fail-rate 0.01
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rabbitmq.callback_dispatcher import CallbackDispatcher
+from callback_stub_server import CallbackStubServer
+
+
+def run(server: CallbackStubServer, args, bulk: bool):
+    """
+    投递args.results条结果并等待全部完成
+
+    Returns:
+        (耗时秒数, 投递器统计, 桩服务统计, 成功数)
+    """
+    dispatcher = CallbackDispatcher(
+        f"{server.base_url}/result",
+        workers=args.workers,
+        max_queue_size=args.results,
+        max_retries=args.max_retries,
+        retry_delay=0.01,
+        batch_url=f"{server.base_url}/results" if bulk else None,
+        batch_size=args.batch_size,
+        batch_linger=args.linger_ms / 1000
+    )
+    before = server.get_stats()
+    done = threading.Semaphore(0)
+    succeeded = []
+
+    def on_done(result, success):
+        if success:
+            succeeded.append(result['requestId'])
+        done.release()
+
+    start = time.perf_counter()
+    for i in range(args.results):
+        dispatcher.submit({'requestId': f"bench-{i}", 'doctorId': f"D{i % 500}", 'status': 'COMPLETED',
+                           'fraudScore': (i % 100) / 100}, on_done)
+    for _ in range(args.results):
+        done.acquire()
+    elapsed = time.perf_counter() - start
+    dispatcher.close()
+
+    after = server.get_stats()
+    server_stats = {key: after[key] - before[key] for key in after}
+    return elapsed, dispatcher.get_stats(), server_stats, len(succeeded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回调投递吞吐基准")
+    parser.add_argument('--results', type=int, default=5000, help="投递的结果数量")
+    parser.add_argument('--workers', type=int, default=8, help="投递工作线程数")
+    parser.add_argument('--batch-size', type=int, default=100, help="批量模式每批最多结果数")
+    parser.add_argument('--linger-ms', type=float, default=50, help="批量模式等待凑批的最长时间（毫秒）")
+    parser.add_argument('--max-retries', type=int, default=3, help="最大重试次数")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="桩服务每个请求的模拟处理时间（毫秒）")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="桩服务模拟失败的概率")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    server = CallbackStubServer(latency_ms=args.latency_ms, fail_rate=args.fail_rate).start()
+    print(f"结果数量: {args.results}, 工作线程: {args.workers}, 桩服务延迟: {args.latency_ms}ms, "
+          f"失败率: {args.fail_rate}")
+    print(f"{'模式':<24}{'耗时(s)':>10}{'结果/s':>10}{'HTTP请求':>10}{'成功':>8}{'失败':>8}{'重试':>8}"
+          f"{'平均批大小':>12}")
+    try:
+        for bulk in (False, True):
+            elapsed, stats, server_stats, succeeded = run(server, args, bulk)
+            name = f"批量 size={args.batch_size} linger={args.linger_ms:g}ms" if bulk else "逐条"
+            print(f"{name:<24}{elapsed:>10.2f}{args.results / elapsed:>10.0f}{server_stats['requests']:>10}"
+                  f"{succeeded:>8}{stats['failed']:>8}{stats['retries']:>8}{stats.get('avg_batch_size', 1.0):>12}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+向量量化存储基准
+
+以float32精确检索为基线，对比各量化存储方式的向量内存占用和recall@k：
+- memory-float16 / memory-int8: InMemoryVectorIndex的量化存储
+- redis-float16(模拟): 存储和查询向量都按FLOAT16舍入后精确检索，等价于FLOAT16的FLAT索引
+- --redis 时额外在Redis中分别建立FLOAT32和FLOAT16的FLAT索引，按FT.INFO统计索引内存
+
+未指定--vectors时生成聚类分布的合成数据，并与编码器输出一样做ReLU截断。
+
+用法:
+    python benchmarks/bench_quantization.py --entities 200000 --queries 1000
+    python benchmarks/bench_quantization.py --vectors data/vectors_128d.npy --redis --min-recall 0.95
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.vector_search import InMemoryVectorIndex
+
+
+def generate_vectors(num_entities: int, num_queries: int, dim: int, clusters: int, seed: int = 42):
+    """生成聚类分布的实体向量和查询向量（查询向量为实体向量加噪声）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, num_entities)
+    vectors = centers[assignments] + 0.5 * rng.normal(size=(num_entities, dim)).astype(np.float32)
+    vectors = np.maximum(vectors, 0.0)
+
+    picks = rng.integers(0, num_entities, num_queries)
+    queries = vectors[picks] + 0.1 * rng.normal(size=(num_queries, dim)).astype(np.float32)
+    return vectors.astype(np.float32), np.maximum(queries, 0.0).astype(np.float32)
+
+
+def search_ids(index: InMemoryVectorIndex, queries: np.ndarray, k: int, batch_size: int = 256):
+    """批量检索，返回每个查询的Top-k实体ID列表和平均单条耗时（毫秒）"""
+    results = []
+    start = time.perf_counter()
+    for begin in range(0, len(queries), batch_size):
+        batch = index.search_batch(list(queries[begin:begin + batch_size]), k=k)
+        results.extend([entity['entity_id'] for entity in entities] for entities in batch)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return results, elapsed_ms / max(len(queries), 1)
+
+
+def recall_at_k(truth, approx, k: int) -> float:
+    """recall@k: 近似结果与基线Top-k的平均重合比例"""
+    hits = sum(len(set(t[:k]) & set(a[:k])) for t, a in zip(truth, approx))
+    return hits / max(len(truth) * k, 1)
+
+
+def build_memory_index(ids, vectors, quantization: str) -> InMemoryVectorIndex:
+    # 基准只比较存储方式，统一使用精确检索
+    index = InMemoryVectorIndex(metric='COSINE', exact_threshold=len(ids) + 1, quantization=quantization)
+    index.build(ids, vectors)
+    return index
+
+
+def run_redis(ids, vectors, queries, k: int, truth, host: str, port: int):
+    """在Redis中分别建立FLOAT32和FLOAT16的FLAT索引，返回[(名称, 内存MB, recall, 单条耗时ms)]"""
+    from app.redis_pool import get_redis_client
+    from app.models.index_builder import create_index, write_entity_vectors
+    from app.models.vector_search import RediSearchBackend, vector_dtype
+
+    redis_client = get_redis_client(decode_responses=False, host=host, port=port, db=0)
+    rows = []
+    for vector_type in ('FLOAT32', 'FLOAT16'):
+        index_name = f"bench_quant_{vector_type.lower()}"
+        key_prefix = f"bench_quant_{vector_type.lower()}:"
+        create_index(redis_client, index_name=index_name, key_prefix=key_prefix, algorithm='FLAT',
+                     dim=vectors.shape[1], vector_type=vector_type, drop_existing=True)
+        try:
+            write_entity_vectors(redis_client, ids, vectors, key_prefix=key_prefix,
+                                 vector_dtype=vector_dtype(vector_type))
+            # 等待后台索引完成
+            while True:
+                info = _ft_info(redis_client, index_name)
+                if float(info.get('percent_indexed', 1)) >= 1:
+                    break
+                time.sleep(0.5)
+
+            backend = RediSearchBackend(redis_client, index_name=index_name, key_prefix=key_prefix,
+                                        vector_type=vector_type)
+            approx = []
+            start = time.perf_counter()
+            for begin in range(0, len(queries), 100):
+                batch = backend.search_batch(list(queries[begin:begin + 100]), k=k)
+                approx.extend([entity['entity_id'] for entity in entities] for entities in batch)
+            per_query_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+            memory_mb = float(info.get('vector_index_sz_mb', 0))
+            rows.append((f"redis-{vector_type.lower()}", memory_mb, recall_at_k(truth, approx, k), per_query_ms))
+        finally:
+            # 删除索引及其哈希数据
+            redis_client.execute_command('FT.DROPINDEX', index_name, 'DD')
+    return rows
+
+
+def _ft_info(redis_client, index_name: str) -> dict:
+    """解析FT.INFO的键值列表"""
+    reply = redis_client.execute_command('FT.INFO', index_name)
+    if isinstance(reply, dict):
+        items = reply.items()
+    else:
+        items = zip(reply[::2], reply[1::2])
+    info = {}
+    for key, value in items:
+        key = key.decode('utf-8') if isinstance(key, bytes) else str(key)
+        info[key] = value.decode('utf-8') if isinstance(value, bytes) else value
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量量化存储的内存与召回率基准")
+    parser.add_argument('--entities', type=int, default=100000, help="实体数量")
+    parser.add_argument('--queries', type=int, default=1000, help="查询数量")
+    parser.add_argument('--dim', type=int, default=128, help="向量维度")
+    parser.add_argument('--clusters', type=int, default=64, help="合成数据的聚类数")
+    parser.add_argument('--vectors', help="实体向量.npy文件，指定时从中抽取查询向量")
+    parser.add_argument('--k', type=int, default=10, help="recall@k的k")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--redis', action='store_true', help="同时在Redis中测试FLOAT32/FLOAT16索引")
+    parser.add_argument('--redis-host', default=None, help="Redis主机，默认Config.REDIS_HOST")
+    parser.add_argument('--redis-port', type=int, default=None, help="Redis端口，默认Config.REDIS_PORT")
+    parser.add_argument('--min-recall', type=float, default=None, help="任一方式低于该召回率时以非零状态退出")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        rng = np.random.default_rng(args.seed)
+        picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+        queries = vectors[picks] + 0.01 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    else:
+        vectors, queries = generate_vectors(args.entities, args.queries, args.dim, args.clusters, args.seed)
+    ids = [str(i) for i in range(len(vectors))]
+
+    print(f"实体数量: {len(vectors)}, 维度: {vectors.shape[1]}, 查询数量: {len(queries)}, k={args.k}")
+
+    baseline = build_memory_index(ids, vectors, 'none')
+    truth, baseline_ms = search_ids(baseline, queries, args.k)
+    baseline_mb = baseline.get_stats()['vector_bytes'] / 1024 / 1024
+    rows = [("memory-float32(基线)", baseline_mb, 1.0, baseline_ms)]
+
+    for quantization in ('float16', 'int8'):
+        index = build_memory_index(ids, vectors, quantization)
+        approx, per_query_ms = search_ids(index, queries, args.k)
+        rows.append((f"memory-{quantization}", index.get_stats()['vector_bytes'] / 1024 / 1024,
+                     recall_at_k(truth, approx, args.k), per_query_ms))
+
+    # 存储和查询都舍入到FLOAT16，模拟FLOAT16索引的精度损失
+    simulated = build_memory_index(ids, vectors.astype(np.float16).astype(np.float32), 'none')
+    approx, per_query_ms = search_ids(simulated, queries.astype(np.float16).astype(np.float32), args.k)
+    rows.append(("redis-float16(模拟)", baseline_mb / 2, recall_at_k(truth, approx, args.k), per_query_ms))
+
+    if args.redis:
+        rows.extend(run_redis(ids, vectors, queries, args.k, truth, args.redis_host, args.redis_port))
+
+    print(f"{'存储方式':<22}{'向量内存(MB)':>14}{'节省':>10}{'recall@' + str(args.k):>12}{'单条耗时(ms)':>14}")
+    # Redis实测结果与Redis的FLOAT32索引比较，其余与内存基线比较
+    redis_baseline_mb = next((row[1] for row in rows if row[0] == 'redis-float32'), None)
+    for name, memory_mb, recall, per_query_ms in rows:
+        reference_mb = redis_baseline_mb if name in ('redis-float32', 'redis-float16') else baseline_mb
+        saving = 1 - memory_mb / reference_mb if reference_mb else 0.0
+        print(f"{name:<22}{memory_mb:>14.1f}{saving:>10.1%}{recall:>12.4f}{per_query_ms:>14.3f}")
+
+    if args.min_recall is not None:
+        failed = [row[0] for row in rows if row[2] < args.min_recall]
+        if failed:
+            print(f"召回率低于{args.min_recall}: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
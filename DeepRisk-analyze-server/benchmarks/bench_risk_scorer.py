@@ -0,0 +1,88 @@
+"""
+批量风险评分基准与一致性校验
+
+对比FraudDetectionCore逐条评分(_calculate_risk_score)与向量化批量评分
+(_calculate_risk_scores_batch)的结果和耗时，结果不一致时以非零状态退出。
+
+用法:
+    python benchmarks/bench_risk_scorer.py --entities 100000 --k 10
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.fraud_detection import FraudDetectionCore
+
+
+def generate_batch(num_entities: int, k: int, seed: int = 42):
+    """生成覆盖各评分分支的随机相似实体列表"""
+    rng = np.random.default_rng(seed)
+    batch = []
+    for _ in range(num_entities):
+        count = int(rng.integers(0, k + 1))
+        # 混合不同区间的相似度，覆盖各阈值分支
+        scale = rng.choice([1.0, 0.3, 0.1, 0.02])
+        scores = np.sort(rng.random(count) * scale)
+        if count and rng.random() < 0.1:
+            scores[-1] = 0.97
+        all_safe = rng.random() < 0.3
+        entities = []
+        for j in range(count):
+            r = rng.random()
+            if all_safe:
+                label = 0
+            elif r < 0.2:
+                label = None
+            else:
+                label = int(rng.integers(0, 2))
+            entities.append({
+                'entity_id': f"entity_{j}",
+                'similarity_score': float(scores[j]),
+                'label': label
+            })
+        batch.append(entities)
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量风险评分基准与一致性校验")
+    parser.add_argument('--entities', type=int, default=100000, help="实体数量")
+    parser.add_argument('--k', type=int, default=10, help="每个实体的相似实体数量")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--atol', type=float, default=1e-9, help="允许的最大绝对误差")
+    args = parser.parse_args()
+
+    # 评分逻辑不依赖Redis连接和向量检索后端
+    logging.disable(logging.INFO)
+    detector = FraudDetectionCore.__new__(FraudDetectionCore)
+
+    batch = generate_batch(args.entities, args.k, args.seed)
+
+    start = time.perf_counter()
+    scalar_scores = np.array([detector._calculate_risk_score(entities) for entities in batch])
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_scores = detector._calculate_risk_scores_batch(batch)
+    batch_time = time.perf_counter() - start
+
+    max_error = float(np.max(np.abs(scalar_scores - batch_scores))) if len(batch) else 0.0
+
+    print(f"实体数量: {args.entities}, k={args.k}")
+    print(f"逐条评分耗时: {scalar_time * 1000:.1f} ms")
+    print(f"批量评分耗时: {batch_time * 1000:.1f} ms (加速 {scalar_time / max(batch_time, 1e-9):.1f}x)")
+    print(f"最大绝对误差: {max_error:.3e}")
+
+    if max_error > args.atol:
+        print("批量评分与逐条评分结果不一致")
+        sys.exit(1)
+    print("批量评分与逐条评分结果一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+分片向量检索基准
+
+按1/2/4/...个分片构建ShardedSearchBackend，对比单条查询耗时、QPS和与单索引精确结果的recall@k。
+默认使用进程内InMemoryVectorIndex分片；--redis-shards指定多个本地Redis实例时，
+按一致性哈希把实体写入各实例后在RediSearch分片上测试。
+
+用法:
+    python benchmarks/bench_sharded_search.py --entities 400000 --shards 1,2,4
+    python benchmarks/bench_sharded_search.py --entities 200000 --redis-shards 127.0.0.1:6380,127.0.0.1:6381
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.vector_search import InMemoryVectorIndex
+from app.models.sharded_search import ShardedSearchBackend
+from bench_quantization import generate_vectors, recall_at_k
+
+
+def run_queries(backend, queries: np.ndarray, k: int, batch_size: int, concurrency: int):
+    """并发执行批量查询，返回(每个查询的Top-k ID列表, 单条平均耗时ms, QPS)"""
+    batches = [list(queries[begin:begin + batch_size]) for begin in range(0, len(queries), batch_size)]
+
+    def search(batch):
+        return [[entity['entity_id'] for entity in entities] for entities in backend.search_batch(batch, k=k)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [ids for batch_ids in pool.map(search, batches) for ids in batch_ids]
+    elapsed = time.perf_counter() - start
+    return results, elapsed * 1000 / max(len(queries), 1) * concurrency, len(queries) / max(elapsed, 1e-9)
+
+
+def build_redis_shards(shard_specs, ids, vectors, vector_type: str = 'FLOAT32'):
+    """在各Redis实例上建立FLAT索引并按一致性哈希写入实体"""
+    from app.redis_pool import get_redis_client
+    from app.models.index_builder import create_index, write_sharded_entity_vectors
+    from app.models.sharded_search import ConsistentHashRing, create_sharded_backend, parse_shard_address
+    from app.models.vector_search import vector_dtype
+
+    index_name, key_prefix = 'bench_shard', 'bench_shard:'
+    ring = ConsistentHashRing(shard_specs)
+    clients = []
+    for spec in shard_specs:
+        host, port = parse_shard_address(spec)
+        client = get_redis_client(decode_responses=False, host=host, port=port, db=0)
+        create_index(client, index_name=index_name, key_prefix=key_prefix, algorithm='FLAT',
+                     dim=vectors.shape[1], vector_type=vector_type, drop_existing=True)
+        clients.append(client)
+    write_sharded_entity_vectors(clients, ring, ids, vectors, key_prefix=key_prefix,
+                                 vector_dtype=vector_dtype(vector_type))
+    return create_sharded_backend('redis', shard_specs, index_name=index_name, key_prefix=key_prefix,
+                                  vector_type=vector_type), clients, index_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片向量检索的吞吐与召回率基准")
+    parser.add_argument('--entities', type=int, default=200000, help="实体数量")
+    parser.add_argument('--queries', type=int, default=2000, help="查询数量")
+    parser.add_argument('--dim', type=int, default=128, help="向量维度")
+    parser.add_argument('--clusters', type=int, default=64, help="合成数据的聚类数")
+    parser.add_argument('--k', type=int, default=10, help="recall@k的k")
+    parser.add_argument('--shards', default='1,2,4', help="进程内分片数列表")
+    parser.add_argument('--redis-shards', help="逗号分隔的Redis实例host:port，指定时测试RediSearch分片")
+    parser.add_argument('--batch-size', type=int, default=32, help="每次search_batch的查询数")
+    parser.add_argument('--concurrency', type=int, default=4, help="并发查询线程数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    vectors, queries = generate_vectors(args.entities, args.queries, args.dim, args.clusters, args.seed)
+    ids = [str(i) for i in range(len(vectors))]
+    print(f"实体数量: {len(vectors)}, 查询数量: {len(queries)}, k={args.k}, "
+          f"批大小: {args.batch_size}, 并发: {args.concurrency}")
+
+    # 单个精确索引作为召回率基线
+    baseline = InMemoryVectorIndex(exact_threshold=len(ids) + 1)
+    baseline.build(ids, vectors)
+    truth = run_queries(baseline, queries, args.k, args.batch_size, 1)[0]
+
+    print(f"{'后端':<24}{'单条耗时(ms)':>14}{'QPS':>12}{'recall@' + str(args.k):>12}")
+    if args.redis_shards:
+        shard_specs = [spec.strip() for spec in args.redis_shards.split(',') if spec.strip()]
+        backend, clients, index_name = build_redis_shards(shard_specs, ids, vectors)
+        try:
+            # 等待后台索引完成
+            time.sleep(1)
+            approx, per_query_ms, qps = run_queries(backend, queries, args.k, args.batch_size, args.concurrency)
+            print(f"{'redis x' + str(len(shard_specs)):<24}{per_query_ms:>14.3f}{qps:>12.0f}"
+                  f"{recall_at_k(truth, approx, args.k):>12.4f}")
+        finally:
+            for client in clients:
+                client.execute_command('FT.DROPINDEX', index_name, 'DD')
+        return
+
+    for num_shards in [int(n) for n in args.shards.split(',') if n.strip()]:
+        names = [f"shard-{i}" for i in range(num_shards)]
+        backend = ShardedSearchBackend.build_in_memory(names, ids, vectors, exact_threshold=len(ids) + 1)
+        approx, per_query_ms, qps = run_queries(backend, queries, args.k, args.batch_size, args.concurrency)
+        print(f"{'memory x' + str(num_shards):<24}{per_query_ms:>14.3f}{qps:>12.0f}"
+              f"{recall_at_k(truth, approx, args.k):>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+两阶段检索（PCA粗筛 + 余弦精排）召回率报告
+
+以128维COSINE精确检索为基线，按投影维度和第一阶段候选数k'的组合构建TwoStageVectorIndex，
+报告recall@k、单条耗时以及第一阶段索引内存相对完整索引的比例。
+PCA在实体向量上拟合（--fit-sample控制样本数），与线上离线拟合的方式一致。
+
+用法:
+    python benchmarks/bench_two_stage.py --entities 200000 --dims 16,24,32 --candidates 50,100,200
+    python benchmarks/bench_two_stage.py --vectors data/vectors_128d.npy --min-recall 0.95
+"""
+import os
+import sys
+import logging
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.pca_projection import PcaProjection, normalize_rows
+from app.models.two_stage_search import TwoStageVectorIndex
+from bench_quantization import generate_vectors, search_ids, recall_at_k, build_memory_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="两阶段PCA检索的召回率与耗时报告")
+    parser.add_argument('--entities', type=int, default=100000, help="实体数量")
+    parser.add_argument('--queries', type=int, default=1000, help="查询数量")
+    parser.add_argument('--dim', type=int, default=128, help="向量维度")
+    parser.add_argument('--clusters', type=int, default=64, help="合成数据的聚类数")
+    parser.add_argument('--vectors', help="实体向量.npy文件，指定时从中抽取查询向量")
+    parser.add_argument('--k', type=int, default=10, help="recall@k的k")
+    parser.add_argument('--dims', default='16,24,32', help="投影维度列表")
+    parser.add_argument('--candidates', default='50,100,200', help="第一阶段候选数k'列表")
+    parser.add_argument('--fit-sample', type=int, default=200000, help="拟合PCA的最大样本数")
+    parser.add_argument('--rerank-dtype', default='float16', choices=TwoStageVectorIndex.RERANK_DTYPES,
+                        help="精排向量的存储类型")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--min-recall', type=float, default=None, help="任一组合低于该召回率时以非零状态退出")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        rng = np.random.default_rng(args.seed)
+        picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+        queries = vectors[picks] + 0.01 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    else:
+        vectors, queries = generate_vectors(args.entities, args.queries, args.dim, args.clusters, args.seed)
+    ids = [str(i) for i in range(len(vectors))]
+
+    print(f"实体数量: {len(vectors)}, 维度: {vectors.shape[1]}, 查询数量: {len(queries)}, k={args.k}")
+
+    baseline = build_memory_index(ids, vectors, 'none')
+    truth, baseline_ms = search_ids(baseline, queries, args.k)
+    baseline_mb = baseline.get_stats()['vector_bytes'] / 1024 / 1024
+
+    print(f"{'配置':<22}{'解释方差':>10}{'粗筛内存(MB)':>14}{'内存比例':>10}"
+          f"{'recall@' + str(args.k):>12}{'单条耗时(ms)':>14}")
+    print(f"{'cosine-128(基线)':<22}{1.0:>10.3f}{baseline_mb:>14.1f}{1.0:>10.1%}{1.0:>12.4f}{baseline_ms:>14.3f}")
+
+    normalized = normalize_rows(vectors)
+    rows = []
+    for dim in [int(d) for d in args.dims.split(',') if d.strip()]:
+        projection = PcaProjection.fit(normalized, dim, sample=args.fit_sample, seed=args.seed)
+        explained = float(projection.explained_variance_ratio.sum())
+        for candidate_k in [int(c) for c in args.candidates.split(',') if c.strip()]:
+            # 第一阶段统一使用精确检索，只比较投影维度和候选数的影响
+            index = TwoStageVectorIndex(projection, candidate_k=candidate_k, rerank_dtype=args.rerank_dtype,
+                                        exact_threshold=len(ids) + 1)
+            index.build(ids, vectors)
+            approx, per_query_ms = search_ids(index, queries, args.k)
+            recall = recall_at_k(truth, approx, args.k)
+            first_stage_mb = index.get_stats()['vector_bytes'] / 1024 / 1024
+            name = f"pca{dim}-k'{candidate_k}"
+            rows.append((name, recall))
+            print(f"{name:<22}{explained:>10.3f}{first_stage_mb:>14.1f}{first_stage_mb / baseline_mb:>10.1%}"
+                  f"{recall:>12.4f}{per_query_ms:>14.3f}")
+
+    if args.min_recall is not None:
+        failed = [name for name, recall in rows if recall < args.min_recall]
+        if failed:
+            print(f"召回率低于{args.min_recall}: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
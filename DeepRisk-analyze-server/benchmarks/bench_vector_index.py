@@ -0,0 +1,231 @@
+"""
+向量索引参数基准
+
+生成聚类分布的128维合成实体（1万到1000万，分块生成，不要求全部常驻内存），
+以分块暴力检索的精确Top-k为基线，按索引参数网格报告：
+构建时间、索引内存、单条查询p50/p99延迟、并发QPS和recall@k。
+
+- redis: RediSearch FLAT，以及HNSW的M × EF_CONSTRUCTION × EF_RUNTIME网格（需要本地Redis Stack）
+- memory: 进程内InMemoryVectorIndex的精确检索，以及IVF的nlist × nprobe网格
+  （进程内后端没有HNSW，IVF是其对应的近似检索参数）
+
+用法:
+    python benchmarks/bench_vector_index.py --sizes 10000,100000 --backend memory --nlist 256,1024 --nprobe 4,8,16
+    python benchmarks/bench_vector_index.py --sizes 1000000 --backend redis --m 16,32 --ef-construction 200 \\
+        --ef-runtime 10,50,100,200
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.vector_search import InMemoryVectorIndex
+from bench_quantization import recall_at_k, _ft_info
+
+
+def iter_population(num_entities: int, dim: int, clusters: int, seed: int = 42, chunk_size: int = 100000):
+    """
+    分块生成聚类分布的实体向量（与编码器输出一样做ReLU截断），同一参数下结果确定
+
+    Yields:
+        (起始下标, (n, dim) 向量块)
+    """
+    centers = np.random.default_rng(seed).normal(size=(clusters, dim)).astype(np.float32)
+    for begin in range(0, num_entities, chunk_size):
+        rng = np.random.default_rng((seed, begin))
+        count = min(chunk_size, num_entities - begin)
+        chunk = centers[rng.integers(0, clusters, count)] + 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+        yield begin, np.maximum(chunk, 0.0).astype(np.float32)
+
+
+def generate_queries(num_queries: int, dim: int, clusters: int, seed: int = 42) -> np.ndarray:
+    """从同一分布生成查询向量（不在实体集合中）"""
+    centers = np.random.default_rng(seed).normal(size=(clusters, dim)).astype(np.float32)
+    # 与实体块使用不同的随机序列
+    rng = np.random.default_rng((seed, 0xffffffff))
+    queries = centers[rng.integers(0, clusters, num_queries)] + \
+        0.5 * rng.normal(size=(num_queries, dim)).astype(np.float32)
+    return np.maximum(queries, 0.0).astype(np.float32)
+
+
+def brute_force_topk(population, queries: np.ndarray, k: int):
+    """
+    分块暴力检索的精确COSINE Top-k
+
+    Args:
+        population: iter_population的生成器
+        queries: (nq, dim) 查询向量
+        k: Top-k
+
+    Returns:
+        每个查询的Top-k实体ID列表
+    """
+    normalized = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    best_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+
+    for begin, chunk in population:
+        chunk = chunk / np.maximum(np.linalg.norm(chunk, axis=1, keepdims=True), 1e-12)
+        distances = 1.0 - normalized @ chunk.T
+        ids = np.broadcast_to(np.arange(begin, begin + len(chunk)), distances.shape)
+        # 当前最优与本块合并后保留Top-k
+        merged_distances = np.concatenate([best_distances, distances], axis=1)
+        merged_ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(merged_distances, k - 1, axis=1)[:, :k]
+        best_distances = np.take_along_axis(merged_distances, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+
+    order = np.argsort(best_distances, axis=1)
+    best_ids = np.take_along_axis(best_ids, order, axis=1)
+    return [[str(i) for i in row] for row in best_ids]
+
+
+def measure_queries(backend, queries: np.ndarray, k: int, concurrency: int, ef_runtime=None):
+    """
+    逐条查询测延迟分位数，再并发查询测QPS
+
+    Returns:
+        (每个查询的Top-k ID列表, p50毫秒, p99毫秒, QPS)
+    """
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        entities = backend.search_batch([query], k=k, ef_runtime=ef_runtime)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([entity['entity_id'] for entity in entities])
+
+    def search(query):
+        return backend.search_batch([query], k=k, ef_runtime=ef_runtime)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(search, queries))
+    qps = len(queries) / max(time.perf_counter() - start, 1e-9)
+    return results, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)), qps
+
+
+def run_memory(args, size: int, queries: np.ndarray, truth):
+    """进程内精确检索和IVF网格"""
+    vectors = np.vstack([chunk for _, chunk in iter_population(size, args.dim, args.clusters, args.seed)])
+    ids = [str(i) for i in range(size)]
+
+    configs = [('memory-exact', dict(exact_threshold=size + 1))]
+    for nlist in [int(n) for n in args.nlist.split(',') if n.strip()]:
+        for nprobe in [int(n) for n in args.nprobe.split(',') if n.strip()]:
+            configs.append((f"memory-ivf nlist={nlist} nprobe={nprobe}",
+                            dict(exact_threshold=0, nlist=nlist, nprobe=nprobe)))
+
+    rows = []
+    built = {}
+    for name, kwargs in configs:
+        # nprobe只影响查询，同一nlist的索引只构建一次
+        build_key = (kwargs.get('nlist'), kwargs['exact_threshold'])
+        if build_key in built:
+            index, build_seconds = built[build_key]
+            index.nprobe = kwargs.get('nprobe', index.nprobe)
+        else:
+            index = InMemoryVectorIndex(**kwargs)
+            start = time.perf_counter()
+            index.build(ids, vectors)
+            build_seconds = time.perf_counter() - start
+            built[build_key] = (index, build_seconds)
+        memory_mb = index.get_stats()['vector_bytes'] / 1024 / 1024
+        approx, p50, p99, qps = measure_queries(index, queries, args.k, args.concurrency)
+        rows.append((name, build_seconds, memory_mb, p50, p99, qps, recall_at_k(truth, approx, args.k)))
+    return rows
+
+
+def run_redis(args, size: int, queries: np.ndarray, truth):
+    """RediSearch FLAT和HNSW参数网格"""
+    from app.redis_pool import get_redis_client
+    from app.models.index_builder import create_index, write_entity_vectors
+    from app.models.vector_search import RediSearchBackend
+
+    redis_client = get_redis_client(decode_responses=False, host=args.redis_host, port=args.redis_port, db=0)
+    index_name, key_prefix = 'bench_index', 'bench_index:'
+
+    configs = [('FLAT', None, None)]
+    for m in [int(n) for n in args.m.split(',') if n.strip()]:
+        for ef_construction in [int(n) for n in args.ef_construction.split(',') if n.strip()]:
+            configs.append(('HNSW', m, ef_construction))
+    ef_runtimes = [int(n) for n in args.ef_runtime.split(',') if n.strip()]
+
+    rows = []
+    for algorithm, m, ef_construction in configs:
+        create_index(redis_client, index_name=index_name, key_prefix=key_prefix, algorithm=algorithm,
+                     dim=args.dim, m=m or 16, ef_construction=ef_construction or 200, drop_existing=True)
+        try:
+            start = time.perf_counter()
+            for begin, chunk in iter_population(size, args.dim, args.clusters, args.seed):
+                write_entity_vectors(redis_client, [str(begin + i) for i in range(len(chunk))], chunk,
+                                     key_prefix=key_prefix)
+            # 等待后台索引完成
+            while True:
+                info = _ft_info(redis_client, index_name)
+                if float(info.get('percent_indexed', 1)) >= 1:
+                    break
+                time.sleep(0.5)
+            build_seconds = time.perf_counter() - start
+            memory_mb = float(info.get('vector_index_sz_mb', 0))
+
+            backend = RediSearchBackend(redis_client, index_name=index_name, key_prefix=key_prefix)
+            for ef_runtime in (ef_runtimes if algorithm == 'HNSW' else [None]):
+                name = 'redis-flat' if algorithm == 'FLAT' else \
+                    f"redis-hnsw M={m} efc={ef_construction} ef={ef_runtime}"
+                approx, p50, p99, qps = measure_queries(backend, queries, args.k, args.concurrency, ef_runtime)
+                rows.append((name, build_seconds, memory_mb, p50, p99, qps, recall_at_k(truth, approx, args.k)))
+        finally:
+            # 删除索引及其哈希数据
+            redis_client.execute_command('FT.DROPINDEX', index_name, 'DD')
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引构建/内存/延迟/召回率基准")
+    parser.add_argument('--sizes', default='10000,100000', help="实体数量列表（1万到1000万）")
+    parser.add_argument('--queries', type=int, default=500, help="查询数量")
+    parser.add_argument('--dim', type=int, default=128, help="向量维度")
+    parser.add_argument('--clusters', type=int, default=256, help="合成数据的聚类数")
+    parser.add_argument('--k', type=int, default=10, help="recall@k的k")
+    parser.add_argument('--backend', default='memory', choices=('memory', 'redis', 'both'), help="测试的后端")
+    parser.add_argument('--m', default='8,16,32', help="HNSW M列表")
+    parser.add_argument('--ef-construction', default='100,200', help="HNSW EF_CONSTRUCTION列表")
+    parser.add_argument('--ef-runtime', default='10,50,100,200', help="HNSW EF_RUNTIME列表")
+    parser.add_argument('--nlist', default='256,1024', help="进程内IVF分区数列表")
+    parser.add_argument('--nprobe', default='4,8,16', help="进程内IVF查询分区数列表")
+    parser.add_argument('--concurrency', type=int, default=4, help="测QPS的并发线程数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--redis-host', default=None, help="Redis主机，默认Config.REDIS_HOST")
+    parser.add_argument('--redis-port', type=int, default=None, help="Redis端口，默认Config.REDIS_PORT")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    queries = generate_queries(args.queries, args.dim, args.clusters, args.seed)
+    header = (f"{'配置':<44}{'构建(s)':>10}{'内存(MB)':>10}{'p50(ms)':>10}{'p99(ms)':>10}"
+              f"{'QPS':>10}{'recall@' + str(args.k):>12}")
+
+    for size in [int(n) for n in args.sizes.split(',') if n.strip()]:
+        start = time.perf_counter()
+        truth = brute_force_topk(iter_population(size, args.dim, args.clusters, args.seed), queries, args.k)
+        print(f"\n实体数量: {size}, 查询数量: {len(queries)}, k={args.k}, "
+              f"暴力检索基线耗时: {time.perf_counter() - start:.1f}s")
+        print(header)
+
+        rows = []
+        if args.backend in ('memory', 'both'):
+            rows.extend(run_memory(args, size, queries, truth))
+        if args.backend in ('redis', 'both'):
+            rows.extend(run_redis(args, size, queries, truth))
+        for name, build_seconds, memory_mb, p50, p99, qps, recall in rows:
+            print(f"{name:<44}{build_seconds:>10.2f}{memory_mb:>10.1f}{p50:>10.3f}{p99:>10.3f}"
+                  f"{qps:>10.0f}{recall:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
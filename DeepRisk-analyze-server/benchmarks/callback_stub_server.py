@@ -0,0 +1,144 @@
+"""
+回调接收方的本地桩服务
+
+模拟审计服务的异步风险评估回调接口，用于联调和回调投递基准，不依赖Java服务：
+- POST .../result  逐条回调，成功返回200，缺少requestId返回400，模拟失败返回500
+- POST .../results 批量回调，请求体为结果数组，按顺序返回每条结果的状态
+  {"accepted": n, "failed": m, "results": [{"requestId": ..., "status": "OK" | "ERROR", "message": ...}]}
+缺少requestId的结果与审计服务一样视为ERROR。
+
+用法:
+    python benchmarks/callback_stub_server.py --port 8081 --latency-ms 2 --fail-rate 0.01
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CallbackStubServer(ThreadingHTTPServer):
+    """记录请求数和结果数的回调桩服务"""
+
+    daemon_threads = True
+    # 默认的监听队列只有5，多个投递线程同时建立连接时会触发SYN重传
+    request_queue_size = 128
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0.0, fail_rate: float = 0.0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency_ms: 每个请求的模拟处理时间（毫秒）
+            fail_rate: 逐条回调返回500、批量回调中单条返回ERROR的概率
+        """
+        super().__init__((host, port), _CallbackHandler)
+        self.latency_ms = float(latency_ms)
+        self.fail_rate = float(fail_rate)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'batch_requests': 0, 'results': 0, 'accepted': 0, 'rejected': 0}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/async-risk-assessment"
+
+    def record(self, batch: bool, accepted: int, rejected: int):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['batch_requests'] += int(batch)
+            self.stats['results'] += accepted + rejected
+            self.stats['accepted'] += accepted
+            self.stats['rejected'] += rejected
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def start(self) -> 'CallbackStubServer':
+        """在后台线程中运行"""
+        threading.Thread(target=self.serve_forever, name='callback-stub', daemon=True).start()
+        return self
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    # 支持keep-alive，与投递器的连接复用行为一致
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+        except ValueError:
+            self._reply(400, {'message': '请求体不是合法的JSON'})
+            return
+
+        if self.server.latency_ms > 0:
+            time.sleep(self.server.latency_ms / 1000)
+
+        path = self.path.rstrip('/')
+        if path.endswith('/results') and isinstance(payload, list):
+            statuses = [self._item_status(item) for item in payload]
+            accepted = sum(1 for status in statuses if status['status'] == 'OK')
+            self.server.record(True, accepted, len(statuses) - accepted)
+            self._reply(200, {'accepted': accepted, 'failed': len(statuses) - accepted, 'results': statuses})
+        elif path.endswith('/result') and isinstance(payload, dict):
+            status = self._item_status(payload)
+            ok = status['status'] == 'OK'
+            self.server.record(False, int(ok), int(not ok))
+            if ok:
+                self._reply(200, '结果已接收并处理')
+            else:
+                # 缺少requestId与审计服务一样返回400，模拟失败返回500（投递器会重试）
+                self._reply(500 if payload.get('requestId') else 400, status['message'])
+        else:
+            self._reply(404, {'message': f"未知的回调路径: {self.path}"})
+
+    def _item_status(self, item) -> dict:
+        request_id = item.get('requestId') if isinstance(item, dict) else None
+        if not request_id:
+            return {'requestId': request_id, 'status': 'ERROR', 'message': '缺少requestId'}
+        if random.random() < self.server.fail_rate:
+            return {'requestId': request_id, 'status': 'ERROR', 'message': '模拟处理失败'}
+        return {'requestId': request_id, 'status': 'OK'}
+
+    def _reply(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回调接收方桩服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8081, help="监听端口")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="每个请求的模拟处理时间（毫秒）")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="模拟失败的概率")
+    parser.add_argument('--report-interval', type=float, default=5.0, help="统计输出间隔（秒）")
+    args = parser.parse_args()
+
+    server = CallbackStubServer(args.host, args.port, args.latency_ms, args.fail_rate).start()
+    print(f"[回调桩服务] 监听 {server.base_url}/result 和 {server.base_url}/results")
+
+    last, last_time = server.get_stats(), time.perf_counter()
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            stats, now = server.get_stats(), time.perf_counter()
+            elapsed = now - last_time
+            print(f"[回调桩服务] 请求 {(stats['requests'] - last['requests']) / elapsed:.0f}/s, "
+                  f"结果 {(stats['results'] - last['results']) / elapsed:.0f}/s, "
+                  f"累计: {stats}")
+            last, last_time = stats, now
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
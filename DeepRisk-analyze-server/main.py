@@ -17,6 +17,8 @@ import uvicorn
 from app.config import Config
 from app.nacos_config import nacos_config_manager
 from app.rabbitmq.consumer import RiskAssessmentConsumer
+from app.rabbitmq.supervisor import ConsumerSupervisor, resolve_process_count
+from app.redis_pool import close_all_pools, aclose_all_pools
 
 # 配置日志
 logging.basicConfig(
@@ -48,13 +50,15 @@ service_registered = False
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global nacos_client, service_registered
+    global nacos_client, service_registered, consumer
     # 应用启动时的初始化逻辑
     print("【启动】初始化应用...")
     logger.info("Starting application initialization...")
     
     # 配置应用
     app.config = Config
+    # /consumer路由通过request.app.consumer访问消费者
+    app.consumer = consumer
     
     # 初始化Nacos配置管理器
     try:
@@ -99,10 +103,22 @@ async def lifespan(app: FastAPI):
         logger.error(f"Nacos服务注册失败: {str(e)}")
         print(f"[Nacos错误] 服务注册失败: {str(e)}")
     
-    # 加载模型
+    # 加载模型（多进程模式下在fork前加载，子进程共享模型内存页）
     from app.models.model_loader import load_models
     load_models()
     
+    # 多进程模式：由ConsumerSupervisor fork消费者进程，Web进程本身不消费；
+    # 构造时即fork模板进程，之后的消费者进程都由它fork，需紧接在load_models()之后创建
+    process_count = resolve_process_count(Config.CONSUMER_PROCESSES)
+    if process_count > 1:
+        print(f"[初始化] 多进程消费模式，消费者进程数: {process_count}")
+        consumer = ConsumerSupervisor(
+            process_count,
+            report_interval=Config.CONSUMER_STATUS_INTERVAL,
+            restart_delay=Config.CONSUMER_RESTART_DELAY
+        )
+        app.consumer = consumer
+    
     # 初始化并启动消费者
     try:
         print("[初始化] 开始初始化消费者...")
@@ -136,6 +152,13 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"停止消费者时发生错误: {str(e)}")
     
+    # 关闭共享的Redis连接池
+    try:
+        await aclose_all_pools()
+        close_all_pools()
+    except Exception as e:
+        logger.error(f"关闭Redis连接池时发生错误: {str(e)}")
+    
     # 从Nacos注销服务
     try:
         if service_registered and nacos_client:
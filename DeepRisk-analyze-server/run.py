@@ -1,6 +1,7 @@
 import sys
 import os
 import logging
+import argparse
 
 # 设置基本日志配置
 logging.basicConfig(
@@ -26,6 +27,14 @@ print("="*50)
 import uvicorn
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="深度分析服务")
+    parser.add_argument('--consumer-processes', default=None,
+                        help="消费者进程数，auto为CPU核数，默认取环境变量CONSUMER_PROCESSES（1为在Web进程内消费）")
+    args = parser.parse_args()
+    # Config在uvicorn导入main时读取环境变量
+    if args.consumer_processes is not None:
+        os.environ['CONSUMER_PROCESSES'] = args.consumer_processes
+    
     print("="*50)
     print("【启动】准备启动Web服务...")
     print("="*50)
@@ -33,6 +42,7 @@ if __name__ == "__main__":
     # 从环境变量获取端口号，默认为8000
     port = int(os.getenv('SERVER_PORT', 8000))
     print(f"【启动】服务将在端口 {port} 上启动")
+    print(f"【启动】消费者进程数: {os.getenv('CONSUMER_PROCESSES', '1')}")
     
     uvicorn.run(
         "main:app",
@@ -0,0 +1,349 @@
+"""
+RiskAssessmentConsumer推理流水线测试
+
+用假的BlockingConnection/Channel代替RabbitMQ，验证：
+- 消息确认只在I/O线程（执行start_consuming的消费线程）中执行
+- 连接关闭后不再推理和确认，消息留给RabbitMQ重新投递；回调未能提交的消息重新入队
+- 推理队列已满时批次留在batch_queue中，由下一次定时器提交，I/O线程不阻塞
+- stop_consuming等待流水线中的批次确认完成后再关闭连接
+- 回调投递完成后才确认消息，投递失败时重新入队，再次失败时拒绝
+
+用法:
+    python -m pytest tests/test_consumer_pipeline.py
+"""
+import os
+import sys
+import json
+import time
+import types
+import queue
+import importlib
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def _stub_missing(name: str, **submodules):
+    """未安装的第三方依赖用空模块代替，测试只使用假的连接"""
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        module = types.ModuleType(name)
+        sys.modules[name] = module
+        for subname, attributes in submodules.items():
+            submodule = types.ModuleType(f"{name}.{subname}")
+            submodule.__dict__.update(attributes)
+            setattr(module, subname, submodule)
+            sys.modules[f"{name}.{subname}"] = submodule
+
+
+_stub_missing('pika')
+_stub_missing('aiohttp')
+_stub_missing('redis', asyncio={}, client={'Pipeline': object})
+
+from app.rabbitmq import consumer as consumer_module  # noqa: E402
+from app.rabbitmq.consumer import RiskAssessmentConsumer  # noqa: E402
+
+
+class FakeMethod:
+    def __init__(self, delivery_tag: int, redelivered: bool = False):
+        self.delivery_tag = delivery_tag
+        self.redelivered = redelivered
+
+
+class FakeDispatcher:
+    """记录提交的结果和on_done，由测试决定投递结果"""
+
+    def __init__(self):
+        self.pending = queue.Queue()
+
+    def submit(self, result, on_done=None, block=True):
+        self.pending.put((result, on_done))
+        return True
+
+    def complete(self, success: bool, count: int):
+        """在投递线程中结束count条结果的投递"""
+        def run():
+            for _ in range(count):
+                result, on_done = self.pending.get(timeout=5)
+                on_done(result, success)
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """
+    模拟pika.BlockingConnection：定时器和add_callback_threadsafe的回调只在调用process_data_events的线程中执行
+    """
+
+    # 新建连接后由通道依次投递的消息体
+    messages = []
+
+    def __init__(self, params=None):
+        self.is_open = True
+        self.channels = []
+        self.acks_at_close = None
+        self._callbacks = queue.Queue()
+        self._timers = []
+
+    def channel(self):
+        channel = FakeChannel(self, list(self.messages))
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise RuntimeError("连接已关闭")
+        self._callbacks.put(callback)
+
+    def call_later(self, delay, callback):
+        timer = [time.monotonic() + delay, callback]
+        self._timers.append(timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        if timer in self._timers:
+            self._timers.remove(timer)
+
+    def process_data_events(self, time_limit=0):
+        deadline = time.monotonic() + time_limit
+        while True:
+            for timer in [timer for timer in self._timers if timer[0] <= time.monotonic()]:
+                self._timers.remove(timer)
+                timer[1]()
+            try:
+                self._callbacks.get(timeout=0.002)()
+            except queue.Empty:
+                pass
+            if time.monotonic() >= deadline:
+                break
+
+    def close(self):
+        self.acks_at_close = sum(len(channel.acks) for channel in self.channels)
+        self.is_open = False
+
+
+class FakeChannel:
+    """记录确认/拒绝及执行它们的线程，start_consuming投递全部消息后处理I/O事件直到stop_consuming"""
+
+    def __init__(self, connection: FakeConnection, messages):
+        self.connection = connection
+        self.is_open = True
+        self.messages = messages
+        self.delivered = 0
+        self.acks = []
+        self.nacks = []
+        self.settle_threads = set()
+        self._on_message = None
+        self._consuming = False
+
+    def queue_declare(self, queue, durable=False):
+        pass
+
+    def basic_qos(self, prefetch_count=0):
+        pass
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self._on_message = on_message_callback
+
+    def basic_ack(self, delivery_tag):
+        self.settle_threads.add(threading.current_thread())
+        self.acks.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=False):
+        self.settle_threads.add(threading.current_thread())
+        self.nacks.append((delivery_tag, requeue))
+
+    def start_consuming(self):
+        self._consuming = True
+        for body in self.messages:
+            self.delivered += 1
+            self._on_message(self, FakeMethod(self.delivered), None, body)
+        while self._consuming:
+            self.connection.process_data_events(time_limit=0.01)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+
+def _message(i: int, valid: bool = True) -> bytes:
+    return json.dumps({
+        'requestId': f"req-{i}",
+        'doctorId': f"D{i}",
+        'vector': [0.1] * 35 if valid else [0.1]
+    }).encode('utf-8')
+
+
+def _wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class ConsumerPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.consumer = RiskAssessmentConsumer()
+        self.consumer._setup_complete = True
+        self.consumer.inference_workers = 2
+        self.inference_threads = set()
+        self.inference_delay = 0.0
+        self.submitted = []
+        self.submit_result = True
+        self.consumer._batch_process_vectors = self._fake_batch_process_vectors
+        self.consumer._send_result_async_fire_and_forget = self._fake_submit
+
+    def tearDown(self):
+        self.consumer._stop_event.set()
+        for thread in self.consumer._worker_threads:
+            thread.join(timeout=2)
+
+    def _fake_batch_process_vectors(self, vectors_35d, message_details):
+        self.inference_threads.add(threading.current_thread())
+        time.sleep(self.inference_delay)
+        return [{'requestId': detail['request_id'], 'status': 'SUCCESS'} for detail in message_details]
+
+    def _fake_submit(self, result, block=True, on_done=None):
+        self.submitted.append((result['requestId'], block))
+        return self.submit_result
+
+    def _run_consumer(self, messages):
+        """启动消费者并等待全部消息投递完成，返回假通道"""
+        FakeConnection.messages = messages
+        patcher = mock.patch.object(consumer_module.pika, 'BlockingConnection', FakeConnection, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.consumer.start_consuming()
+        self.assertTrue(_wait_until(lambda: self.consumer._channel is not None))
+        channel = self.consumer._channel
+        self.assertTrue(_wait_until(lambda: channel.delivered == len(messages)))
+        return channel
+
+    def test_settles_on_io_thread(self):
+        """推理在工作线程中执行，确认回到消费线程；不满批的批次由定时器提交"""
+        channel = self._run_consumer([_message(i) for i in range(21)])
+
+        self.assertTrue(_wait_until(lambda: len(channel.acks) == 21))
+        self.assertEqual(channel.settle_threads, {self.consumer._consumer_thread})
+        self.assertNotIn(self.consumer._consumer_thread, self.inference_threads)
+        self.assertEqual(channel.nacks, [])
+        self.consumer.stop_consuming()
+
+    def test_invalid_vector_submits_without_blocking(self):
+        """无效向量在I/O线程中处理，回调不等待投递队列，提交失败时重新入队"""
+        self.submit_result = False
+        channel = self._run_consumer([_message(0, valid=False)])
+
+        self.assertTrue(_wait_until(lambda: channel.nacks == [(1, True)]))
+        self.assertEqual(self.submitted, [('req-0', False)])
+        self.assertEqual(channel.acks, [])
+        self.consumer.stop_consuming()
+
+    def test_rejected_callback_is_requeued(self):
+        """回调没有进入投递队列时消息重新入队，而不是确认后丢失结果"""
+        self.submit_result = False
+        channel = self._run_consumer([_message(i) for i in range(16)])
+
+        self.assertTrue(_wait_until(lambda: len(channel.nacks) == 16))
+        self.assertEqual(channel.nacks, [(tag, True) for tag in range(1, 17)])
+        self.assertEqual(channel.acks, [])
+        self.consumer.stop_consuming()
+
+    def test_closed_connection_leaves_messages_for_redelivery(self):
+        """连接在批次等待推理期间关闭：不推理、不确认，计数归零，消息由RabbitMQ重新投递"""
+        self.consumer._consume_messages = lambda: None
+        self.consumer.start_consuming()
+
+        connection = FakeConnection()
+        channel = connection.channel()
+        connection.close()
+        for i in range(16):
+            self.consumer.batch_queue.append({'channel': channel, 'method': FakeMethod(i + 1), 'properties': None,
+                                              'body': _message(i), 'receive_time': time.time()})
+        self.consumer._process_batch()
+
+        self.assertTrue(_wait_until(lambda: self.consumer._inflight_batches == 0))
+        self.assertEqual(self.consumer._queued_messages, 0)
+        self.assertEqual(self.inference_threads, set())
+        self.assertEqual(channel.acks, [])
+        self.assertEqual(channel.nacks, [])
+
+    def test_full_work_queue_defers_batch_to_next_timer(self):
+        """推理队列已满时不阻塞I/O线程，批次留在batch_queue中，定时器在队列有空位后提交"""
+        # 不启动工作线程，只让_process_batch走推理队列分支
+        placeholder = threading.Thread(target=lambda: None)
+        placeholder.start()
+        self.consumer._worker_threads = [placeholder]
+        self.consumer._work_queue = queue.Queue(maxsize=1)
+        self.consumer._work_queue.put_nowait(None)
+
+        connection = FakeConnection()
+        channel = connection.channel()
+        for i in range(16):
+            self.consumer._batch_message_handler(channel, FakeMethod(i + 1), None, _message(i))
+
+        self.assertEqual(len(self.consumer.batch_queue), 16)
+        self.assertEqual(self.consumer._deferred_flushes, 1)
+        self.assertIsNotNone(self.consumer._flush_timer)
+
+        self.consumer._work_queue.get_nowait()
+        connection.process_data_events(time_limit=self.consumer.batch_timeout * 3)
+
+        self.assertEqual(len(self.consumer.batch_queue), 0)
+        _, vectors_35d, message_details = self.consumer._work_queue.get_nowait()
+        self.assertEqual(len(vectors_35d), 16)
+        self.assertEqual([detail['method'].delivery_tag for detail in message_details], list(range(1, 17)))
+
+    def test_stop_drains_inflight_batches_before_close(self):
+        """stop_consuming取消消费后，消费线程继续处理I/O事件，直到在途批次全部确认后才关闭连接"""
+        self.inference_delay = 0.2
+        channel = self._run_consumer([_message(i) for i in range(32)])
+        self.assertTrue(_wait_until(lambda: self.consumer._inflight_batches == 2))
+
+        self.consumer.stop_consuming()
+
+        self.assertFalse(self.consumer._consumer_thread.is_alive())
+        self.assertEqual(sorted(channel.acks), list(range(1, 33)))
+        self.assertEqual(channel.connection.acks_at_close, 32)
+        self.assertEqual(channel.settle_threads, {self.consumer._consumer_thread})
+        self.assertEqual(self.consumer._inflight_batches, 0)
+
+    def test_ack_waits_for_callback_delivery(self):
+        """投递成功后才确认；投递失败的消息重新入队，已重新投递过的消息拒绝；确认都在I/O线程中执行"""
+        del self.consumer._send_result_async_fire_and_forget
+        dispatcher = FakeDispatcher()
+        self.consumer._callback_dispatcher = dispatcher
+        channel = self._run_consumer([_message(i) for i in range(16)])
+        self.assertTrue(_wait_until(lambda: dispatcher.pending.qsize() == 16))
+        self.assertTrue(_wait_until(lambda: self.consumer._inflight_batches == 0))
+        self.assertEqual(channel.acks, [])
+        self.assertEqual(self.consumer._pending_callbacks, 16)
+
+        dispatcher.complete(True, 8)
+        self.assertTrue(_wait_until(lambda: len(channel.acks) == 8))
+        dispatcher.complete(False, 8)
+        self.assertTrue(_wait_until(lambda: len(channel.nacks) == 8))
+        self.assertEqual(channel.acks, list(range(1, 9)))
+        self.assertEqual(channel.nacks, [(tag, True) for tag in range(9, 17)])
+        self.assertEqual(channel.settle_threads, {self.consumer._consumer_thread})
+        self.assertTrue(_wait_until(lambda: self.consumer._pending_callbacks == 0))
+
+        self.consumer._pending_callbacks += 1
+        self.consumer._on_callback_done(channel, FakeMethod(17, redelivered=True), False)
+        self.assertTrue(_wait_until(lambda: (17, False) in channel.nacks))
+        self.assertTrue(_wait_until(lambda: self.consumer._pending_callbacks == 0))
+        self.consumer.stop_consuming()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+融合编码器与torch路径的一致性测试
+
+FusedEncoder把StandardScaler折叠进第一层Linear后，编码结果必须与scaler.transform + torch编码器一致，
+保存/加载后结果不变，无法折叠的层在生成时报错。
+
+用法:
+    python -m pytest tests/test_fused_encoder.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+import torch
+from torch import nn
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.fused_encoder import FusedEncoder  # noqa: E402
+
+
+class Encoder(nn.Module):
+    """与model_loader中的编码器结构相同：35 → 64 → 128 → 128，每层之后接ReLU"""
+
+    def __init__(self, input_dim=35, hidden_dim=64, latent_dim=128, dropout=False):
+        super().__init__()
+        layers = [nn.Linear(input_dim, hidden_dim), nn.ReLU()]
+        if dropout:
+            layers.append(nn.Dropout(0.2))
+        layers += [nn.Linear(hidden_dim, hidden_dim * 2), nn.ReLU(), nn.Linear(hidden_dim * 2, latent_dim), nn.ReLU()]
+        self.encoder = nn.Sequential(*layers)
+
+    def forward(self, x):
+        return self.encoder(x)
+
+
+class FusedEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.rng = np.random.default_rng(0)
+        # 各维度均值和标准差不同，折叠标准化参数的误差才能体现出来
+        mean = self.rng.normal(0, 5, size=35)
+        scale = self.rng.uniform(0.1, 10, size=35)
+        self.scaler = StandardScaler().fit(mean + scale * self.rng.normal(size=(2000, 35)))
+        self.inputs = (mean + scale * self.rng.normal(size=(257, 35))).astype(np.float32)
+
+    def torch_encode(self, encoder, inputs):
+        with torch.no_grad():
+            return encoder(torch.FloatTensor(self.scaler.transform(inputs))).numpy()
+
+    def assert_matches_torch(self, encoder):
+        encoder.eval()
+        fused = FusedEncoder.from_torch(encoder, self.scaler, source_version='test')
+        expected = self.torch_encode(encoder, self.inputs)
+        actual = fused.encode(self.inputs)
+        self.assertEqual(actual.shape, (len(self.inputs), 128))
+        self.assertEqual(actual.dtype, np.float32)
+        self.assertTrue(np.allclose(actual, expected, atol=1e-4), np.max(np.abs(actual - expected)))
+        return fused
+
+    def test_matches_torch_encoder(self):
+        self.assert_matches_torch(Encoder())
+
+    def test_dropout_is_skipped_in_eval_mode(self):
+        self.assert_matches_torch(Encoder(dropout=True))
+
+    def test_single_vector_and_varying_batch_sizes(self):
+        """一维输入返回一维向量；批大小增减时线程私有缓冲区不影响结果"""
+        encoder = Encoder().eval()
+        fused = self.assert_matches_torch(encoder)
+        expected = self.torch_encode(encoder, self.inputs)
+        np.testing.assert_allclose(fused.encode(self.inputs[0]), expected[0], atol=1e-4)
+        for n in (3, 200, 1, 257):
+            np.testing.assert_allclose(fused.encode(self.inputs[:n]), expected[:n], atol=1e-4)
+
+    def test_save_load_round_trip(self):
+        fused = self.assert_matches_torch(Encoder())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'encoder_fused.npz')
+            fused.save(path)
+            loaded = FusedEncoder.load(path)
+        self.assertEqual(loaded.source_version, 'test')
+        np.testing.assert_array_equal(loaded.encode(self.inputs), fused.encode(self.inputs))
+
+    def test_verify_reports_error(self):
+        encoder = Encoder().eval()
+        fused = FusedEncoder.from_torch(encoder, self.scaler)
+        self.assertLess(fused.verify(encoder, self.scaler), 1e-4)
+        with torch.no_grad():
+            encoder.encoder[0].bias.add_(1.0)
+        with self.assertRaises(ValueError):
+            fused.verify(encoder, self.scaler)
+
+    def test_unsupported_layer_is_rejected(self):
+        encoder = nn.Sequential(nn.Linear(35, 64), nn.Tanh(), nn.Linear(64, 128))
+        with self.assertRaises(ValueError):
+            FusedEncoder.from_torch(encoder, self.scaler)
+
+
+if __name__ == '__main__':
+    unittest.main()
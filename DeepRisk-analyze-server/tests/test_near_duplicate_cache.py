@@ -0,0 +1,163 @@
+"""
+近重复向量缓存测试
+
+用固定向量验证NearDuplicateCache.lookup_many/put_many：
+- 容差内的近重复向量复用近邻列表，同一个桶内超出容差的向量不命中（计为碰撞）
+- 同一批次内的近重复向量只查询代表向量（aliases）
+- 作用域不同的结果互不复用，过期条目不命中，模型版本变化和invalidate清空缓存
+
+用法:
+    python -m pytest tests/test_near_duplicate_cache.py
+"""
+import os
+import sys
+import logging
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import near_duplicate_cache as cache_module  # noqa: E402
+from app.models.near_duplicate_cache import NearDuplicateCache  # noqa: E402
+
+VERSION = 'v1'
+
+
+def _unit(dim: int, axis: int) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector
+
+
+def _neighbors(name: str):
+    return [{'entity_id': f"{name}-{j}", 'similarity_score': 0.1 * j, 'label': j % 2} for j in range(3)]
+
+
+class NearDuplicateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('app.models.near_duplicate_cache').disabled = True
+        self.addCleanup(setattr, logging.getLogger('app.models.near_duplicate_cache'), 'disabled', False)
+        self.now = 1000.0
+        patcher = mock.patch.object(cache_module.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.cache = NearDuplicateCache(dim=8, num_bits=4, tolerance=0.02, ttl=60, verify_rate=0.0)
+        self.base = _unit(8, 0) * 3.0
+        # 与base的余弦距离约0.00125（容差内）和约0.106（超出容差）
+        self.near = self.base + 0.15 * _unit(8, 2)
+        self.far = self.base + 1.5 * _unit(8, 2)
+        self.other = -self.base
+        signatures, _ = self.cache.signatures(np.stack([self.base, self.near, self.far, self.other]))
+        # 前提：base/near/far落在同一个桶，other在另一个桶
+        self.assertEqual(len(set(signatures[:3].tolist())), 1)
+        self.assertNotEqual(signatures[3], signatures[0])
+
+    def lookup(self, vectors, scopes=None, version=VERSION):
+        return self.cache.lookup_many(vectors, scopes or [None] * len(vectors), version)
+
+    def test_hit_within_tolerance(self):
+        self.lookup([self.base])
+        self.cache.put_many([self.base], [None], [_neighbors('base')])
+
+        hits, aliases, verify = self.lookup([self.base, self.near])
+        self.assertEqual(hits[0][0], _neighbors('base'))
+        self.assertAlmostEqual(hits[0][1], 0.0, places=6)
+        self.assertEqual(hits[1][0], _neighbors('base'))
+        self.assertLess(hits[1][1], self.cache.tolerance)
+        self.assertEqual((aliases, verify), ({}, set()))
+        self.assertEqual(self.cache.get_stats()['hits'], 2)
+
+    def test_same_bucket_beyond_tolerance_is_rejected(self):
+        self.lookup([self.base])
+        self.cache.put_many([self.base], [None], [_neighbors('base')])
+
+        hits, aliases, _ = self.lookup([self.far, self.other])
+        self.assertEqual(hits, [None, None])
+        self.assertEqual(aliases, {})
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['collisions']), (0, 3, 1))
+
+    def test_in_batch_aliasing(self):
+        """批次内第一条为代表，容差内的后续向量指向代表，超出容差或不同桶的向量各自查询"""
+        hits, aliases, _ = self.lookup([self.base, self.near, self.far, self.other, self.base])
+        self.assertEqual(hits, [None] * 5)
+        self.assertEqual(aliases, {1: 0, 4: 0})
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['batch_hits'], stats['misses']), (2, 3))
+
+    def test_scopes_are_separate(self):
+        self.lookup([self.base])
+        self.cache.put_many([self.base], ['tenant=a'], [_neighbors('a')])
+
+        hits, _, _ = self.lookup([self.base, self.base], ['tenant=b', 'tenant=a'])
+        self.assertIsNone(hits[0])
+        self.assertEqual(hits[1][0], _neighbors('a'))
+
+        hits, aliases, _ = self.lookup([self.far, self.far], ['tenant=a', 'tenant=b'])
+        self.assertEqual(hits, [None, None])
+        self.assertEqual(aliases, {})
+
+    def test_ttl_expiry(self):
+        self.lookup([self.base])
+        self.cache.put_many([self.base], [None], [_neighbors('base')])
+
+        self.now += 59
+        self.assertIsNotNone(self.lookup([self.base])[0][0])
+        self.now += 2
+        self.assertIsNone(self.lookup([self.base])[0][0])
+
+    def test_model_version_change_and_invalidate_clear_the_cache(self):
+        self.lookup([self.base])
+        self.cache.put_many([self.base], [None], [_neighbors('base')])
+        self.assertIsNotNone(self.lookup([self.base])[0][0])
+
+        self.assertIsNone(self.lookup([self.base], version='v2')[0][0])
+        self.assertEqual(self.cache.get_stats()['invalidations'], 1)
+
+        self.cache.put_many([self.base], [None], [_neighbors('base')])
+        self.assertIsNotNone(self.lookup([self.base], version='v2')[0][0])
+        self.cache.invalidate()
+        self.assertIsNone(self.lookup([self.base], version='v2')[0][0])
+        self.assertEqual(self.cache.get_stats()['buckets'], 0)
+
+    def test_empty_results_are_not_stored(self):
+        self.lookup([self.base])
+        self.cache.put_many([self.base, self.other], [None, None], [[], _neighbors('other')])
+
+        hits, _, _ = self.lookup([self.base, self.other])
+        self.assertIsNone(hits[0])
+        self.assertEqual(hits[1][0], _neighbors('other'))
+
+    def test_bucket_and_capacity_limits(self):
+        cache = NearDuplicateCache(dim=8, num_bits=4, tolerance=0.02, max_buckets=1, bucket_size=1, verify_rate=0.0)
+        cache.lookup_many([self.base], [None], VERSION)
+        cache.put_many([self.base, self.far], [None, None], [_neighbors('base'), _neighbors('far')])
+        # 桶内只保留最新的一条
+        hits, _, _ = cache.lookup_many([self.base, self.far], [None, None], VERSION)
+        self.assertIsNone(hits[0])
+        self.assertEqual(hits[1][0], _neighbors('far'))
+
+        cache.put_many([self.other], [None], [_neighbors('other')])
+        hits, _, _ = cache.lookup_many([self.far, self.other], [None, None], VERSION)
+        self.assertIsNone(hits[0])
+        self.assertEqual(hits[1][0], _neighbors('other'))
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_verification_sampling(self):
+        cache = NearDuplicateCache(dim=8, num_bits=4, tolerance=0.02, verify_rate=1.0)
+        cache.lookup_many([self.base], [None], VERSION)
+        cache.put_many([self.base], [None], [_neighbors('base')])
+
+        hits, _, verify = cache.lookup_many([self.near, self.other], [None, None], VERSION)
+        self.assertEqual(verify, {0})
+        cache.record_verification(hits[0][0], _neighbors('base')[:2] + _neighbors('x')[2:])
+        stats = cache.get_stats()
+        self.assertEqual(stats['verifications'], 1)
+        self.assertAlmostEqual(stats['verify_mean_recall'], 2 / 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+KNN查询规划器测试
+
+验证耗时记录在实际发送给FT.SEARCH的EF_RUNTIME下（查询多取一个近邻时EF_RUNTIME被调高到k+1），
+以及只有非档位EF_RUNTIME的样本时各档位的耗时估计和档位选择。
+
+用法:
+    python -m pytest tests/test_query_planner.py
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.query_planner import KnnQueryPlanner  # noqa: E402
+
+
+class KnnQueryPlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.planner = KnnQueryPlanner(default_budget_ms=50.0, ef_levels=(10, 20, 40, 80), default_ef=10,
+                                       min_k=10, max_k=10)
+
+    def test_latency_is_recorded_under_effective_ef(self):
+        plan = self.planner.plan()
+        self.assertEqual(plan['ef_runtime'], 10)
+        self.planner.record_latency(plan, 4.0, num_queries=2, ef_runtime=11)
+        self.assertEqual(self.planner.get_stats()['latency_per_query_ms'], {'11': 2.0})
+
+    def test_planned_ef_is_used_without_effective_ef(self):
+        plan = self.planner.plan()
+        self.planner.record_latency(plan, 3.0)
+        self.assertEqual(self.planner.get_stats()['latency_per_query_ms'], {'10': 3.0})
+
+    def test_levels_are_estimated_from_effective_ef_samples(self):
+        """样本只在ef=11下时按比例外推各档位：20档约2*20/11毫秒，40档约2*40/11毫秒"""
+        plan = self.planner.plan()
+        self.planner.record_latency(plan, 2.0, ef_runtime=11)
+        self.assertEqual(self.planner.plan(budget_ms=5.0)['ef_runtime'], 20)
+        self.assertEqual(self.planner.plan(budget_ms=8.0)['ef_runtime'], 40)
+        self.assertEqual(self.planner.plan(budget_ms=1.0)['ef_runtime'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
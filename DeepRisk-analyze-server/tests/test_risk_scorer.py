@@ -0,0 +1,112 @@
+"""
+向量化批量评分与逐条评分的一致性测试
+
+_score_neighbor_matrices在(N, k)矩阵上一次计算的得分必须与_calculate_risk_score逐条计算的结果一致，
+覆盖随机相似实体集合和边界情况：没有相似实体、全部无标签、相似实体数少于矩阵列数（NaN填充）。
+
+用法:
+    python -m pytest tests/test_risk_scorer.py
+"""
+import os
+import sys
+import logging
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.fraud_detection import FraudDetectionCore  # noqa: E402
+
+
+def _entities(scores, labels):
+    return [{'entity_id': f"entity_{j}", 'similarity_score': float(score), 'label': label}
+            for j, (score, label) in enumerate(zip(scores, labels))]
+
+
+def _random_batch(rng, num_entities: int, k: int):
+    """随机相似实体列表，混合不同区间的相似度和标签分布以覆盖各评分分支"""
+    batch = []
+    for _ in range(num_entities):
+        count = int(rng.integers(0, k + 1))
+        scale = rng.choice([1.0, 0.3, 0.1, 0.02])
+        scores = np.sort(rng.random(count) * scale)
+        if count and rng.random() < 0.1:
+            scores[-1] = 0.97
+        mode = rng.random()
+        labels = []
+        for _ in range(count):
+            if mode < 0.3:
+                labels.append(0)
+            elif mode < 0.4:
+                labels.append(None)
+            elif rng.random() < 0.2:
+                labels.append(None)
+            else:
+                labels.append(int(rng.integers(0, 2)))
+        batch.append(_entities(scores, labels))
+    return batch
+
+
+class RiskScorerEquivalenceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 评分逻辑不依赖Redis连接和向量检索后端
+        cls.detector = FraudDetectionCore.__new__(FraudDetectionCore)
+        logging.getLogger('app.models.fraud_detection').disabled = True
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.getLogger('app.models.fraud_detection').disabled = False
+
+    def assert_equivalent(self, batch, similarities=None, labels=None):
+        """矩阵得分与逐条得分一致；未给出矩阵时由_build_neighbor_matrices构造"""
+        if similarities is None:
+            similarities, labels = self.detector._build_neighbor_matrices(batch)
+        expected = np.array([self.detector._calculate_risk_score(entities) for entities in batch])
+        actual = self.detector._score_neighbor_matrices(similarities, labels)
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+
+    def test_random_neighbor_sets(self):
+        rng = np.random.default_rng(7)
+        for k in (1, 3, 5, 10, 20):
+            with self.subTest(k=k):
+                self.assert_equivalent(_random_batch(rng, 2000, k))
+
+    def test_no_neighbors(self):
+        batch = [[], _entities([0.5, 0.4], [1, 0]), []]
+        self.assert_equivalent(batch)
+        self.assertEqual(self.detector._calculate_risk_scores_batch([[]]).tolist(), [85.0])
+
+    def test_all_labels_none(self):
+        batch = [
+            _entities([0.9, 0.6, 0.55], [None, None, None]),
+            _entities([0.05, 0.02], [None, None]),
+            _entities([0.97], [None])
+        ]
+        self.assert_equivalent(batch)
+
+    def test_fewer_neighbors_than_columns(self):
+        """每行的相似实体数少于矩阵列数，其余位置为NaN/-1"""
+        batch = [
+            _entities([0.6, 0.3], [1, None]),
+            _entities([0.99], [0]),
+            _entities([0.15, 0.1, 0.05], [0, 0, 0])
+        ]
+        similarities = np.full((len(batch), 8), np.nan)
+        labels = np.full((len(batch), 8), -1, dtype=np.int64)
+        for i, entities in enumerate(batch):
+            for j, entity in enumerate(entities):
+                similarities[i, j] = entity['similarity_score']
+                labels[i, j] = -1 if entity['label'] is None else entity['label']
+        self.assert_equivalent(batch, similarities, labels)
+
+    def test_threshold_boundaries(self):
+        """相似度恰好落在各分段阈值上"""
+        batch = [_entities([value] * 5, [1, 0, 1, 0, None])
+                 for value in (0.01, 0.1, 0.2, 0.3, 0.5, 0.8, 0.9, 0.95)]
+        self.assert_equivalent(batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+分片检索测试
+
+用build_in_memory把同一批实体按一致性哈希划分到多个进程内索引（不依赖Redis），验证：
+- 堆归并后的全局Top-k与不分片的精确检索一致（同步和异步路径）
+- 单个分片失败时返回PartialShardResults而不是抛出异常，全部分片失败时抛出异常
+- ConsistentHashRing的划分确定、完整，增加分片只迁移约1/N的实体
+
+用法:
+    python -m pytest tests/test_sharded_search.py
+"""
+import os
+import sys
+import asyncio
+import logging
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.vector_search import InMemoryVectorIndex, VectorSearchBackend  # noqa: E402
+from app.models.sharded_search import (  # noqa: E402
+    ConsistentHashRing, PartialShardResults, ShardedSearchBackend
+)
+
+SHARDS = ['redis-a:6379', 'redis-b:6379', 'redis-c:6379']
+
+
+class FailingBackend(VectorSearchBackend):
+    """每次查询都失败的分片"""
+
+    name = "failing"
+
+    def search_batch(self, vectors_128d, k=10, ef_runtime=None, filters=None):
+        raise ConnectionError("分片不可用")
+
+
+def _ids(results):
+    return [[entity['entity_id'] for entity in entities] for entities in results]
+
+
+class ShardedSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.getLogger('app.models.vector_search').disabled = True
+        logging.getLogger('app.models.sharded_search').disabled = True
+        rng = np.random.default_rng(3)
+        cls.entity_ids = [f"E{i:05d}" for i in range(3000)]
+        cls.vectors = rng.normal(size=(3000, 128)).astype(np.float32)
+        cls.labels = [int(label) for label in rng.integers(0, 2, size=3000)]
+        cls.queries = list(rng.normal(size=(25, 128)).astype(np.float32))
+
+        cls.exact = InMemoryVectorIndex()
+        cls.exact.build(cls.entity_ids, cls.vectors, cls.labels)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.getLogger('app.models.vector_search').disabled = False
+        logging.getLogger('app.models.sharded_search').disabled = False
+
+    def setUp(self):
+        self.sharded = ShardedSearchBackend.build_in_memory(SHARDS, self.entity_ids, self.vectors, self.labels)
+
+    def assert_same_results(self, actual, expected):
+        self.assertEqual(_ids(actual), _ids(expected))
+        for actual_entities, expected_entities in zip(actual, expected):
+            np.testing.assert_allclose([entity['similarity_score'] for entity in actual_entities],
+                                       [entity['similarity_score'] for entity in expected_entities], atol=1e-6)
+            self.assertEqual([entity['label'] for entity in actual_entities],
+                             [entity['label'] for entity in expected_entities])
+
+    def test_entities_are_spread_over_all_shards(self):
+        sizes = [len(shard) for shard in self.sharded.shards]
+        self.assertEqual(sum(sizes), len(self.entity_ids))
+        self.assertTrue(all(size > 0 for size in sizes))
+
+    def test_merged_top_k_matches_unsharded_search(self):
+        for k in (1, 10, 50):
+            with self.subTest(k=k):
+                results = self.sharded.search_batch(self.queries, k=k)
+                self.assertNotIsInstance(results, PartialShardResults)
+                self.assert_same_results(results, self.exact.search_batch(self.queries, k=k))
+
+    def test_async_merge_matches_unsharded_search(self):
+        results = asyncio.run(self.sharded.asearch_batch(self.queries, k=10))
+        self.assert_same_results(results, self.exact.search_batch(self.queries, k=10))
+
+    def test_invalid_queries_stay_empty(self):
+        queries = [self.queries[0], None, self.queries[1]]
+        results = self.sharded.search_batch(queries, k=5)
+        self.assertEqual(results[1], [])
+        self.assert_same_results([results[0], results[2]], self.exact.search_batch([queries[0], queries[2]], k=5))
+
+    def test_failing_shard_returns_partial_results(self):
+        self.sharded.shards[1] = FailingBackend()
+        surviving = [i for i, entity_id in enumerate(self.entity_ids) if self.sharded.ring.get_shard(entity_id) != 1]
+        remaining = InMemoryVectorIndex()
+        remaining.build([self.entity_ids[i] for i in surviving], self.vectors[surviving],
+                        [self.labels[i] for i in surviving])
+        expected = remaining.search_batch(self.queries, k=10)
+
+        for results in (self.sharded.search_batch(self.queries, k=10),
+                        asyncio.run(self.sharded.asearch_batch(self.queries, k=10))):
+            self.assertIsInstance(results, PartialShardResults)
+            self.assertEqual(results.missing_shards, [SHARDS[1]])
+            self.assertEqual(results.total_shards, len(SHARDS))
+            self.assert_same_results(results, expected)
+        self.assertEqual([stats['errors'] for stats in self.sharded.get_stats()['shards']], [0, 2, 0])
+
+    def test_all_shards_failing_raises(self):
+        self.sharded.shards = [FailingBackend() for _ in SHARDS]
+        with self.assertRaises(ConnectionError):
+            self.sharded.search_batch(self.queries, k=10)
+        with self.assertRaises(ConnectionError):
+            asyncio.run(self.sharded.asearch_batch(self.queries, k=10))
+
+
+class ConsistentHashRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.entity_ids = [f"E{i:05d}" for i in range(20000)]
+
+    def test_partition_is_complete_and_deterministic(self):
+        ring = ConsistentHashRing(SHARDS)
+        groups = ring.partition(self.entity_ids)
+        self.assertEqual(sorted(i for group in groups for i in group), list(range(len(self.entity_ids))))
+        for shard, group in enumerate(groups):
+            self.assertTrue(all(ring.get_shard(self.entity_ids[i]) == shard for i in group))
+        # 同名分片在另一个实例（进程）中映射一致
+        self.assertEqual(ConsistentHashRing(SHARDS).partition(self.entity_ids), groups)
+
+    def test_adding_a_shard_moves_about_one_nth(self):
+        before = ConsistentHashRing(SHARDS)
+        after = ConsistentHashRing(SHARDS + ['redis-d:6379'])
+        moved = [entity_id for entity_id in self.entity_ids
+                 if before.get_shard(entity_id) != after.get_shard(entity_id)]
+        # 迁移的实体只会去新分片
+        self.assertTrue(all(after.get_shard(entity_id) == 3 for entity_id in moved))
+        self.assertLess(abs(len(moved) / len(self.entity_ids) - 0.25), 0.05)
+
+    def test_invalid_shard_lists(self):
+        with self.assertRaises(ValueError):
+            ConsistentHashRing([])
+        with self.assertRaises(ValueError):
+            ConsistentHashRing(['redis-a:6379', 'redis-a:6379'])
+
+
+if __name__ == '__main__':
+    unittest.main()
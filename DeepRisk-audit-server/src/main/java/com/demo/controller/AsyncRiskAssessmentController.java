@@ -6,6 +6,9 @@ import com.demo.repository.DoctorFraudScoreRepository;
 import org.springframework.beans.factory.annotation.Autowired;
 import org.springframework.http.ResponseEntity;
 import org.springframework.web.bind.annotation.*;
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
 import java.util.Map;
 import java.util.concurrent.ConcurrentHashMap;
 import java.util.logging.Logger;
@@ -37,62 +40,112 @@ public class AsyncRiskAssessmentController {
         try {
             logger.info("收到风险评估结果: " + result);
             
-            String requestId = (String) result.get("requestId");
-            String doctorId = (String) result.get("doctorId");
-            String status = (String) result.get("status");
-            
-            if (requestId == null || requestId.isEmpty()) {
-                logger.warning("收到的风险评估结果缺少requestId");
-                return ResponseEntity.badRequest().body("缺少requestId");
+            String error = processResult(result);
+            if (error != null) {
+                return ResponseEntity.badRequest().body(error);
             }
+            return ResponseEntity.ok("结果已接收并处理");
+        } catch (Exception e) {
+            logger.severe("处理风险评估结果时出错: " + e.getMessage());
+            return ResponseEntity.status(500).body("处理结果时出错: " + e.getMessage());
+        }
+    }
+    
+    /**
+     * 批量接收风险评估结果
+     * 逐条处理，单条失败不影响其他结果，响应中按请求顺序返回每条结果的处理状态
+     */
+    @PostMapping("/results")
+    public ResponseEntity<Map<String, Object>> receiveRiskAssessmentResults(@RequestBody List<Map<String, Object>> results) {
+        logger.info("收到批量风险评估结果: " + results.size() + " 条");
+        
+        List<Map<String, Object>> statuses = new ArrayList<>(results.size());
+        int accepted = 0;
+        for (Map<String, Object> result : results) {
+            Map<String, Object> status = new HashMap<>();
+            status.put("requestId", result == null ? null : result.get("requestId"));
+            try {
+                String error = result == null ? "空结果" : processResult(result);
+                if (error == null) {
+                    status.put("status", "OK");
+                    accepted++;
+                } else {
+                    status.put("status", "ERROR");
+                    status.put("message", error);
+                }
+            } catch (Exception e) {
+                logger.warning("处理批量风险评估结果时出错: " + e.getMessage());
+                status.put("status", "ERROR");
+                status.put("message", "处理结果时出错: " + e.getMessage());
+            }
+            statuses.add(status);
+        }
+        
+        Map<String, Object> response = new HashMap<>();
+        response.put("accepted", accepted);
+        response.put("failed", results.size() - accepted);
+        response.put("results", statuses);
+        return ResponseEntity.ok(response);
+    }
+    
+    /**
+     * 处理单条风险评估结果：存储结果并更新医生的欺诈评分和风险等级
+     *
+     * @return 结果无效时返回错误信息，处理成功返回null
+     */
+    private String processResult(Map<String, Object> result) {
+        String requestId = (String) result.get("requestId");
+        String doctorId = (String) result.get("doctorId");
+        String status = (String) result.get("status");
+        
+        if (requestId == null || requestId.isEmpty()) {
+            logger.warning("收到的风险评估结果缺少requestId");
+            return "缺少requestId";
+        }
+        
+        // 存储结果以便后续查询
+        assessmentResults.put(requestId, result);
+        
+        // 如果有医生ID，更新医生的风险等级；DEGRADED结果没有评分，保留原有风险等级
+        if (doctorId != null && !doctorId.isEmpty() && status != null && !"DEGRADED".equals(status)) {
+            String riskLevel = "正常";
             
-            // 存储结果以便后续查询
-            assessmentResults.put(requestId, result);
-            
-            // 如果有医生ID，更新医生的风险等级
-            if (doctorId != null && !doctorId.isEmpty() && status != null) {
-                String riskLevel = "正常";
-                
-                // 根据欺诈分数确定风险等级
-                Object fraudScoreObj = result.get("fraudScore");
-                if (fraudScoreObj != null) {
+            // 根据欺诈分数确定风险等级
+            Object fraudScoreObj = result.get("fraudScore");
+            if (fraudScoreObj != null) {
+                try {
+                    double fraudScore = Double.parseDouble(fraudScoreObj.toString());
+                    if (fraudScore >= 0.8) {
+                        riskLevel = "高风险";
+                    } else if (fraudScore >= 0.5) {
+                        riskLevel = "中风险";
+                    } else if (fraudScore >= 0.2) {
+                        riskLevel = "低风险";
+                    }
+                    
+                    // 保存欺诈评分到数据库
                     try {
-                        double fraudScore = Double.parseDouble(fraudScoreObj.toString());
-                        if (fraudScore >= 0.8) {
-                            riskLevel = "高风险";
-                        } else if (fraudScore >= 0.5) {
-                            riskLevel = "中风险";
-                        } else if (fraudScore >= 0.2) {
-                            riskLevel = "低风险";
-                        }
-                        
-                        // 保存欺诈评分到数据库
-                        try {
-                            doctorFraudScoreRepository.upsertDoctorFraudScore(doctorId, String.valueOf(fraudScore));
-                            logger.info("医生 " + doctorId + " 的欺诈评分已保存到数据库: " + fraudScore);
-                        } catch (Exception e) {
-                            logger.warning("保存医生 " + doctorId + " 的欺诈评分到数据库时出错: " + e.getMessage());
-                        }
-                    } catch (NumberFormatException e) {
-                        logger.warning("无法解析欺诈分数: " + fraudScoreObj);
+                        doctorFraudScoreRepository.upsertDoctorFraudScore(doctorId, String.valueOf(fraudScore));
+                        logger.info("医生 " + doctorId + " 的欺诈评分已保存到数据库: " + fraudScore);
+                    } catch (Exception e) {
+                        logger.warning("保存医生 " + doctorId + " 的欺诈评分到数据库时出错: " + e.getMessage());
                     }
-                }
-                
-                // 更新医生风险等级
-                OutpatientMonitorDTO updated = outpatientMonitorService.updateDoctorRiskLevel(doctorId, riskLevel);
-                if (updated != null) {
-                    logger.info("成功更新医生 " + doctorId + " 的风险等级为 " + riskLevel);
-                } else {
-                    logger.warning("未能更新医生 " + doctorId + " 的风险等级");
+                } catch (NumberFormatException e) {
+                    logger.warning("无法解析欺诈分数: " + fraudScoreObj);
                 }
             }
             
-            logger.info("风险评估结果处理完成，请求ID: " + requestId);
-            return ResponseEntity.ok("结果已接收并处理");
-        } catch (Exception e) {
-            logger.severe("处理风险评估结果时出错: " + e.getMessage());
-            return ResponseEntity.status(500).body("处理结果时出错: " + e.getMessage());
+            // 更新医生风险等级
+            OutpatientMonitorDTO updated = outpatientMonitorService.updateDoctorRiskLevel(doctorId, riskLevel);
+            if (updated != null) {
+                logger.info("成功更新医生 " + doctorId + " 的风险等级为 " + riskLevel);
+            } else {
+                logger.warning("未能更新医生 " + doctorId + " 的风险等级");
+            }
         }
+        
+        logger.info("风险评估结果处理完成，请求ID: " + requestId);
+        return null;
     }
     
     /**